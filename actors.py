@@ -0,0 +1,72 @@
+"""
+Room actors: every change to a room's engine goes through one task that owns it.
+
+Sockets, bots and timers submit commands; the actor applies whatever has queued up in order and then
+flushes once, so a burst of commands costs a single broadcast. The number of client commands a room
+may have waiting is bounded, and each connection is rate limited before it gets here (connections.py).
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+
+import metrics
+
+MAX_PENDING_COMMANDS = 64   # Client commands a room may have queued; more are rejected
+MAX_BATCH = 32              # Commands applied before flushing
+
+logger = logging.getLogger("app_logger")
+
+class RoomActor:
+    """Applies one room's commands in order on a single task and flushes after each batch."""
+    def __init__(self, room_id: str, flush: Callable[[], None], on_error: Callable[[Exception], None]):
+        self.room_id = room_id
+        self.flush = flush       # Publishes the room's state once the batch is applied
+        self.on_error = on_error
+        self.commands: Deque[Tuple[Callable[[], None], bool]] = deque()
+        self.client_commands = 0 # Of the queued commands, how many came from clients
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def submit(self, command: Callable[[], None], from_client: bool = True) -> bool:
+        """
+        Queues a command. Returns False if the room already has too many client commands waiting.
+        Commands from the server itself (timers, bots, joins and leaves) are never dropped.
+        """
+        if from_client:
+            if self.client_commands >= MAX_PENDING_COMMANDS:
+                metrics.COMMANDS_REJECTED.inc(1, "room_queue_full")
+                return False
+            self.client_commands += 1
+        self.commands.append((command, from_client))
+        self.wakeup.set()
+        return True
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            while self.commands:
+                batch = 0
+                while self.commands and batch < MAX_BATCH:
+                    command, from_client = self.commands.popleft()
+                    if from_client:
+                        self.client_commands -= 1
+                    batch += 1
+                    try:
+                        command()
+                    except Exception as e:
+                        self.on_error(e)
+                metrics.COMMAND_BATCH_SIZE.observe(batch)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"Flushing room {self.room_id} failed: {e}", exc_info=True)
+                await asyncio.sleep(0) # Let sockets and other rooms run between batches
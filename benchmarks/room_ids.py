@@ -0,0 +1,90 @@
+"""
+Room ID allocation benchmark.
+
+Fills the code space step by step, from empty to completely full, and at each fill level measures
+the average cost of one allocation with the old allocator (random codes, retried until one is free)
+and with RoomDirectory, freeing a random room after each so the fill level holds. Prints a JSON
+report; the directory's cost stays flat while the retry loop's grows and then starts failing.
+
+    python benchmarks/room_ids.py --length 4 --alphabet 0123456789 --output ids.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+from room_directory import RoomDirectory # noqa: E402
+
+def retry_allocator(length: int, alphabet: str, taken: Set[str], max_attempts: int) -> Callable[[], Optional[str]]:
+    """What generate_room_id() and /room/new used to do, capped so a full space gives up."""
+    def allocate() -> Optional[str]:
+        for _ in range(max_attempts):
+            code = "".join(random.choices(alphabet, k=length))
+            if code not in taken:
+                taken.add(code)
+                return code
+        return None
+    return allocate
+
+def measure(allocate: Callable[[], Optional[str]], release: Callable[[str], None], live: List[str],
+            samples: int) -> Dict[str, float]:
+    """Allocates `samples` rooms at the current fill level, freeing a random live room after each."""
+    failures = 0
+    start = time.perf_counter()
+    for _ in range(samples):
+        code = allocate()
+        if code is None:
+            failures += 1
+            continue
+        victim = live.pop(random.randrange(len(live))) if live else code
+        release(victim)
+        if victim != code:
+            live.append(code)
+    elapsed = time.perf_counter() - start
+    return {"us_per_alloc": round(elapsed / samples * 1e6, 3), "failures": failures}
+
+def run(length: int, alphabet: str, samples: int, levels: List[float], max_attempts: int) -> dict:
+    size = len(alphabet) ** length
+    report = {"code_space": size, "samples_per_level": samples, "levels": []}
+    directory = RoomDirectory(length, alphabet, cooldown=0.0)
+    directory_live: List[str] = []
+    for level in levels:
+        target = min(size, int(size * level))
+        while len(directory_live) < target and (code := directory.allocate()) is not None:
+            directory_live.append(code)
+        # Both allocators start each level from the same set of live rooms
+        retry_taken = set(directory_live)
+        retry = retry_allocator(length, alphabet, retry_taken, max_attempts)
+        retry_live = list(directory_live)
+        row = {"fill": level, "rooms": len(directory_live)}
+        row["retry"] = measure(retry, retry_taken.discard, retry_live, samples)
+        row["directory"] = measure(directory.allocate, directory.release, directory_live, samples)
+        report["levels"].append(row)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark room ID allocation as the code space fills up.")
+    parser.add_argument("--length", type=int, default=4, help="Characters per room code")
+    parser.add_argument("--alphabet", default="0123456789", help="Characters room codes are made of")
+    parser.add_argument("--samples", type=int, default=2000, help="Allocations measured per fill level")
+    parser.add_argument("--levels", default="0,0.5,0.9,0.99,0.999,1.0", help="Comma-separated fill levels")
+    parser.add_argument("--max-attempts", type=int, default=100, help="Retries before the old allocator gives up (it used 100)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args.length, args.alphabet, args.samples, [float(level) for level in args.levels.split(",")],
+                 args.max_attempts)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
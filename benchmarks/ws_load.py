@@ -0,0 +1,346 @@
+"""
+WebSocket load generator and latency benchmark.
+
+Starts `main:app` under uvicorn (or targets --url), then drives many synthetic rooms through the
+real /room/new and /ws/{room_id}/{player_name} flow: players join, bet, play tiles, spectators
+watch and players drop and reconnect. Prints a JSON report with action-to-broadcast latency
+percentiles, message/byte rates, and server CPU and RSS per room, for comparing commits.
+
+    python benchmarks/ws_load.py --rooms 500 --players 4 --spectators 2 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import websockets
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import wire # noqa: E402 (decodes binary frames)
+
+# --- Helpers ---
+
+def apply_ops(state, ops):
+    """Same semantics as applyStateOps() in frontend/app.js."""
+    for op, path, *value in ops:
+        if not path:
+            if op == "set":
+                state = value[0]
+            continue
+        parent = state
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if op == "set":
+            parent[key] = value[0]
+        elif op == "del":
+            del parent[key]
+        elif op == "trim":
+            del parent[key][:value[0]]
+        elif op == "push":
+            parent[key].extend(value[0])
+    return state
+
+async def http_post(base_url: str, path: str) -> dict:
+    url = urlparse(base_url)
+    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: {url.netloc}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return round(sorted_values[index], 3)
+
+def read_process_stats(pid: int) -> Dict[str, float]:
+    """CPU seconds and RSS of a process, from /proc (Linux only; empty elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        with open(f"/proc/{pid}/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        return {"cpu_seconds": (int(fields[11]) + int(fields[12])) / ticks, "rss_kb": rss_kb}
+    except (OSError, StopIteration, IndexError):
+        return {}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# --- Synthetic Clients ---
+
+class Stats:
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.spectator_latencies_ms: List[float] = [] # Includes the spectator rate cap
+        self.messages = 0
+        self.bytes = 0
+        self.actions = 0
+        self.reconnects = 0
+        self.completed = 0 # Rooms every player saw to the end
+        self.timed_out: List[str] = [] # Rooms still unfinished at the deadline
+        self.errors: List[str] = []
+
+class Client:
+    """One scripted player or spectator. Keeps a local copy of the state like the browser does."""
+    def __init__(self, ws_url: str, room_id: str, name: str, room: "Room", stats: Stats, plays: bool,
+                 wire: str = "json"):
+        self.ws_url = ws_url
+        self.wire = wire
+        self.room_id = room_id
+        self.name = name
+        self.room = room
+        self.stats = stats
+        self.plays = plays
+        self.state: dict = {}
+        self.private: dict = {"hand": [], "validPlays": []}
+        self.seq = 0
+        self.epoch = ""
+        self.acted_at_seq = -1
+        self.measured_action = 0
+        self.socket = None
+
+    async def connect(self, resume: bool = False):
+        query = f"?since={self.seq}&epoch={self.epoch}" if resume and self.seq else ""
+        for attempt in range(5):
+            try:
+                self.socket = await websockets.connect(f"{self.ws_url}/ws/{self.room_id}/{self.name}{query}",
+                                                       max_size=None, subprotocols=[f"dongdong.{self.wire}"])
+                return
+            except Exception:
+                await asyncio.sleep(0.2 * (attempt + 1)) # e.g. the server hasn't seen our last disconnect yet
+        raise ConnectionError(f"{self.name} could not connect to room {self.room_id}")
+
+    async def send(self, action: str, payload: Optional[dict] = None):
+        self.room.action_id += 1
+        self.room.action = (self.room.action_id, time.perf_counter(), self.seq)
+        self.stats.actions += 1
+        await self.socket.send(json.dumps({"action": action, "payload": payload or {}}))
+
+    def on_message(self, raw):
+        self.stats.messages += 1
+        self.stats.bytes += len(raw)
+        message = wire.unpack_message(raw) if isinstance(raw, bytes) else json.loads(raw)
+        kind = message.get("type")
+        if kind == "game_state":
+            self.state, self.seq, self.epoch = message["payload"], message["seq"], message["epoch"]
+        elif kind == "state_delta":
+            if message["seq"] <= self.seq:
+                return
+            if message["seq"] != self.seq + 1:
+                asyncio.create_task(self.socket.send(json.dumps({"action": "sync", "payload": {"since": self.seq, "epoch": self.epoch}})))
+                return
+            self.state = apply_ops(self.state, message["ops"])
+            self.seq = message["seq"]
+        elif kind == "private_state":
+            self.private = message["payload"]
+            return
+        else:
+            return
+        # Latency: from an action being sent to each client seeing the first version after it
+        action = self.room.action
+        if action and action[0] != self.measured_action and self.seq > action[2]:
+            self.measured_action = action[0]
+            latencies = self.stats.latencies_ms if self.plays else self.stats.spectator_latencies_ms
+            latencies.append((time.perf_counter() - action[1]) * 1000)
+
+    async def maybe_act(self):
+        state = self.state
+        if not self.plays or state.get("turnPlayerName") != self.name or self.acted_at_seq == self.seq:
+            return
+        if state["gameState"] == "AWAITING_BETS":
+            self.acted_at_seq = self.seq
+            await self.send("place_bet", {"amount": 1 if state["bettingInfo"]["forbiddenBet"] == 0 else 0})
+        elif state["gameState"] == "AWAITING_PLAY" and self.private["validPlays"]:
+            self.acted_at_seq = self.seq
+            await self.send("play_tile", {"tile": self.private["validPlays"][0]})
+
+    def finished(self, rounds: int) -> bool:
+        return self.state.get("gameState") == "GAME_OVER" or self.state.get("currentRound", 0) > rounds
+
+    async def run(self, rounds: int, reconnect_rate: float, deadline: float) -> bool:
+        """Plays or watches until the game is finished or the deadline passes. Returns whether it finished."""
+        if self.socket is None:
+            await self.connect()
+        while time.time() < deadline:
+            try:
+                raw = await asyncio.wait_for(self.socket.recv(), timeout=2.0)
+            except asyncio.TimeoutError:
+                self.acted_at_seq = -1 # Our last action may have been rejected without a broadcast; retry
+                await self.maybe_act()
+                continue
+            except websockets.ConnectionClosed:
+                await self.connect(resume=True)
+                continue
+            self.on_message(raw)
+            if self.finished(rounds):
+                break
+            if self.plays and random.random() < reconnect_rate:
+                self.stats.reconnects += 1
+                await self.socket.close()
+                await asyncio.sleep(0.05)
+                await self.connect(resume=True)
+                continue
+            await self.maybe_act()
+        await self.socket.close()
+        return self.finished(rounds)
+
+class Room:
+    def __init__(self):
+        self.action_id = 0
+        self.action: Optional[tuple] = None # (id, sent at, seq the sender had seen)
+
+async def run_room(base_url: str, ws_url: str, args, stats: Stats, index: int):
+    created = await http_post(base_url, "/room/new")
+    room_id = created["room_id"]
+    room = Room()
+    players = [Client(ws_url, room_id, f"p{index}_{i}", room, stats, plays=True, wire=args.wire)
+               for i in range(args.players)]
+    deadline = time.time() + args.timeout
+
+    for player in players:
+        await player.connect()
+    await asyncio.sleep(0.1)
+    await players[0].send("start_game")
+
+    spectators = [Client(ws_url, room_id, f"s{index}_{i}", room, stats, plays=False, wire=args.wire)
+                  for i in range(args.spectators)]
+    results = await asyncio.gather(*(p.run(args.rounds, args.reconnect_rate, deadline) for p in players),
+                                   *(s.run(args.rounds, 0.0, deadline) for s in spectators))
+    if all(results[:len(players)]):
+        stats.completed += 1
+    else:
+        round_reached = max(p.state.get("currentRound", 0) for p in players)
+        stats.timed_out.append(f"room {index} ({room_id}): round {round_reached} after {args.timeout:.0f}s")
+
+# --- Driver ---
+
+async def drive(base_url: str, ws_url: str, args, stats: Stats):
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def guarded(i: int):
+        async with semaphore:
+            try:
+                await run_room(base_url, ws_url, args, stats, i)
+            except Exception as e:
+                stats.errors.append(f"room {i}: {e!r}")
+
+    await asyncio.gather(*(guarded(i) for i in range(args.rooms)))
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the Dong Dong WebSocket server.")
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--players", type=int, default=4, choices=[2, 3, 4])
+    parser.add_argument("--spectators", type=int, default=1, help="Spectators per room")
+    parser.add_argument("--rounds", type=int, default=1, help="Rounds to play per room (each transition waits 5s)")
+    parser.add_argument("--reconnect-rate", type=float, default=0.01, help="Chance a player reconnects after a message")
+    parser.add_argument("--concurrency", type=int, default=1000, help="Rooms running at once")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds before a room gives up")
+    parser.add_argument("--wire", default="json", choices=["json", "msgpack"], help="Wire format clients ask for")
+    parser.add_argument("--url", help="Benchmark an already-running server instead of starting one")
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the spawned server (repeatable)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        bench_dir = os.path.join(REPO_ROOT, "Data", "bench") # Ignored by git, unlike the default Logs/
+        env = {**os.environ, "DONGDONG_DATA_DIR": bench_dir, "DONGDONG_LOGS_DIR": os.path.join(bench_dir, "Logs")}
+        env.update(kv.split("=", 1) for kv in args.server_env)
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=REPO_ROOT, env=env)
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+    ws_url = base_url.replace("http", "ws", 1)
+
+    stats = Stats()
+    before = read_process_stats(server.pid) if server else {}
+    start = time.perf_counter()
+    try:
+        asyncio.run(drive(base_url, ws_url, args, stats))
+    finally:
+        elapsed = time.perf_counter() - start
+        after = read_process_stats(server.pid) if server else {}
+        if server:
+            server.terminate()
+            server.wait()
+
+    latencies = sorted(stats.latencies_ms)
+    spectator_latencies = sorted(stats.spectator_latencies_ms)
+    report = {
+        "commit": git_revision(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output",)},
+        "duration_seconds": round(elapsed, 3),
+        "rooms": args.rooms,
+        "actions": stats.actions,
+        "reconnects": stats.reconnects,
+        "completed": stats.completed,
+        "timed_out": len(stats.timed_out),
+        "first_timed_out": stats.timed_out[:5],
+        "errors": len(stats.errors),
+        "first_errors": stats.errors[:5],
+        "latency_ms": {
+            "count": len(latencies),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+        "spectator_latency_ms": {
+            "count": len(spectator_latencies),
+            "p50": percentile(spectator_latencies, 50),
+            "p95": percentile(spectator_latencies, 95),
+        },
+        "messages_per_second": round(stats.messages / elapsed, 1),
+        "bytes_per_second": round(stats.bytes / elapsed, 1),
+    }
+    if before and after:
+        cpu = after["cpu_seconds"] - before["cpu_seconds"]
+        report["server"] = {
+            "cpu_seconds": round(cpu, 3),
+            "cpu_ms_per_room": round(cpu * 1000 / args.rooms, 3),
+            "cpu_utilization": round(cpu / elapsed, 3),
+            "rss_kb": after["rss_kb"],
+            "rss_kb_per_room": round((after["rss_kb"] - before["rss_kb"]) / args.rooms, 1),
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Compact tile representation: a tile is an int 0-51 and a set of tiles (hand, stack) is a 52-bit mask.
+
+    tile_id = color_index * 13 + (number - 1)
+
+Colors are indexed alphabetically by name, so iterating a mask from the low bit up yields tiles in
+the same (color, number) order the frontend has always received hands in.
+"""
+from functools import lru_cache
+from typing import Iterator, Optional, Sequence, Tuple
+
+COLOR_NAMES: Tuple[str, ...] = ("Black", "Blue", "Orange", "Red")
+NUMBERS_PER_COLOR = 13
+NUM_TILES = len(COLOR_NAMES) * NUMBERS_PER_COLOR
+FULL_DECK = (1 << NUM_TILES) - 1
+COLOR_MASKS: Tuple[int, ...] = tuple(((1 << NUMBERS_PER_COLOR) - 1) << (NUMBERS_PER_COLOR * i)
+                                     for i in range(len(COLOR_NAMES)))
+
+def tile_id(number: int, color_index: int) -> int:
+    return color_index * NUMBERS_PER_COLOR + (number - 1)
+
+def tile_number(tid: int) -> int:
+    return tid % NUMBERS_PER_COLOR + 1
+
+def tile_color(tid: int) -> int:
+    return tid // NUMBERS_PER_COLOR
+
+def mask_of(tids: Sequence[int]) -> int:
+    mask = 0
+    for tid in tids:
+        mask |= 1 << tid
+    return mask
+
+def iter_ids(mask: int) -> Iterator[int]:
+    """Yields the tile ids in a mask, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def count(mask: int) -> int:
+    return bin(mask).count("1")
+
+def highest(mask: int) -> int:
+    """Id of the highest tile in a non-empty mask (within one color, the highest number)."""
+    return mask.bit_length() - 1
+
+def valid_play_mask(hand: int, lead_color: Optional[int]) -> int:
+    """Tiles a player may play: must follow the lead color if they hold any, otherwise anything."""
+    if lead_color is None:
+        return hand
+    follow = hand & COLOR_MASKS[lead_color]
+    return follow or hand
+
+def stack_winner(plays: Sequence[int], master_color: int, lead_color: int, leader: int) -> int:
+    """
+    Index into `plays` (tile ids in seat order) of the winning tile: the highest master-color tile,
+    else the highest lead-color tile, else the stack leader's tile.
+    """
+    played = mask_of(plays)
+    for color in (master_color, lead_color):
+        in_color = played & COLOR_MASKS[color]
+        if in_color:
+            return plays.index(highest(in_color))
+    return leader
+
+@lru_cache(maxsize=8192)
+def tile_dicts(mask: int) -> Tuple[dict, ...]:
+    """JSON shape of a set of tiles, cached per mask so unchanged hands cost nothing to re-serialize."""
+    return tuple({"number": tile_number(t), "color": COLOR_NAMES[tile_color(t)]} for t in iter_ids(mask))
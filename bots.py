@@ -0,0 +1,283 @@
+"""
+Bot players: fill empty seats or take over disconnected ones.
+
+Decisions use determinized Monte Carlo: the unseen tiles are dealt out at random to the other
+players many times and the rest of the round is rolled out for each candidate bet or tile. Rollouts
+run in a process pool with a per-decision time budget, so they never block the event loop.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import bitboard
+from dong_dong_engine import COLOR_INDEX, DongDongEngine, GameState, Player, TILES
+
+DECISION_BUDGET = float(os.environ.get("DONGDONG_BOT_BUDGET", "0.5"))   # Seconds of rollouts per decision
+TAKEOVER_DELAY = float(os.environ.get("DONGDONG_BOT_TAKEOVER", "15"))   # Grace period for a disconnected player
+BOT_MOVE_DELAY = 1.0                                                    # Pause before a bot seat acts, for the UI
+POOL_WORKERS = int(os.environ.get("DONGDONG_BOT_WORKERS", "1"))
+MAX_BOTS_PER_ROOM = 3
+
+logger = logging.getLogger("app_logger")
+
+# --- Decision Requests (picklable, evaluated in the pool) ---
+
+@dataclass
+class Decision:
+    kind: str                   # "bet" or "play"
+    seat: int                   # The bot's index in engine.players
+    num_players: int
+    round: int
+    hand: int                   # The bot's hand mask
+    hand_sizes: List[int]       # Tiles left per seat
+    unseen: int                 # Tiles that could be in another player's hand
+    master: int
+    lead: Optional[int]
+    stack: List[Tuple[int, int]] # (seat, tile id) already played in the current stack
+    leader: int
+    bets: List[int]             # -1 for players who have not bet yet
+    stacks_won: List[int]
+    forbidden_bet: int          # -1 if every bet is allowed
+    budget: float
+
+def _score(bet: int, won: int) -> int:
+    return 10 + bet ** 2 if bet == won else -((bet - won) ** 2)
+
+def _strength(tid: int, master: int) -> int:
+    return bitboard.tile_number(tid) + (20 if bitboard.tile_color(tid) == master else 0)
+
+def _deal_unseen(d: Decision, rng: random.Random) -> List[int]:
+    """One determinization: the unseen tiles dealt at random to the other seats."""
+    pool = list(bitboard.iter_ids(d.unseen))
+    rng.shuffle(pool)
+    hands = []
+    for seat, size in enumerate(d.hand_sizes):
+        if seat == d.seat:
+            hands.append(d.hand)
+        else:
+            hands.append(bitboard.mask_of(pool[:size]))
+            del pool[:size]
+    return hands
+
+def _play_out(d: Decision, hands: List[int], stack: List[Tuple[int, int]], lead: Optional[int],
+              bets: Optional[List[int]], rng: random.Random) -> List[int]:
+    """
+    Finishes the round from the given position. Rollout policy: play strong while still short of
+    your bet, weak once you have it (random when bets are unknown). Returns stacks won per seat.
+    """
+    won = list(d.stacks_won)
+    stack = list(stack)
+    turn = (stack[-1][0] + 1) % d.num_players if stack else d.leader
+    while stack or any(hands):
+        legal = list(bitboard.iter_ids(bitboard.valid_play_mask(hands[turn], lead)))
+        if bets is None:
+            tid = rng.choice(legal)
+        elif won[turn] < bets[turn]:
+            tid = max(legal, key=lambda t: _strength(t, d.master))
+        else:
+            tid = min(legal, key=lambda t: _strength(t, d.master))
+        hands[turn] ^= 1 << tid
+        if not stack:
+            lead = bitboard.tile_color(tid)
+        stack.append((turn, tid))
+        if len(stack) == d.num_players:
+            winner = stack[bitboard.stack_winner([t for _, t in stack], d.master, lead, 0)][0]
+            won[winner] += 1
+            turn, stack, lead = winner, [], None
+        else:
+            turn = (turn + 1) % d.num_players
+    return won
+
+def decide(d: Decision) -> Tuple[int, int]:
+    """Runs rollouts until the budget is spent. Returns (bet or tile id, rollouts run)."""
+    rng = random.Random()
+    deadline = time.perf_counter() + d.budget
+    rollouts = 0
+
+    if d.kind == "bet":
+        win_counts = [0] * (d.round + 1)
+        while rollouts < 20 or time.perf_counter() < deadline:
+            won = _play_out(d, _deal_unseen(d, rng), [], None, None, rng)
+            win_counts[won[d.seat]] += 1
+            rollouts += 1
+            if rollouts >= 20000:
+                break
+        candidates = [b for b in range(d.round + 1) if b != d.forbidden_bet]
+        best = max(candidates, key=lambda b: sum(n * _score(b, w) for w, n in enumerate(win_counts)))
+        return best, rollouts
+
+    candidates = list(bitboard.iter_ids(bitboard.valid_play_mask(d.hand, d.lead)))
+    if len(candidates) == 1:
+        return candidates[0], 0
+    totals = {t: 0 for t in candidates}
+    counts = {t: 0 for t in candidates}
+    while rollouts < 10 * len(candidates) or time.perf_counter() < deadline:
+        tid = candidates[rollouts % len(candidates)]
+        hands = _deal_unseen(d, rng)
+        hands[d.seat] ^= 1 << tid
+        lead = bitboard.tile_color(tid) if not d.stack else d.lead
+        won = _play_out(d, hands, d.stack + [(d.seat, tid)], lead, d.bets, rng)
+        totals[tid] += _score(d.bets[d.seat], won[d.seat])
+        counts[tid] += 1
+        rollouts += 1
+        if rollouts >= 20000:
+            break
+    return max(candidates, key=lambda t: totals[t] / max(counts[t], 1)), rollouts
+
+def build_decision(engine: DongDongEngine, player: Player, budget: float = DECISION_BUDGET) -> Decision:
+    seat = engine.players.index(player)
+    n = len(engine.players)
+    # Unplaced bets read as 0 in the engine; only seats that have actually bet are known
+    bet_seats = {(engine.color_master_player_index + k) % n for k in range(engine.bets_made)} \
+        if engine.game_state == GameState.AWAITING_BETS else set(range(n))
+    is_last_bettor = engine.bets_made == len(engine.players) - 1
+    stack = [(next(i for i, p in enumerate(engine.players) if p.name == name), tile.id)
+             for name, tile in engine.current_stack_plays.items()]
+    return Decision(
+        kind="bet" if engine.game_state == GameState.AWAITING_BETS else "play",
+        seat=seat,
+        num_players=len(engine.players),
+        round=engine.current_round,
+        hand=player.hand.mask,
+        hand_sizes=[len(p.hand) for p in engine.players],
+        unseen=bitboard.FULL_DECK & ~player.hand.mask & ~engine.round_played_mask,
+        master=COLOR_INDEX[engine.master_color],
+        lead=COLOR_INDEX[engine.secondary_color] if engine.secondary_color else None,
+        stack=stack,
+        leader=engine.stack_leader_index,
+        bets=[p.bet if i in bet_seats else -1 for i, p in enumerate(engine.players)],
+        stacks_won=[p.stacks_won for p in engine.players],
+        forbidden_bet=engine.current_round - sum(p.bet for p in engine.players) if is_last_bettor else -1,
+        budget=budget,
+    )
+
+# --- Fallbacks ---
+
+def fallback_bet(engine: DongDongEngine) -> int:
+    """The minimum legal bet for the current bettor."""
+    is_last_bettor = engine.bets_made == len(engine.players) - 1
+    forbidden = engine.current_round - sum(p.bet for p in engine.players) if is_last_bettor else -1
+    return 1 if forbidden == 0 else 0
+
+def fallback_play(engine: DongDongEngine, player: Player) -> dict:
+    """The lowest valid tile for the player."""
+    valid = engine.get_valid_plays_for_player(player)
+    return min(valid, key=lambda t: (t.number, t.color.value)).to_dict()
+
+# --- Bot Manager ---
+
+class BotManager:
+    """Decides when a seat is bot-controlled and runs its decisions off the event loop."""
+    def __init__(self, apply_action: Callable[[str, str, str, dict], None]):
+        self.apply_action = apply_action # (room_id, player_name, action, payload), as if sent by that player
+        self.bot_names: Dict[str, Set[str]] = {}
+        self.pending: Set[Tuple[str, tuple]] = set()
+        self.pool: Optional[Executor] = None # Started on the first decision
+        self.started_at = time.monotonic()
+        self.stats = {"decisions": 0, "rollouts": 0, "decision_seconds": 0.0, "timeouts": 0, "takeovers": 0}
+
+    def add_bot(self, room_id: str, engine: DongDongEngine) -> Optional[str]:
+        """Fills an empty lobby seat with a bot. Returns its name, or None if there is no room for one."""
+        bots = self.bot_names.setdefault(room_id, set())
+        if engine.game_state != GameState.LOBBY or len(engine.players) >= 4 or len(bots) >= MAX_BOTS_PER_ROOM:
+            return None
+        name = next(f"Bot {i}" for i in range(1, 5) if not any(p.name == f"Bot {i}" for p in engine.players))
+        engine.add_player(name)
+        bots.add(name)
+        return name
+
+    def forget_room(self, room_id: str):
+        self.bot_names.pop(room_id, None)
+
+    def is_bot(self, room_id: str, name: str) -> bool:
+        return name in self.bot_names.get(room_id, ())
+
+    def bot_seats(self, room_id: str) -> List[str]:
+        return sorted(self.bot_names.get(room_id, ()))
+
+    def _humans_present(self, room_id: str, engine: DongDongEngine) -> bool:
+        """Bots only play while someone is watching their own seat; an abandoned game must not play itself out."""
+        return any(not p.disconnected and not self.is_bot(room_id, p.name) for p in engine.players)
+
+    def _turn_key(self, engine: DongDongEngine) -> tuple:
+        return (engine.game_state, engine.current_round, engine.turn_player_index, engine.bets_made,
+                len(engine.current_stack_plays), engine.round_played_mask)
+
+    def on_state_change(self, room_id: str, engine: DongDongEngine):
+        """Called after every state change; schedules a decision if a bot-controlled seat is to act."""
+        if engine.game_state not in (GameState.AWAITING_BETS, GameState.AWAITING_PLAY):
+            return
+        player = engine.get_current_turn_player()
+        if not player or not (player.disconnected or self.is_bot(room_id, player.name)):
+            return
+        if not self._humans_present(room_id, engine):
+            return
+        key = (room_id, self._turn_key(engine))
+        if key in self.pending:
+            return
+        self.pending.add(key)
+        asyncio.create_task(self._act(room_id, engine, player, key))
+
+    async def _act(self, room_id: str, engine: DongDongEngine, player: Player, key: tuple):
+        try:
+            is_takeover = not self.is_bot(room_id, player.name)
+            await asyncio.sleep(TAKEOVER_DELAY if is_takeover else BOT_MOVE_DELAY)
+            if self._turn_key(engine) != key[1] or (is_takeover and not player.disconnected):
+                return # Someone moved, or the player came back
+            if not self._humans_present(room_id, engine):
+                return # Everyone left during the delay
+
+            decision = build_decision(engine, player)
+            choice = await self._decide(decision)
+            if self._turn_key(engine) != key[1]:
+                return
+            if is_takeover:
+                self.stats["takeovers"] += 1
+            if decision.kind == "bet":
+                bet = choice if choice is not None else fallback_bet(engine)
+                self.apply_action(room_id, player.name, "place_bet", {"amount": bet})
+            else:
+                tile = TILES[choice].to_dict() if choice is not None else fallback_play(engine, player)
+                self.apply_action(room_id, player.name, "play_tile", {"tile": tile})
+        except Exception as e:
+            logger.error(f"Bot move failed in room {room_id}: {e}", exc_info=True)
+        finally:
+            self.pending.discard(key)
+
+    async def _decide(self, decision: Decision) -> Optional[int]:
+        if self.pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+        start = time.perf_counter()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self.pool, decide, decision)
+            choice, rollouts = await asyncio.wait_for(future, decision.budget + 2.0)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            return None
+        self.stats["decisions"] += 1
+        self.stats["rollouts"] += rollouts
+        self.stats["decision_seconds"] += time.perf_counter() - start
+        return choice
+
+    def report(self) -> dict:
+        uptime = time.monotonic() - self.started_at
+        decisions = self.stats["decisions"]
+        busy = self.stats["decision_seconds"]
+        return {
+            **{k: round(v, 3) if isinstance(v, float) else v for k, v in self.stats.items()},
+            "uptime_seconds": round(uptime, 1),
+            "decisions_per_second": round(decisions / uptime, 3) if uptime else 0.0,
+            "rollouts_per_second": round(self.stats["rollouts"] / busy, 1) if busy else 0.0,
+            "mean_decision_seconds": round(busy / decisions, 3) if decisions else 0.0,
+            "active_bot_seats": sum(len(bots) for bots in self.bot_names.values()),
+        }
+
+    def shutdown(self):
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from fastapi import WebSocket
+
+import metrics
+import wire
+from state_sync import encode_message
+
+# --- Config ---
+
+MAX_QUEUED_FRAMES = 32   # Outbound frames buffered per socket before coalescing kicks in
+MAX_OVERFLOWS = 3        # Times a socket may overflow without catching up before it is dropped
+SEND_TIMEOUT = 10.0      # Seconds a single send may take before the socket is considered dead
+RATE = float(os.environ.get("DONGDONG_RATE", "10"))    # Messages per second a client may send, sustained
+BURST = float(os.environ.get("DONGDONG_BURST", "20"))  # ...and in a burst
+
+_RESYNC = object()
+"""Queue marker: replaced at write time by a snapshot of the latest state (latest-state-wins)."""
+
+logger = logging.getLogger("app_logger")
+
+class TokenBucket:
+    """Allows `rate` events per second on average, with bursts of up to `burst`."""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float = RATE, burst: float = BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+class ClientConnection:
+    """
+    One WebSocket with its own bounded outbound queue and writer task.
+    Broadcasting only enqueues, so a slow client never stalls the room or its own receive loop.
+    """
+    def __init__(self, websocket: WebSocket, room_id: str, viewer: str, resync: Callable[[], List[str]]):
+        self.websocket = websocket
+        self.room_id = room_id
+        self.viewer = viewer
+        self.resync = resync # Returns the frames that bring this client to the latest version
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_FRAMES)
+        self.overflows = 0
+        self.closed = False
+        self.limiter = TokenBucket() # Inbound messages
+        self.awaiting_catch_up = True # Broadcasts skip the socket until its first catch-up is queued
+        self.joined = False # Set once the room has accepted the player or spectator
+        self.binary = wire.negotiate(websocket) == wire.MSGPACK # Frames are queued as JSON and converted on send
+        self.writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: str):
+        if self.closed:
+            return
+        if self.queue.full():
+            self.overflows += 1
+            if self.overflows > MAX_OVERFLOWS:
+                logger.info(f"Dropping slow client {self.viewer} in room {self.room_id}")
+                self.close(code=4002, reason="Client too slow")
+                return
+            # Everything queued is stale; the writer sends a fresh snapshot instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_RESYNC)
+            return
+        metrics.SEND_QUEUE_DEPTH.observe(self.queue.qsize())
+        self.queue.put_nowait(frame)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                item = await self.queue.get()
+                frames = self.resync() if item is _RESYNC else [item]
+                for frame in frames:
+                    if self.binary:
+                        frame = wire.to_binary(frame)
+                        await asyncio.wait_for(self.websocket.send_bytes(frame), SEND_TIMEOUT)
+                    else:
+                        await asyncio.wait_for(self.websocket.send_text(frame), SEND_TIMEOUT)
+                    metrics.MESSAGES.inc(1, "out")
+                    metrics.MESSAGE_BYTES.inc(len(frame), "out")
+                if self.queue.empty():
+                    self.overflows = 0 # Caught up
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Close the socket too, so the receive loop ends and the player leaves the room
+            logger.info(f"Send to {self.viewer} in room {self.room_id} failed: {e!r}")
+            self.writer = None # Ending on its own; nothing to cancel
+            self.close(code=1011, reason="Send failed")
+
+    def close(self, code: int = 1000, reason: str = ""):
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer:
+            self.writer.cancel()
+        asyncio.create_task(self._close_socket(code, reason))
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), SEND_TIMEOUT)
+        except Exception:
+            pass # Already gone
+
+class ConnectionManager:
+    """Manages active WebSocket connections for each game room."""
+    def __init__(self):
+        self.active_connections: Dict[str, List[ClientConnection]] = {}
+
+    async def connect(self, websocket: WebSocket, room_id: str, viewer: str,
+                      resync: Callable[[], List[str]]) -> ClientConnection:
+        await websocket.accept(subprotocol=wire.negotiate(websocket))
+        connection = ClientConnection(websocket, room_id, viewer, resync)
+        connection.start()
+        if room_id not in self.active_connections:
+            self.active_connections[room_id] = []
+        self.active_connections[room_id].append(connection)
+        return connection
+
+    def detach(self, connection: ClientConnection):
+        """Stops room broadcasts to the socket without closing it (spectators move to the spectator feed)."""
+        connections = self.active_connections.get(connection.room_id)
+        if connections and connection in connections:
+            connections.remove(connection)
+            if not connections:
+                del self.active_connections[connection.room_id]
+
+    def disconnect(self, connection: ClientConnection):
+        self.detach(connection)
+        if connection.writer:
+            connection.writer.cancel()
+        connection.closed = True
+
+    def count(self, room_id: str) -> int:
+        return len(self.active_connections.get(room_id, ()))
+
+    def total(self) -> int:
+        return sum(len(connections) for connections in self.active_connections.values())
+
+    def broadcast(self, room_id: str, message: dict):
+        frame = encode_message(message)
+        for connection in self.active_connections.get(room_id, []):
+            connection.enqueue(frame)
+
+    def broadcast_frames(self, room_id: str, public_frame: Optional[str], private_frames: Dict[str, str]):
+        """Queues pre-encoded frames: the shared public frame to everyone, private frames only to their owner."""
+        for connection in self.active_connections.get(room_id, []):
+            if connection.awaiting_catch_up:
+                continue
+            if public_frame is not None:
+                connection.enqueue(public_frame)
+            private_frame = private_frames.get(connection.viewer)
+            if private_frame is not None:
+                connection.enqueue(private_frame)
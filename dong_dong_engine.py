@@ -1,9 +1,17 @@
 import random
+import functools
+import itertools
+import time
+from collections import deque
 from enum import Enum
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Sequence, Tuple
 from logging import Logger
 
+import bitboard
+import metrics
+from records import GameHistory
+
 # --- Data Structures ---
 
 class Color(Enum):
@@ -12,6 +20,9 @@ class Color(Enum):
     BLUE = "Blue"
     ORANGE = "Orange"
 
+COLOR_INDEX: Dict[Color, int] = {Color(name): i for i, name in enumerate(bitboard.COLOR_NAMES)}
+COLORS_BY_INDEX: List[Color] = [Color(name) for name in bitboard.COLOR_NAMES]
+
 @dataclass(frozen=True, order=True)
 class Tile:
     number: int
@@ -19,10 +30,63 @@ class Tile:
     def __str__(self): return f"[{self.color.value} {self.number}]"
     def to_dict(self): return {"number": self.number, "color": self.color.value}
 
+    @property
+    def id(self) -> int:
+        """Compact 0-51 representation, see bitboard.py."""
+        return bitboard.tile_id(self.number, COLOR_INDEX[self.color])
+
+    @staticmethod
+    def from_id(tid: int) -> "Tile":
+        return TILES[tid]
+
+TILES: List[Tile] = [Tile(bitboard.tile_number(t), COLORS_BY_INDEX[bitboard.tile_color(t)]) for t in range(bitboard.NUM_TILES)]
+"""Every tile, indexed by id. Tiles are interned so the engine never allocates new ones."""
+
+class Hand:
+    """
+    A set of tiles stored as a 52-bit mask. Supports the list operations the engine has always
+    used on hands (append, remove, `in`, iteration, len) in O(1), iterating in display order.
+    """
+    __slots__ = ("mask",)
+
+    def __init__(self, tiles=(), mask: int = 0):
+        self.mask = mask
+        for tile in tiles:
+            self.append(tile)
+
+    def append(self, tile: Tile):
+        self.mask |= 1 << tile.id
+
+    def remove(self, tile: Tile):
+        bit = 1 << tile.id
+        if not self.mask & bit:
+            raise ValueError(f"{tile} not in hand")
+        self.mask ^= bit
+
+    def __contains__(self, tile) -> bool:
+        return isinstance(tile, Tile) and bool(self.mask >> tile.id & 1)
+
+    def __iter__(self):
+        return (TILES[t] for t in bitboard.iter_ids(self.mask))
+
+    def __len__(self) -> int:
+        return bitboard.count(self.mask)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Hand):
+            return self.mask == other.mask
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"Hand({list(self)!r})"
+
+    def to_dicts(self) -> List[dict]:
+        return list(bitboard.tile_dicts(self.mask))
+
 @dataclass
 class Player:
     name: str
-    hand: List[Tile] = field(default_factory=list)
+    hand: Hand = field(default_factory=Hand)
     score: int = 0
     bet: int = 0
     stacks_won: int = 0
@@ -31,7 +95,7 @@ class Player:
     def to_dict(self):
         return {
             "name": self.name,
-            "hand": sorted([t.to_dict() for t in self.hand], key=lambda x: (x['color'], x['number'])),
+            "hand": self.hand.to_dicts(), # Already in (color, number) order
             "score": self.score,
             "bet": self.bet,
             "stacks_won": self.stacks_won,
@@ -39,12 +103,70 @@ class Player:
         }
     
     def reset_for_round(self):
-        self.hand = []
+        self.hand = Hand()
         self.bet = 0
         self.stacks_won = 0
 
+EVENT_LOG_CAPACITY = 500 # Entries a room keeps for history paging
+EVENT_LOG_TAIL = 20      # Newest entries carried in every game state
+
+class EventLog:
+    """
+    Fixed-capacity ring buffer of log lines. Every entry gets a per-room id that never repeats, so
+    clients can tell which entries they already have and page back through older ones.
+    """
+    def __init__(self, entries=(), next_id: int = 1, capacity: int = EVENT_LOG_CAPACITY):
+        self.entries: deque = deque(entries, maxlen=capacity)
+        self.next_id = next_id
+
+    @property
+    def first_id(self) -> int:
+        return self.next_id - len(self.entries)
+
+    def append(self, text: str) -> int:
+        self.entries.append(text) # The oldest entry falls off in O(1) once full
+        self.next_id += 1
+        return self.next_id - 1
+
+    def tail(self, count: int = EVENT_LOG_TAIL) -> List[str]:
+        return list(itertools.islice(self.entries, max(0, len(self.entries) - count), None))
+
+    def page(self, before: int, limit: int) -> Tuple[int, List[str]]:
+        """Up to `limit` entries older than id `before`. Returns (id of the first one, texts)."""
+        end = max(0, min(before, self.next_id) - self.first_id)
+        start = max(0, end - limit)
+        return self.first_id + start, list(itertools.islice(self.entries, start, end))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
 # --- Game State and Engine ---
 
+def journaled(method):
+    """
+    Marks an engine action as a journal event. Only the outermost call is recorded (actions that
+    call other actions replay them implicitly), so replaying the journal reproduces the exact state.
+    """
+    timing = metrics.ENGINE_ACTION_SECONDS.labels(method.__name__)
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        outermost = not self._action_depth
+        if outermost:
+            if self.recorder:
+                self.recorder(method.__name__, list(args))
+            start = time.perf_counter()
+        self._action_depth += 1
+        try:
+            return method(self, *args)
+        finally:
+            self._action_depth -= 1
+            if outermost:
+                timing.observe(time.perf_counter() - start)
+    return wrapper
+
 class GameState(Enum):
     LOBBY = "LOBBY"
     ROUND_STARTING = "ROUND_STARTING"
@@ -55,17 +177,21 @@ class GameState(Enum):
     GAME_OVER = "GAME_OVER"
 
 class DongDongEngine:
-    def __init__(self, logger: Optional[Logger] = None):
+    def __init__(self, logger: Optional[Logger] = None, seed: Optional[int] = None):
         self.players: List[Player] = []
         self.original_players: List[str] = []
-        self.spectators: List[str] = []
+        self.spectator_count: int = 0 # Watchers are counted, not listed: a featured game can have hundreds
         self.logger = logger
+        self.rng = random.Random(seed) # Own RNG so shuffles can be snapshotted and replayed
+        self.recorder: Optional[Callable[[str, list], None]] = None # Receives (action, args) for the journal
+        self.history: Optional[GameHistory] = None # The current game, for its record (records.py)
+        self._action_depth = 0
         
-        self.event_log: List[str] = []
+        self.event_log = EventLog()
         self.log_event("Lobby created. Waiting for players...")
         
         self.main_deck = self._create_deck()
-        self.color_chooser_deck = [Tile(1, c) for c in Color]
+        self.color_chooser_deck = [TILES[bitboard.tile_id(1, COLOR_INDEX[c])] for c in Color]
         
         self.game_state: GameState = GameState.LOBBY
         self.message: str = "Waiting for players to join the lobby."
@@ -82,48 +208,77 @@ class DongDongEngine:
         self.current_stack_plays: Dict[str, Tile] = {}
         self.last_stack_winner_name: str = ""
         self.last_completed_stack: Dict[str, Tile] = {}
+        self.round_played_mask: int = 0 # Every tile played so far this round (bitboard mask)
 
+    @journaled
     def add_player(self, player_name: str):
         if len(self.players) < 4:
             self.players.append(Player(name=player_name))
             self.message = f"{player_name} joined the game. Waiting for more players..."
             self.log_event(f"➡️ {player_name} joined as a player.")
 
-    def add_spectator(self, spectator_name: str):
-        self.spectators.append(spectator_name)
-        self.log_event(f"➡️ {spectator_name} started spectating.")
+    @journaled
+    def add_spectator(self, spectator_name: str = ""):
+        self.spectator_count += 1
+        if self.logger: # Room log only; the event log is for the game itself
+            self.logger.info(f"{spectator_name or 'A watcher'} started spectating.")
+
+    @journaled
+    def remove_spectator(self, spectator_name: str = ""):
+        self.spectator_count = max(0, self.spectator_count - 1)
+        if self.logger:
+            self.logger.info(f"{spectator_name or 'A watcher'} stopped spectating.")
     
-    def handle_disconnect(self, name: str):
+    @journaled
+    def reconnect_player(self, name: str):
+        player = next((p for p in self.players if p.name == name), None)
+        if player:
+            player.disconnected = False
+            self.log_event(f"🔌 {name} reconnected.")
+            self.message = f"{name} reconnected."
+
+    @journaled
+    def mark_all_disconnected(self):
+        """Used after a server restart: nobody is connected, but the game itself is kept."""
+        for player in self.players:
+            player.disconnected = True
+        self.spectator_count = 0
+
+    @journaled
+    def handle_disconnect(self, name: str, bots: Sequence[str] = ()):
+        """Marks a player disconnected (or removes a spectator). `bots` are seats nobody is connected to anyway."""
         player = next((p for p in self.players if p.name == name), None)
         if player:
             player.disconnected = True
             self.log_event(f"🔌 {name} disconnected.")
             self.message = f"{name} disconnected."
         else:
-            self.spectators = [s for s in self.spectators if s != name]
-            self.log_event(f"⬅️ Spectator {name} left.")
-            self.message = f"Spectator {name} left."
+            self.remove_spectator(name)
 
-        if self.game_state != GameState.LOBBY and all(p.disconnected for p in self.players):
+        if self.game_state != GameState.LOBBY and all(p.disconnected or p.name in bots for p in self.players):
              self.game_state = GameState.LOBBY
              self.log_event("All players disconnected. Game has returned to the lobby.")
 
+    @journaled
     def log_event(self, event: str):
         if self.logger:
             self.logger.info(event)
         self.event_log.append(event)
-        if len(self.event_log) > 100: # Prevent log from getting too large
-            self.event_log.pop(0)
 
     def _create_deck(self) -> List[Tile]:
-        return [Tile(n, c) for c in Color for n in range(1, 14)]
+        return [TILES[bitboard.tile_id(n, COLOR_INDEX[c])] for c in Color for n in range(1, 14)]
 
+    @journaled
     def start_new_game(self):
         if len(self.players) < 2:
             self.message = "Need at least 2 players to start a game."
             return
 
         self.original_players = [p.name for p in self.players]
+        # Each game gets its own seed from the room's RNG, so its record can name it
+        game_seed = self.rng.getrandbits(64)
+        self.rng.seed(game_seed)
+        self.history = GameHistory(game_seed, self.original_players)
         self.log_event(f"🏁 Game started by {self.players[0].name} with {len(self.players)} players.")
         self.current_round = 0
         self.color_master_player_index = 0
@@ -131,6 +286,7 @@ class DongDongEngine:
             p.score = 0
         self.start_new_round()
 
+    @journaled
     def start_new_round(self):
         self.current_round += 1
         if self.current_round > 13:
@@ -146,18 +302,23 @@ class DongDongEngine:
             player.reset_for_round()
 
         self.last_completed_stack = {} # Clear the last completed stack for the new round
+        self.round_played_mask = 0
 
 
         round_deck = self.main_deck.copy()
-        random.shuffle(round_deck)
+        self.rng.shuffle(round_deck)
         
         for _ in range(self.current_round):
             for player in self.players:
                 if not round_deck: break
                 player.hand.append(round_deck.pop())
 
-        self.master_color = random.choice(self.color_chooser_deck).color
+        self.master_color = self.rng.choice(self.color_chooser_deck).color
         self.log_event(f"👑 Master Color is {self.master_color.value}.")
+        if self.history:
+            self.history.start_round(self.current_round, COLOR_INDEX[self.master_color], self.color_master_player_index,
+                                     [p.score for p in self.players],
+                                     [list(bitboard.iter_ids(p.hand.mask)) for p in self.players])
         
         self.stack_leader_index = self.color_master_player_index
         self.turn_player_index = self.color_master_player_index
@@ -173,6 +334,7 @@ class DongDongEngine:
             return None
         return self.players[self.turn_player_index]
 
+    @journaled
     def place_bet(self, player_name: str, bet: int) -> Tuple[bool, str]:
         turn_player = self.get_current_turn_player()
         if self.game_state != GameState.AWAITING_BETS: return False, "Not time for betting."
@@ -186,6 +348,8 @@ class DongDongEngine:
 
         turn_player.bet = bet
         self.log_event(f"💰 {player_name} bet {bet}.")
+        if self.history:
+            self.history.bet(self.turn_player_index, bet)
         self.bets_made += 1
         self.turn_player_index = (self.turn_player_index + 1) % len(self.players)
         next_player = self.get_current_turn_player()
@@ -200,19 +364,22 @@ class DongDongEngine:
         
         return True, ""
 
+    @journaled
     def play_tile(self, player_name: str, tile_dict: dict) -> Tuple[bool, str]:
         turn_player = self.get_current_turn_player()
         if self.game_state != GameState.AWAITING_PLAY: return False, "Not time for playing."
         if not turn_player or player_name != turn_player.name: return False, "Not your turn."
 
         try:
-            tile_to_play = Tile(number=tile_dict['number'], color=Color(tile_dict['color']))
-        except (KeyError, ValueError): return False, "Invalid tile."
+            number = int(tile_dict['number'])
+            if not 1 <= number <= bitboard.NUMBERS_PER_COLOR: raise ValueError
+            tile_to_play = TILES[bitboard.tile_id(number, COLOR_INDEX[Color(tile_dict['color'])])]
+        except (KeyError, ValueError, TypeError, IndexError): return False, "Invalid tile."
 
         if tile_to_play not in turn_player.hand: return False, "Tile not in hand."
 
-        valid_plays = self.get_valid_plays_for_player(turn_player)
-        if tile_to_play not in valid_plays: return False, f"Invalid move. Must play {self.secondary_color.value}."
+        if not self.valid_play_mask(turn_player) >> tile_to_play.id & 1:
+            return False, f"Invalid move. Must play {self.secondary_color.value}."
 
         if not self.current_stack_plays: 
             self.secondary_color = tile_to_play.color
@@ -221,7 +388,10 @@ class DongDongEngine:
 
         turn_player.hand.remove(tile_to_play)
         self.current_stack_plays[turn_player.name] = tile_to_play
+        self.round_played_mask |= 1 << tile_to_play.id
         self.log_event(f"{player_name} played {tile_to_play}.")
+        if self.history:
+            self.history.play(self.turn_player_index, tile_to_play.id)
 
         self.turn_player_index = (self.turn_player_index + 1) % len(self.players)
         
@@ -233,11 +403,14 @@ class DongDongEngine:
         
         return True, ""
 
+    def valid_play_mask(self, player: Player) -> int:
+        lead = COLOR_INDEX[self.secondary_color] if self.secondary_color else None
+        return bitboard.valid_play_mask(player.hand.mask, lead)
+
     def get_valid_plays_for_player(self, player: Player) -> List[Tile]:
-        if not self.secondary_color: return player.hand
-        valid_plays = [t for t in player.hand if t.color == self.secondary_color]
-        return valid_plays if valid_plays else player.hand
+        return [TILES[t] for t in bitboard.iter_ids(self.valid_play_mask(player))]
 
+    @metrics.timed(metrics.ENGINE_ACTION_SECONDS, "resolve_stack")
     def resolve_stack(self):
         self.game_state = GameState.STACK_RESOLVING
         
@@ -266,18 +439,11 @@ class DongDongEngine:
             self.message += f" {winner_name} leads next."
 
     def _determine_stack_winner(self) -> Tuple[str, Tile]:
-        master_plays = {name: t for name, t in self.current_stack_plays.items() if t.color == self.master_color}
-        if master_plays:
-            winner_name = max(master_plays, key=lambda name: master_plays[name].number)
-            return winner_name, master_plays[winner_name]
-
-        secondary_plays = {name: t for name, t in self.current_stack_plays.items() if t.color == self.secondary_color}
-        if secondary_plays:
-            winner_name = max(secondary_plays, key=lambda name: secondary_plays[name].number)
-            return winner_name, secondary_plays[winner_name]
-
-        leader_name = self.players[self.stack_leader_index].name
-        return leader_name, self.current_stack_plays[leader_name]
+        names = list(self.current_stack_plays)
+        plays = [t.id for t in self.current_stack_plays.values()]
+        leader = names.index(self.players[self.stack_leader_index].name)
+        winner = bitboard.stack_winner(plays, COLOR_INDEX[self.master_color], COLOR_INDEX[self.secondary_color], leader)
+        return names[winner], TILES[plays[winner]]
 
     def _calculate_scores(self):
         self.log_event("--- Scoring ---")
@@ -295,8 +461,8 @@ class DongDongEngine:
             "gameState": self.game_state.value,
             "message": self.message,
             "players": [p.to_dict() for p in self.players],
-            "spectators": self.spectators,
-            "eventLog": self.event_log,
+            "spectatorCount": self.spectator_count,
+            "eventLog": {"nextId": self.event_log.next_id, "entries": self.event_log.tail()}, # Older: event_history
             "turnPlayerName": turn_player.name if turn_player else "",
             "isHost": self.players and self.players[0].name,
             "currentRound": self.current_round,
@@ -311,4 +477,66 @@ class DongDongEngine:
                 "isLastPlayer": self.bets_made == len(self.players) - 1 if self.players else False,
                 "forbiddenBet": (self.current_round - sum(p.bet for p in self.players)) if self.players and self.bets_made == len(self.players) - 1 else -1
             }
-        }
\ No newline at end of file
+        }
+
+    # --- Snapshots ---
+
+    def to_snapshot(self) -> dict:
+        """Returns a compact, JSON-serializable copy of the full engine state, including the RNG."""
+        tile = lambda t: [t.number, t.color.value]
+        version, internal, gauss = self.rng.getstate()
+        return {
+            "players": [
+                [p.name, p.hand.mask, p.score, p.bet, p.stacks_won, p.disconnected]
+                for p in self.players
+            ],
+            "original_players": list(self.original_players),
+            "spectator_count": self.spectator_count,
+            "event_log": list(self.event_log),
+            "event_log_next_id": self.event_log.next_id,
+            "game_state": self.game_state.value,
+            "message": self.message,
+            "current_round": self.current_round,
+            "master_color": self.master_color.value if self.master_color else None,
+            "secondary_color": self.secondary_color.value if self.secondary_color else None,
+            "indexes": [self.color_master_player_index, self.turn_player_index, self.stack_leader_index, self.bets_made],
+            "current_stack_plays": {name: tile(t) for name, t in self.current_stack_plays.items()},
+            "last_stack_winner_name": self.last_stack_winner_name,
+            "last_completed_stack": {name: tile(t) for name, t in self.last_completed_stack.items()},
+            "round_played_mask": self.round_played_mask,
+            "history": self.history.to_list() if self.history else None,
+            "rng": [version, list(internal), gauss],
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict, logger: Optional[Logger] = None) -> "DongDongEngine":
+        tile = lambda t: TILES[bitboard.tile_id(t[0], COLOR_INDEX[Color(t[1])])]
+        engine = cls(logger=None) # Attach the logger afterwards so the constructor's log line isn't repeated
+        engine.players = [
+            Player(name=name, hand=Hand(mask=hand) if isinstance(hand, int) else Hand(tile(t) for t in hand),
+                   score=score, bet=bet, stacks_won=won, disconnected=dc)
+            for name, hand, score, bet, won, dc in data["players"]
+        ]
+        engine.original_players = data["original_players"]
+        engine.spectator_count = data.get("spectator_count", len(data.get("spectators", ())))
+        engine.event_log = EventLog(data["event_log"], data.get("event_log_next_id", len(data["event_log"]) + 1))
+        engine.game_state = GameState(data["game_state"])
+        engine.message = data["message"]
+        engine.current_round = data["current_round"]
+        engine.master_color = Color(data["master_color"]) if data["master_color"] else None
+        engine.secondary_color = Color(data["secondary_color"]) if data["secondary_color"] else None
+        (engine.color_master_player_index, engine.turn_player_index,
+         engine.stack_leader_index, engine.bets_made) = data["indexes"]
+        engine.current_stack_plays = {name: tile(t) for name, t in data["current_stack_plays"].items()}
+        engine.last_stack_winner_name = data["last_stack_winner_name"]
+        engine.last_completed_stack = {name: tile(t) for name, t in data["last_completed_stack"].items()}
+        engine.round_played_mask = data.get("round_played_mask", 0)
+        engine.history = GameHistory.from_list(data.get("history"))
+        version, internal, gauss = data["rng"]
+        engine.rng.setstate((version, tuple(internal), gauss))
+        engine.logger = logger
+        return engine
+
+    def apply_event(self, action: str, args: list):
+        """Replays one journaled action."""
+        getattr(self, action)(*args)
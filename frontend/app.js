@@ -67,9 +67,19 @@ const handArea = document.getElementById("hand-area");
 
 // --- GLOBAL STATE ---
 let gameState = {};
+let privateState = { hand: [], validPlays: [] }; // Our own hand and playable tiles, sent only to us
 let myPlayerName = "";
 let currentRoomId = "";
 let socket = null;
+let stateSeq = 0; // Sequence number of the last state version applied
+let privateSeq = 0; // Version the current private view was produced at
+let stateEpoch = ""; // Which stream stateSeq counts on; a room restored on the server starts a new one
+let eventEntries = new Map(); // Event log entries we have, by id (the state only carries the newest few)
+let eventHistoryDone = false; // The server has nothing older than what we hold
+let eventLogStick = true; // Keep the log scrolled to the newest entry
+const MAX_EVENT_ENTRIES = 500;
+let reconnectAttempts = 0;
+const MAX_RECONNECT_ATTEMPTS = 3;
 let countdownTimer = null;
 let notificationTimeout = null;
 
@@ -89,6 +99,18 @@ function showNotification(message) {
     }, 5000);
 }
 
+// The free-tier backend sleeps when idle; start waking it as soon as the page loads
+function wakeBackend() {
+    const slowNotice = setTimeout(() => showNotification("Waking up the server, this can take up to a minute..."), 1500);
+    const poll = () => fetch(`${API_BASE_URL}/readyz`)
+        .then(response => {
+            if (!response.ok) throw new Error(`Not ready (${response.status})`);
+            clearTimeout(slowNotice);
+        })
+        .catch(() => setTimeout(poll, 2000));
+    poll();
+}
+
 function startCountdown() {
     if (countdownTimer) clearInterval(countdownTimer);
     let seconds = 5;
@@ -168,24 +190,31 @@ function render() {
     
     // Render Spectators
     spectatorList.innerHTML = '';
-    if (gameState.spectators && gameState.spectators.length > 0) {
-        gameState.spectators.forEach(name => {
-            const li = document.createElement('li');
-            li.textContent = name;
-            spectatorList.appendChild(li);
-        });
+    const watching = gameState.spectatorCount || 0;
+    if (watching > 0) {
+        const li = document.createElement('li');
+        li.textContent = `${watching} watching`;
+        spectatorList.appendChild(li);
     }
 
     // Render Event Log
     eventLog.innerHTML = '';
-    if (gameState.eventLog && gameState.eventLog.length > 0) {
+    if (eventEntries.size > 0) {
         eventLogArea.style.display = 'flex';
-        gameState.eventLog.forEach(logMsg => {
+        const ids = [...eventEntries.keys()].sort((a, b) => a - b);
+        if (ids[0] > 1 && !eventHistoryDone) {
+            const more = document.createElement('li');
+            more.className = 'event-log-more';
+            more.textContent = 'Show earlier events...';
+            more.onclick = () => sendSocketMessage({ action: 'event_history', payload: { before: ids[0] } });
+            eventLog.appendChild(more);
+        }
+        ids.forEach(id => {
             const li = document.createElement('li');
-            li.textContent = logMsg;
+            li.textContent = eventEntries.get(id);
             eventLog.appendChild(li);
         });
-        eventLog.scrollTop = eventLog.scrollHeight; // Auto-scroll to bottom
+        if (eventLogStick) eventLog.scrollTop = eventLog.scrollHeight; // Auto-scroll to bottom
     } else {
         eventLogArea.style.display = 'none';
     }
@@ -226,10 +255,21 @@ function render() {
         actionArea.style.display = 'block';
     }
 
+    if (isHost && gameState.gameState === 'LOBBY' && gameState.players.length < 4) {
+        const addBotBtn = document.createElement('button');
+        addBotBtn.id = 'add-bot-btn';
+        addBotBtn.className = 'start-game-tile-button';
+        addBotBtn.textContent = 'Add Bot';
+        addBotBtn.onclick = () => sendSocketMessage({ action: 'add_bot' });
+        handArea.appendChild(addBotBtn);
+        actionArea.style.display = 'block';
+    }
+
     if (myPlayer) {
         actionArea.style.display = 'block';
-        myPlayer.hand.forEach(tileData => {
-            const isClickable = isMyTurn && gameState.gameState === 'AWAITING_PLAY';
+        privateState.hand.forEach(tileData => {
+            const isClickable = isMyTurn && gameState.gameState === 'AWAITING_PLAY' &&
+                privateState.validPlays.some(t => t.number === tileData.number && t.color === tileData.color);
             const tileEl = createTileElement(tileData, isClickable);
             if (isClickable) {
                 tileEl.onclick = () => sendSocketMessage({ action: 'play_tile', payload: { tile: tileData } });
@@ -254,6 +294,119 @@ function createTileElement(tileData, isClickable = false) {
     return tileEl;
 }
 
+// --- STATE SYNC ---
+
+// Mirrors diff_state() in state_sync.py: ops are applied in order to the previous state.
+function applyStateOps(state, ops) {
+    for (const [op, path, value] of ops) {
+        if (path.length === 0) {
+            if (op === 'set') state = value;
+            continue;
+        }
+        let parent = state;
+        for (let i = 0; i < path.length - 1; i++) parent = parent[path[i]];
+        const key = path[path.length - 1];
+        if (op === 'set') parent[key] = value;
+        else if (op === 'del') delete parent[key];
+        else if (op === 'trim') parent[key].splice(0, value);
+        else if (op === 'push') parent[key].push(...value);
+    }
+    return state;
+}
+
+// Adds event log entries with consecutive ids starting at startId.
+function mergeEventEntries(startId, texts) {
+    texts.forEach((text, i) => eventEntries.set(startId + i, text));
+}
+
+function onStateUpdated(oldState) {
+    if (gameState.eventLog) {
+        const { nextId, entries } = gameState.eventLog;
+        mergeEventEntries(nextId - entries.length, entries);
+        if (eventEntries.size > MAX_EVENT_ENTRIES) { // Forget the oldest; they can be paged back in
+            const ids = [...eventEntries.keys()].sort((a, b) => a - b);
+            ids.slice(0, ids.length - MAX_EVENT_ENTRIES).forEach(id => eventEntries.delete(id));
+            eventHistoryDone = false;
+        }
+    }
+    eventLogStick = true;
+    render(); // Render first to show the final stack
+
+    // If the round just ended, start the countdown
+    if (oldState !== 'ROUND_OVER' && gameState.gameState === 'ROUND_OVER') {
+        startCountdown();
+    }
+}
+
+// --- WIRE FORMAT ---
+
+// Frames are JSON text. Add ?wire=msgpack to the page URL to opt in to the compact binary format (wire.py);
+// the server falls back to JSON if it doesn't speak it.
+const WIRE_PROTOCOLS = new URLSearchParams(window.location.search).get('wire') === 'msgpack'
+    ? ['dongdong.msgpack', 'dongdong.json'] : ['dongdong.json'];
+// Must match wire.py and bitboard.py
+const WIRE_GAME_STATES = ['LOBBY', 'ROUND_STARTING', 'AWAITING_BETS', 'AWAITING_PLAY', 'STACK_RESOLVING', 'ROUND_OVER', 'GAME_OVER'];
+const WIRE_COLORS = ['Black', 'Blue', 'Orange', 'Red'];
+const utf8Decoder = new TextDecoder();
+
+const wireTile = (id) => ({ number: id % 13 + 1, color: WIRE_COLORS[Math.floor(id / 13)] });
+
+// Decodes the MessagePack subset wire.py writes, including its tile/enum extension types.
+function decodeWireMessage(buffer) {
+    const view = new DataView(buffer);
+    const bytes = new Uint8Array(buffer);
+    let pos = 0;
+    const str = (n) => utf8Decoder.decode(bytes.subarray(pos, pos += n));
+    const arr = (n) => { const a = new Array(n); for (let i = 0; i < n; i++) a[i] = read(); return a; };
+    const map = (n) => { const m = {}; for (let i = 0; i < n; i++) { const k = read(); m[k] = read(); } return m; };
+    const u16 = () => { const v = view.getUint16(pos); pos += 2; return v; };
+    const u32 = () => { const v = view.getUint32(pos); pos += 4; return v; };
+
+    function ext(type, n) {
+        const data = bytes.subarray(pos, pos += n);
+        if (type === 1) return wireTile(data[0]);
+        if (type === 2) return Array.from(data, wireTile);
+        if (type === 3) return WIRE_GAME_STATES[data[0]];
+        if (type === 4) return WIRE_COLORS[data[0]];
+        throw new Error(`Unknown wire extension ${type}`);
+    }
+
+    function read() {
+        const b = bytes[pos++];
+        if (b < 0x80) return b;
+        if (b >= 0xe0) return b - 0x100;
+        if (b <= 0x8f) return map(b & 0x0f);
+        if (b <= 0x9f) return arr(b & 0x0f);
+        if (b <= 0xbf) return str(b & 0x1f);
+        let v;
+        switch (b) {
+            case 0xc0: return null;
+            case 0xc2: return false;
+            case 0xc3: return true;
+            case 0xc7: { const n = bytes[pos++]; return ext(bytes[pos++], n); }
+            case 0xcb: v = view.getFloat64(pos); pos += 8; return v;
+            case 0xcc: return bytes[pos++];
+            case 0xcd: return u16();
+            case 0xce: return u32();
+            case 0xcf: v = Number(view.getBigUint64(pos)); pos += 8; return v;
+            case 0xd0: return view.getInt8(pos++);
+            case 0xd1: v = view.getInt16(pos); pos += 2; return v;
+            case 0xd2: v = view.getInt32(pos); pos += 4; return v;
+            case 0xd3: v = Number(view.getBigInt64(pos)); pos += 8; return v;
+            case 0xd4: return ext(bytes[pos++], 1);
+            case 0xd9: return str(bytes[pos++]);
+            case 0xda: return str(u16());
+            case 0xdb: return str(u32());
+            case 0xdc: return arr(u16());
+            case 0xdd: return arr(u32());
+            case 0xde: return map(u16());
+            case 0xdf: return map(u32());
+        }
+        throw new Error(`Unsupported wire byte 0x${b.toString(16)}`);
+    }
+    return read();
+}
+
 // --- WEBSOCKET & ACTIONS ---
 
 function sendSocketMessage(message) {
@@ -265,28 +418,64 @@ function sendSocketMessage(message) {
     }
 }
 
-function connectWebSocket(roomId, playerName) {
-    if (socket) socket.close();
+function connectWebSocket(roomId, playerName, resume = false) {
+    if (socket) {
+        socket.onclose = null; // Intentional close, don't reset or reconnect
+        socket.close();
+    }
     
     currentRoomId = roomId;
     myPlayerName = playerName;
+    if (!resume) {
+        gameState = {};
+        privateState = { hand: [], validPlays: [] };
+        stateSeq = 0;
+        privateSeq = 0;
+        stateEpoch = "";
+        eventEntries = new Map();
+        eventHistoryDone = false;
+    }
 
-    socket = new WebSocket(`${WS_BASE_URL}/ws/${roomId}/${playerName}`);
+    // On reconnect, tell the server the last version we saw so it only sends what we missed
+    const query = resume && stateSeq ? `?since=${stateSeq}&epoch=${encodeURIComponent(stateEpoch)}` : '';
+    socket = new WebSocket(`${WS_BASE_URL}/ws/${roomId}/${playerName}${query}`, WIRE_PROTOCOLS);
+    socket.binaryType = 'arraybuffer';
 
-    socket.onopen = () => console.log("WebSocket connection established.");
+    socket.onopen = () => {
+        console.log("WebSocket connection established.");
+        reconnectAttempts = 0;
+    };
 
     socket.onmessage = (event) => {
-        const message = JSON.parse(event.data);
+        const message = typeof event.data === 'string' ? JSON.parse(event.data) : decodeWireMessage(event.data);
         if (message.type === 'game_state') {
             const oldState = gameState.gameState;
             gameState = message.payload;
-            
-            render(); // Render first to show the final stack
-
-            // If the round just ended, start the countdown
-            if (oldState !== 'ROUND_OVER' && gameState.gameState === 'ROUND_OVER') {
-                startCountdown();
+            if (message.epoch !== stateEpoch) privateSeq = 0; // Versions restarted; older private views are not stale
+            stateSeq = message.seq;
+            stateEpoch = message.epoch;
+            onStateUpdated(oldState);
+        } else if (message.type === 'state_delta') {
+            if (message.seq <= stateSeq) return; // Already applied
+            if (!stateSeq || message.seq !== stateSeq + 1) {
+                // Missed a version; ask the server for the gap (or a fresh snapshot)
+                sendSocketMessage({ action: 'sync', payload: { since: stateSeq || null, epoch: stateEpoch } });
+                return;
             }
+            const oldState = gameState.gameState;
+            gameState = applyStateOps(gameState, message.ops);
+            stateSeq = message.seq;
+            onStateUpdated(oldState);
+        } else if (message.type === 'private_state') {
+            if (message.seq < privateSeq) return; // Stale view queued before a resync
+            privateState = message.payload;
+            privateSeq = message.seq;
+            if (gameState.gameState) render();
+        } else if (message.type === 'event_history') {
+            mergeEventEntries(message.startId, message.entries);
+            eventHistoryDone = !message.hasMore;
+            eventLogStick = false; // Stay at the top, where the older entries appeared
+            if (gameState.gameState) render();
         } else if (message.type === 'error') {
             console.error("Received error from server:", message.message);
             showNotification(`Error: ${message.message}`);
@@ -299,6 +488,12 @@ function connectWebSocket(roomId, playerName) {
         // Show a specific alert for known error codes from the server
         if (event.code === 4000 || event.code === 4001) {
             showNotification(`Connection failed: ${event.reason}`);
+        } else if (stateSeq && reconnectAttempts < MAX_RECONNECT_ATTEMPTS) {
+            // Unexpected drop: try to resume from the last version we saw
+            reconnectAttempts++;
+            messageBar.textContent = `Connection lost. Reconnecting (${reconnectAttempts}/${MAX_RECONNECT_ATTEMPTS})...`;
+            setTimeout(() => connectWebSocket(roomId, playerName, true), 1000 * reconnectAttempts);
+            return;
         }
 
         // Reset the UI and state
@@ -306,6 +501,13 @@ function connectWebSocket(roomId, playerName) {
         currentRoomId = "";
         myPlayerName = "";
         gameState = {};
+        privateState = { hand: [], validPlays: [] };
+        stateSeq = 0;
+        privateSeq = 0;
+        stateEpoch = "";
+        eventEntries = new Map();
+        eventHistoryDone = false;
+        reconnectAttempts = 0;
         render();
     };
 
@@ -387,6 +589,7 @@ function init() {
     });
     
     render();
+    wakeBackend();
 }
 
 init();
@@ -0,0 +1,136 @@
+"""
+Room lifecycle: tracks when each room was last active and evicts rooms nobody is using.
+
+A periodic sweep removes finished or abandoned rooms for good and hibernates rooms that have merely
+gone idle (their snapshot stays on disk and they are loaded again on the next visit). It also keeps
+the number of rooms in memory, and the process's memory, under configurable caps.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+from dong_dong_engine import DongDongEngine, GameState
+
+IDLE_TTL = float(os.environ.get("DONGDONG_ROOM_IDLE_TTL", "1800"))           # Seconds before an idle room is hibernated
+FINISHED_TTL = float(os.environ.get("DONGDONG_ROOM_FINISHED_TTL", "300"))    # ...or a finished/abandoned one is dropped
+MAX_ROOMS = int(os.environ.get("DONGDONG_MAX_ROOMS", "5000"))                # Rooms held in memory at once
+MAX_MEMORY_MB = float(os.environ.get("DONGDONG_MAX_MEMORY_MB", "0"))         # Process RSS budget (0 = no limit)
+SWEEP_INTERVAL = 30.0
+MEMORY_EVICT_FRACTION = 0.1  # Share of evictable rooms hibernated per sweep while over the memory budget
+
+logger = logging.getLogger("app_logger")
+
+def process_rss_mb() -> Optional[float]:
+    """Resident memory of this process, from /proc (None where that isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+class RoomLifecycle:
+    """Decides which rooms leave memory; main.py does the actual teardown through `evict`."""
+    def __init__(self, rooms: Dict[str, DongDongEngine],
+                 connection_count: Callable[[str], int],
+                 evict: Callable[[str, bool], None],
+                 can_hibernate: Callable[[], bool]):
+        self.rooms = rooms
+        self.connection_count = connection_count
+        self.evict = evict # (room_id, keep): keep=True hibernates the room to disk, False drops it for good
+        self.can_hibernate = can_hibernate # False without a journal: rooms evicted to hibernate are lost instead
+        self.last_active: Dict[str, float] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"created": 0, "rehydrated": 0, "hibernated": 0, "dropped": 0, "rejected": 0}
+
+    def start(self):
+        self.task = asyncio.create_task(self._sweep_loop())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def added(self, room_id: str, rehydrated: bool = False):
+        self.stats["rehydrated" if rehydrated else "created"] += 1
+        self.touch(room_id)
+
+    def touch(self, room_id: str):
+        self.last_active[room_id] = time.monotonic()
+
+    def forget(self, room_id: str):
+        self.last_active.pop(room_id, None)
+
+    def make_room(self) -> bool:
+        """Called before creating a room. Hibernates the least recently used idle room if at the cap."""
+        if len(self.rooms) < MAX_ROOMS:
+            return True
+        candidates = self._evictable()
+        if not candidates:
+            self.stats["rejected"] += 1
+            return False
+        self._evict(candidates[0], keep=True)
+        return True
+
+    def _is_finished(self, engine: DongDongEngine) -> bool:
+        if engine.game_state == GameState.GAME_OVER:
+            return True
+        # Empty, or everyone left (an abandoned game is sent back to the lobby)
+        return all(p.disconnected for p in engine.players)
+
+    def _evictable(self) -> List[str]:
+        """Rooms with nobody connected, least recently active first."""
+        idle = [room_id for room_id in self.rooms if self.connection_count(room_id) == 0]
+        return sorted(idle, key=lambda room_id: self.last_active.get(room_id, 0.0))
+
+    def _evict(self, room_id: str, keep: bool):
+        keep = keep and self.can_hibernate()
+        self.stats["hibernated" if keep else "dropped"] += 1
+        self.forget(room_id)
+        self.evict(room_id, keep)
+
+    def sweep(self):
+        now = time.monotonic()
+        for room_id in self._evictable():
+            idle_for = now - self.last_active.get(room_id, 0.0)
+            if self._is_finished(self.rooms[room_id]):
+                if idle_for >= FINISHED_TTL:
+                    self._evict(room_id, keep=False)
+            elif idle_for >= IDLE_TTL:
+                self._evict(room_id, keep=True)
+
+        over = len(self.rooms) - MAX_ROOMS
+        if over > 0:
+            for room_id in self._evictable()[:over]:
+                self._evict(room_id, keep=True)
+
+        rss = process_rss_mb()
+        if MAX_MEMORY_MB and rss is not None and rss > MAX_MEMORY_MB:
+            candidates = self._evictable()
+            for room_id in candidates[:max(1, int(len(candidates) * MEMORY_EVICT_FRACTION))]:
+                self._evict(room_id, keep=True)
+            logger.warning(f"Memory {rss:.0f}MB over the {MAX_MEMORY_MB:.0f}MB budget; hibernating idle rooms.")
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Room sweep failed: {e}", exc_info=True)
+
+    def report(self) -> dict:
+        states: Dict[str, int] = {}
+        for engine in self.rooms.values():
+            states[engine.game_state.value] = states.get(engine.game_state.value, 0) + 1
+        rss = process_rss_mb()
+        return {
+            "rooms_in_memory": len(self.rooms),
+            "rooms_with_connections": sum(1 for room_id in self.rooms if self.connection_count(room_id)),
+            "rooms_by_state": states,
+            "max_rooms": MAX_ROOMS,
+            "rss_mb": round(rss, 1) if rss is not None else None,
+            "max_memory_mb": MAX_MEMORY_MB or None,
+            **self.stats,
+        }
@@ -0,0 +1,205 @@
+"""
+Non-blocking file logging for the app and every room.
+
+Handlers only append the record to a bounded queue; a single background thread formats them, groups
+each batch by file and writes it with one call per file. Open files are kept in a small LRU so
+thousands of rooms never mean thousands of descriptors, and each file rotates by size and age.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+LOGS_DIR = os.environ.get("DONGDONG_LOGS_DIR", "Logs")
+MAX_QUEUED = 20000                                                          # Records waiting; more are dropped
+MAX_BATCH = 2048                                                            # Records handled per batch
+MAX_OPEN_FILES = int(os.environ.get("DONGDONG_LOG_OPEN_FILES", "64"))
+MAX_BYTES = int(os.environ.get("DONGDONG_LOG_MAX_BYTES", str(5 * 1024 * 1024)))   # Rotate a file past this size
+ROTATE_SECONDS = int(os.environ.get("DONGDONG_LOG_ROTATE_SECONDS", "86400"))     # ...or once per period (0 = never)
+BACKUPS = int(os.environ.get("DONGDONG_LOG_BACKUPS", "3"))
+BATCH_DELAY = 0.05                                                          # Lets a batch build up before writing
+_STARTED = time.time() # Base for records' relativeCreated
+
+class _OpenFile:
+    def __init__(self, path: str):
+        self.file = open(path, "a", encoding="utf-8")
+        self.size = self.file.tell()
+        # A file last written in an earlier period rotates on its next write
+        self.period = _period(os.path.getmtime(path)) if self.size else _period(time.time())
+
+def _period(timestamp: float) -> int:
+    return int(timestamp // ROTATE_SECONDS) if ROTATE_SECONDS > 0 else 0
+
+class LogWriter:
+    """Single background thread that owns every log file."""
+    def __init__(self, logs_dir: str = LOGS_DIR):
+        self.logs_dir = logs_dir
+        os.makedirs(logs_dir, exist_ok=True)
+        # A deque append is atomic and far cheaper than queue.Queue; the event only wakes an idle writer
+        self.pending: "deque[Optional[Tuple[str, logging.Handler, logging.LogRecord]]]" = deque()
+        self.wakeup = threading.Event()
+        self.files: "OrderedDict[str, _OpenFile]" = OrderedDict()
+        self.dropped = 0 # Guarded by drop_lock: counted by any logging thread, reported by the writer
+        self.drop_lock = threading.Lock()
+        self.stats = {"written": 0, "batches": 0, "rotations": 0, "evicted_files": 0}
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, filename: str, handler: logging.Handler, record: logging.LogRecord):
+        if len(self.pending) >= MAX_QUEUED:
+            with self.drop_lock:
+                self.dropped += 1 # Never block the event loop on logging
+            return
+        self.pending.append((filename, handler, record))
+        if not self.wakeup.is_set():
+            self.wakeup.set()
+
+    def _take_dropped(self) -> int:
+        with self.drop_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def close(self):
+        """Writes everything queued so far, closes the files and stops the writer."""
+        if self.thread.is_alive():
+            self.pending.append(None)
+            self.wakeup.set()
+            self.thread.join()
+
+    def report(self) -> dict:
+        return {**self.stats, "queued": len(self.pending), "dropped": self.dropped, "open_files": len(self.files)}
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            if self.pending and self.pending[0] is not None:
+                time.sleep(BATCH_DELAY) # Waking per record would contend with the event loop for the GIL
+            self.wakeup.clear() # Before draining: anything appended from now on sets it again
+            batch = []
+            while self.pending and len(batch) < MAX_BATCH:
+                batch.append(self.pending.popleft())
+            if self.pending:
+                self.wakeup.set() # More than one batch was waiting
+            try:
+                self._write_batch([item for item in batch if item is not None])
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Log write failed: {e}", exc_info=True)
+            if None in batch:
+                for open_file in self.files.values():
+                    open_file.file.close()
+                self.files.clear()
+                return
+
+    def _write_batch(self, batch: List[tuple]):
+        lines: Dict[str, List[str]] = {}
+        for filename, handler, record in batch:
+            try:
+                lines.setdefault(filename, []).append(handler.format(record))
+            except Exception:
+                handler.handleError(record)
+        dropped = self._take_dropped()
+        if dropped:
+            lines.setdefault("app.log", []).append(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - "
+                                                   f"Log queue full; dropped {dropped} records")
+        for filename, file_lines in lines.items():
+            text = "\n".join(file_lines) + "\n"
+            size = len(text.encode("utf-8"))
+            open_file = self._open(filename)
+            if open_file.size and (open_file.size + size > MAX_BYTES or open_file.period != _period(time.time())):
+                open_file = self._rotate(filename)
+            open_file.file.write(text)
+            open_file.file.flush()
+            open_file.size += size
+            self.stats["written"] += len(file_lines)
+        self.stats["batches"] += 1
+
+    def _open(self, filename: str) -> _OpenFile:
+        open_file = self.files.get(filename)
+        if open_file is not None:
+            self.files.move_to_end(filename)
+            return open_file
+        if len(self.files) >= MAX_OPEN_FILES:
+            _, evicted = self.files.popitem(last=False)
+            evicted.file.close()
+            self.stats["evicted_files"] += 1
+        open_file = self.files[filename] = _OpenFile(os.path.join(self.logs_dir, filename))
+        return open_file
+
+    def _rotate(self, filename: str) -> _OpenFile:
+        """game_1234.log -> game_1234.log.1 -> ... -> game_1234.log.N (dropped)"""
+        self.files.pop(filename).file.close()
+        path = os.path.join(self.logs_dir, filename)
+        for i in range(BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{path}.{i}"):
+                os.replace(f"{path}.{i}", f"{path}.{i + 1}")
+        if BACKUPS > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+        self.stats["rotations"] += 1
+        return self._open(filename)
+
+class QueuedFileHandler(logging.Handler):
+    """A logging handler that hands records to the shared LogWriter instead of writing them itself."""
+    def __init__(self, writer: LogWriter, filename: str):
+        super().__init__()
+        self.writer = writer
+        self.filename = filename
+
+    def emit(self, record: logging.LogRecord):
+        if record.exc_info:
+            # Format the traceback now and drop it, so the queued record doesn't keep its frames alive
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.writer.submit(self.filename, self, record)
+
+class _LeanRecord(logging.LogRecord):
+    """A LogRecord without the caller, thread and process lookups the stdlib constructor does."""
+    def __init__(self, name: str, level: int, msg, args, exc_info, sinfo: Optional[str]):
+        created = time.time()
+        self.name = name
+        self.msg = msg
+        # Same quirk as LogRecord: a single mapping argument is used for %(key)s formatting
+        self.args = args[0] if args and len(args) == 1 and isinstance(args[0], dict) and args[0] else args
+        self.levelno = level
+        self.levelname = logging.getLevelName(level)
+        self.pathname = self.filename = "(unknown file)"
+        self.module = "(unknown module)"
+        self.funcName = "(unknown function)"
+        self.lineno = 0
+        self.exc_info = exc_info
+        self.exc_text = None
+        self.stack_info = sinfo
+        self.created = created
+        self.msecs = (created - int(created)) * 1000
+        self.relativeCreated = (created - _STARTED) * 1000
+        self.thread = self.threadName = self.process = self.processName = None
+
+class QueuedLogger(logging.Logger):
+    """
+    A logger for one file, written by the LogWriter. Its records skip the caller, thread and process
+    lookups (none of our formats use them), which is most of what a log call costs the event loop.
+    Not registered with logging.getLogger(): its owner keeps it, and it goes away with them.
+    """
+    def __init__(self, name: str, writer: LogWriter, filename: str, fmt: str, level: int = logging.INFO):
+        super().__init__(name, level)
+        self.propagate = False
+        handler = QueuedFileHandler(writer, filename)
+        handler.setFormatter(logging.Formatter(fmt))
+        self.addHandler(handler)
+
+    def findCaller(self, stack_info: bool = False, stacklevel: int = 1):
+        return "(unknown file)", 0, "(unknown function)", None
+
+    def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
+        record = _LeanRecord(name, level, msg, args, exc_info, sinfo)
+        if extra:
+            record.__dict__.update(extra)
+        return record
+
+    def close(self):
+        for handler in list(self.handlers):
+            self.removeHandler(handler)
+            handler.close()
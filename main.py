@@ -1,26 +1,51 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from starlette.requests import Request
 import asyncio
+import io
 import json
 import random
-import string
-import os
 import logging
-from typing import Dict, List, Tuple
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from dong_dong_engine import DongDongEngine, GameState
+from projections import RoomProjection
+from state_sync import encode_message
+from connections import ClientConnection, ConnectionManager
+from persistence import (DATA_DIR, ENABLED as PERSISTENCE_ENABLED, JournalWriter, RoomJournal,
+                         list_saved_rooms, load_room, room_saved)
+from bots import BotManager
+from lifecycle import RoomLifecycle
+from actors import RoomActor
+from static_assets import AssetStore, StaticAssets
+from startup import PREWARM, StartupTracker, prewarm
+from room_directory import RoomDirectory
+from spectators import SpectatorFeed, Watcher, sse_event
+from timers import TimerWheel, TurnTimers, default_auto_action, turn_key
+import records
+import metrics
+from sharding import ShardConfig, ShardWorker, UnixSocketBus, proxy_websocket
+from log_writer import LOGS_DIR, LogWriter, QueuedFileHandler, QueuedLogger
+
+startup_tracker = StartupTracker()
+"""
+Times each startup phase from process start; /readyz reports them.
+"""
 
 # --- Logging Setup ---
-LOGS_DIR = "Logs"
-if not os.path.exists(LOGS_DIR):
-    os.makedirs(LOGS_DIR)
+
+log_writer = LogWriter(LOGS_DIR)
+"""
+Writes the app log and every room log from one background thread, so logging never blocks the event loop.
+"""
 
 # General application logger
 app_logger = logging.getLogger("app_logger")
 app_logger.setLevel(logging.INFO)
-app_handler = logging.FileHandler(os.path.join(LOGS_DIR, "app.log"), encoding="utf-8")
+app_handler = QueuedFileHandler(log_writer, "app.log")
 app_handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s'))
 app_logger.addHandler(app_handler)
 
@@ -31,31 +56,113 @@ game_sessions: Dict[str, DongDongEngine] = {}
 Stores active game engines, keyed by room_id.
 """
 
-class ConnectionManager:
-    """Manages active WebSocket connections for each game room."""
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+room_projections: Dict[str, RoomProjection] = {}
+"""
+Stores each room's versioned public state stream and per-player private views.
+"""
 
-    async def connect(self, websocket: WebSocket, room_id: str):
-        await websocket.accept()
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = []
-        self.active_connections[room_id].append(websocket)
+manager = ConnectionManager()
 
-    def disconnect(self, websocket: WebSocket, room_id: str):
-        if room_id in self.active_connections:
-            self.active_connections[room_id].remove(websocket)
+shard_config = ShardConfig.from_env()
+"""
+Which worker this process is and how many share the rooms. Sharding is off with a single worker.
+"""
+shard_worker: Optional[ShardWorker] = None
 
-    async def broadcast(self, room_id: str, message: dict):
-        if room_id in self.active_connections:
-            for connection in self.active_connections[room_id]:
-                await connection.send_json(message)
+room_directory = RoomDirectory(accept=shard_config.is_local)
+"""
+Every room code this worker has handed out, in memory or saved on disk. New codes come from here.
+"""
 
-manager = ConnectionManager()
+EVENT_HISTORY_PAGE = 50 # Most event log entries sent per history request
+KNOWN_ACTIONS = {"start_game", "add_bot", "place_bet", "play_tile"} # Labels for the actions metric
+
+spectator_feeds: Dict[str, SpectatorFeed] = {}
+"""
+Each room's watchers: spectator sockets and event streams share its public frames at a capped rate.
+"""
+
+room_actors: Dict[str, RoomActor] = {}
+"""
+One task per room that applies every change to its engine in order, then broadcasts once per batch.
+"""
+
+bot_manager = BotManager(lambda room_id, name, action, payload: submit_action(room_id, name, action, payload))
+"""
+Plays for bot seats and for disconnected players whose turn it is. Decisions run in a process pool.
+"""
+
+journal_writer: Optional[JournalWriter] = None
+room_journals: Dict[str, RoomJournal] = {}
+"""
+Journals every engine action per room so games survive restarts. Started in lifespan().
+"""
+
+room_lifecycle = RoomLifecycle(game_sessions, lambda room_id: room_connections(room_id),
+                               lambda room_id, keep: evict_room(room_id, keep),
+                               lambda: journal_writer is not None)
+"""
+Hibernates idle rooms and drops finished ones so memory stays bounded over a long uptime.
+"""
+loading_rooms: Dict[str, asyncio.Task] = {}
+QUIET_PATHS = {"/healthz", "/readyz"} # Polled by the platform every few seconds; not worth a log line
+
+static_store = AssetStore("frontend")
+"""
+The frontend, fingerprinted and precompressed in memory. Built by warm_up() after startup.
+"""
+
+timer_wheel = TimerWheel()
+turn_timers = TurnTimers(timer_wheel, lambda room_id, key: on_turn_expired(room_id, key))
+"""
+Every room's turn timeouts and pause between rounds, on one timer wheel. Started in lifespan().
+"""
+
+metrics.Gauge("dongdong_rooms", "Rooms in memory on this worker.", lambda: len(game_sessions))
+metrics.Gauge("dongdong_sockets", "Open player WebSockets on this worker.", manager.total)
+metrics.Gauge("dongdong_turn_timers", "Pending turn timeouts and round pauses on this worker.", lambda: len(timer_wheel))
+metrics.CounterFunc("dongdong_turn_timeouts_total", "Turns played automatically after a timeout.",
+                    lambda: turn_timers.stats["timeouts"])
+metrics.Gauge("dongdong_spectators", "Spectator sockets and event streams on this worker.",
+              lambda: sum(len(feed) for feed in spectator_feeds.values()))
+for _stat in ("created", "rehydrated", "hibernated", "dropped", "rejected"):
+    metrics.CounterFunc(f"dongdong_rooms_{_stat}_total", f"Rooms {_stat}.",
+                        lambda stat=_stat: room_lifecycle.stats[stat])
 
 # --- FastAPI App Initialization ---
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global shard_worker, journal_writer
+    if PERSISTENCE_ENABLED:
+        # Saved rooms are loaded on their first visit (see ensure_room), not all at startup
+        journal_writer = JournalWriter(DATA_DIR)
+        for room_id in list_saved_rooms(DATA_DIR):
+            if shard_config.is_local(room_id):
+                room_directory.reserve(room_id)
+    if shard_config.enabled:
+        bus = UnixSocketBus(shard_config.bus_path)
+        shard_worker = ShardWorker(shard_config, bus, create_local_room, ensure_room, run_game_session, watch_room)
+        await shard_worker.start()
+        app_logger.info(f"Worker {shard_config.worker_id}/{shard_config.num_workers} joined the room bus.")
+    room_lifecycle.start()
+    timer_wheel.start()
+    startup_tracker.mark("started")
+    warmup = asyncio.create_task(warm_up())
+    yield
+    warmup.cancel()
+    timer_wheel.stop()
+    room_lifecycle.stop()
+    if shard_worker:
+        await shard_worker.bus.stop()
+    bot_manager.shutdown()
+    if journal_writer:
+        for journal in room_journals.values():
+            journal.snapshot()
+        journal_writer.close()
+    log_writer.close()
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -73,70 +180,452 @@ app.add_middleware(
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Middleware to log all incoming HTTP requests."""
-    app_logger.info(f"Request: {request.method} {request.url} - From: {request.client.host}")
+    if request.url.path not in QUIET_PATHS:
+        app_logger.info(f"Request: {request.method} {request.url} - From: {request.client.host}")
     response = await call_next(request)
     return response
 
+# Added last so it runs first: the frontend's files are served before any other middleware sees the request
+app.add_middleware(StaticAssets, store=static_store)
+
 # --- Helper Functions ---
 
+async def warm_up():
+    """Runs once the server is listening: builds the compressed frontend and warms the game code, then reports ready."""
+    try:
+        await asyncio.to_thread(static_store.load)
+        if PREWARM:
+            prewarm()
+        startup_tracker.mark("warmed")
+    except Exception as e:
+        app_logger.error(f"Warm-up failed: {e}", exc_info=True) # Serve anyway; only the first requests are slower
+    startup_tracker.set_ready()
+
+room_loggers: Dict[str, QueuedLogger] = {}
+"""
+Each room's logger, kept here rather than registered with logging.getLogger() so it goes away with the room.
+"""
+
 def setup_room_logger(room_id: str) -> logging.Logger:
     """Creates a dedicated logger for a game room."""
-    logger = logging.getLogger(f"room_{room_id}")
-    logger.setLevel(logging.INFO)
-    # Prevent duplicate handlers if function is called multiple times for the same room
-    if not logger.handlers:
-        handler = logging.FileHandler(os.path.join(LOGS_DIR, f"game_{room_id}.log"), encoding="utf-8")
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-    return logger
-
-def generate_room_id():
-    """Generates a unique 4-digit room ID."""
-    while True:
-        room_id = ''.join(random.choices(string.digits, k=4))
-        if room_id not in game_sessions:
-            return room_id
-
-async def broadcast_gamestate(room_id: str):
-    """Fetches and broadcasts the current game state to all clients in a room."""
+    # Reuse it if function is called multiple times for the same room
+    if room_id not in room_loggers:
+        room_loggers[room_id] = QueuedLogger(f"room_{room_id}", log_writer, f"game_{room_id}.log",
+                                             '%(asctime)s - %(levelname)s - %(message)s')
+    return room_loggers[room_id]
+
+def release_room_logger(room_id: str):
+    """Closes a room's logger and its handler."""
+    logger = room_loggers.pop(room_id, None)
+    if logger:
+        logger.close()
+
+def create_local_room() -> Optional[str]:
+    """Creates a room owned by this worker and returns its ID, or None if the worker is full or out of IDs."""
+    if not room_lifecycle.make_room():
+        return None
+    room_id = room_directory.allocate()
+    if room_id is None:
+        return None
+    logger = setup_room_logger(room_id)
+    engine = DongDongEngine(logger=logger)
+    game_sessions[room_id] = engine
+    room_projections[room_id] = RoomProjection()
+    spectator_feeds[room_id] = SpectatorFeed(room_projections[room_id].stream)
+    if journal_writer:
+        journal = RoomJournal(journal_writer, room_id, engine)
+        journal.snapshot() # Base snapshot; everything after it is journaled
+        journal.attach()
+        room_journals[room_id] = journal
+    start_room_actor(room_id)
+    room_lifecycle.added(room_id)
+    logger.info(f"New room created with ID: {room_id}")
+    return room_id
+
+async def ensure_room(room_id: str) -> bool:
+    """
+    Whether this worker has the room, loading it from disk first if it was hibernated or saved
+    before a restart. Concurrent callers for the same room share one load.
+    """
     if room_id in game_sessions:
-        engine = game_sessions[room_id]
-        await manager.broadcast(room_id, {
-            "type": "game_state",
-            "payload": engine.get_state_for_frontend()
-        })
+        return True
+    if not journal_writer or room_id not in room_directory: # Never handed out, or closed for good
+        return False
+    if room_id not in loading_rooms:
+        loading_rooms[room_id] = asyncio.create_task(load_saved_room(room_id))
+    return await asyncio.shield(loading_rooms[room_id])
+
+async def load_saved_room(room_id: str) -> bool:
+    """Rebuilds a room from its snapshot and journal, off the event loop."""
+    try:
+        await asyncio.to_thread(journal_writer.flush) # Its last snapshot may still be queued
+        if room_id in game_sessions:
+            return True
+        if not room_saved(DATA_DIR, room_id): # Dropped, and the delete has now landed
+            return False
+        logger = setup_room_logger(room_id)
+        try:
+            engine, next_seq = await asyncio.to_thread(load_room, DATA_DIR, room_id, logger)
+        except Exception as e:
+            app_logger.error(f"Could not restore room {room_id}: {e}", exc_info=True)
+            release_room_logger(room_id)
+            return False
+        game_sessions[room_id] = engine
+        room_projections[room_id] = RoomProjection()
+        spectator_feeds[room_id] = SpectatorFeed(room_projections[room_id].stream)
+        journal = RoomJournal(journal_writer, room_id, engine, next_seq)
+        journal.attach()
+        room_journals[room_id] = journal
+        start_room_actor(room_id)
+        room_lifecycle.added(room_id, rehydrated=True)
+        engine.mark_all_disconnected() # Nobody is connected to a room that was on disk
+        turn_timers.update(room_id, engine) # Its timers were dropped when it was unloaded
+        engine.logger.info(f"Room {room_id} restored from disk.")
+        return True
+    finally:
+        loading_rooms.pop(room_id, None)
+
+def evict_room(room_id: str, keep: bool):
+    """Tears a room down. With keep=True its snapshot stays on disk so ensure_room() can load it again."""
+    engine = game_sessions.pop(room_id)
+    room_projections.pop(room_id, None)
+    spectator_feeds.pop(room_id).close()
+    room_actors.pop(room_id).stop()
+    turn_timers.forget(room_id)
+    journal = room_journals.pop(room_id, None)
+    if journal:
+        if keep:
+            journal.snapshot()
+        else:
+            journal_writer.delete(room_id)
+    engine.recorder = None # Nothing may touch the journal after this point
+    if not (keep and journal):
+        room_directory.release(room_id)
+    bot_manager.forget_room(room_id)
+    engine.logger.info(f"Room {room_id} {'hibernated' if keep and journal else 'closed'}.")
+    release_room_logger(room_id)
+
+def start_room_actor(room_id: str):
+    actor = RoomActor(room_id, flush=lambda: broadcast_gamestate(room_id),
+                      on_error=lambda e: report_room_error(room_id, e))
+    room_actors[room_id] = actor
+    actor.start()
+
+def report_room_error(room_id: str, error: Exception):
+    """A command failed inside a room's actor: log it and tell the room, as the socket loop used to."""
+    app_logger.error(f"An error occurred in room {room_id}: {error}", exc_info=error)
+    manager.broadcast(room_id, {"type": "error", "message": str(error)})
+
+def room_connections(room_id: str) -> int:
+    """Players' sockets plus watchers; a room with any of them is never evicted."""
+    feed = spectator_feeds.get(room_id)
+    return manager.count(room_id) + (len(feed) if feed else 0)
+
+def parse_seq(value) -> Optional[int]:
+    """Parses a client-supplied sequence number, returning None if it is missing or malformed."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def broadcast_gamestate(room_id: str):
+    """
+    Publishes a new state version and queues its public diff and changed private views for every socket.
+    Also re-arms the room's turn timer and lets a bot act if the seat whose turn it now is belongs to one.
+    Runs on the room's actor, after each batch of commands.
+    """
+    if room_id not in game_sessions:
+        return
+    engine = game_sessions[room_id]
+    room_lifecycle.touch(room_id)
+    with metrics.room_scope(room_id):
+        public_frame, private_frames = room_projections[room_id].update(engine)
+        if public_frame is not None or private_frames: # Nothing changed, nothing to send
+            start = time.perf_counter()
+            manager.broadcast_frames(room_id, public_frame, private_frames)
+            metrics.FANOUT_SECONDS.observe(time.perf_counter() - start)
+        if public_frame is not None:
+            spectator_feeds[room_id].publish()
+        turn_timers.update(room_id, engine)
+        bot_manager.on_state_change(room_id, engine)
+
+def submit_action(room_id: str, player_name: str, action: str, payload: dict, from_client: bool = False) -> bool:
+    """Queues a player action on the room's actor. Returns False if the room is gone or too busy."""
+    actor = room_actors.get(room_id)
+    if actor is None:
+        return False
+    return actor.submit(lambda: apply_action(room_id, player_name, action, payload), from_client)
+
+def apply_action(room_id: str, player_name: str, action: str, payload: dict):
+    """Applies one player action (from a socket or a bot). Runs on the room's actor, which broadcasts afterwards."""
+    engine = game_sessions[room_id]
+    is_host = engine.players and player_name == engine.players[0].name
+    metrics.ACTIONS.inc(1, action if action in KNOWN_ACTIONS else "other")
+    with metrics.room_scope(room_id):
+        if is_host and action == "start_game":
+            engine.start_new_game()
+
+        elif is_host and action == "add_bot":
+            name = bot_manager.add_bot(room_id, engine)
+            if name:
+                engine.logger.info(f"{player_name} added {name} to room {room_id}")
+
+        elif action == "place_bet":
+            amount = payload.get("amount")
+            success, error = engine.place_bet(player_name, amount)
+            if not success:
+                engine.logger.warning(f"Bet error for {player_name}: {error}")
+                if error == "FORBIDDEN_BET": # Also log this specific case to engine log
+                    engine.log_event(f"🚫 {player_name} tried to bet {amount}, but it's not allowed.")
+
+
+        elif action == "play_tile":
+            success, error = engine.play_tile(player_name, payload.get("tile"))
+            if not success:
+                engine.logger.warning(f"Play error for {player_name}: {error}")
+
+def send_catch_up(connection: ClientConnection, since: Optional[int]):
+    """Queues for a single client the diffs (or a full snapshot) it needs to reach the current version."""
+    for frame in room_projections[connection.room_id].catch_up(connection.viewer, since):
+        connection.enqueue(frame)
+
+def send_event_history(connection: ClientConnection, engine: DongDongEngine, payload: dict):
+    """Sends one client a page of event log entries older than the ones it has."""
+    before = parse_seq(payload.get("before")) or engine.event_log.next_id
+    limit = max(1, min(parse_seq(payload.get("limit")) or EVENT_HISTORY_PAGE, EVENT_HISTORY_PAGE))
+    start_id, entries = engine.event_log.page(before, limit)
+    connection.enqueue(encode_message({"type": "event_history", "startId": start_id, "entries": entries,
+                                       "hasMore": start_id > engine.event_log.first_id}))
 
 # --- API Endpoints (for Lobby) ---
 
 @app.post("/room/new")
 async def create_room():
     """Creates a new game room and returns its ID."""
-    room_id = generate_room_id()
-    logger = setup_room_logger(room_id)
-    game_sessions[room_id] = DongDongEngine(logger=logger)
-    logger.info(f"New room created with ID: {room_id}")
-    return {"room_id": room_id}
+    # Each worker hands out IDs it owns; new rooms start at a random worker and move on while it is full
+    first = random.randrange(shard_config.num_workers) if shard_config.enabled else shard_config.worker_id
+    for i in range(shard_config.num_workers):
+        owner = (first + i) % shard_config.num_workers
+        if owner == shard_config.worker_id:
+            room_id = create_local_room()
+        else:
+            try:
+                room_id = await shard_worker.create_remote_room(owner)
+            except asyncio.TimeoutError: # Busy or gone; another worker may still have room
+                room_id = None
+        if room_id is not None:
+            return {"room_id": room_id}
+    raise HTTPException(status_code=503, detail="Server is full, try again later")
 
 @app.get("/room/exists/{room_id}")
 async def room_exists(room_id: str):
     """Checks if a game room exists."""
-    if room_id not in game_sessions:
+    if not room_directory.valid(room_id):
+        exists = False
+    elif shard_config.is_local(room_id):
+        exists = await ensure_room(room_id)
+    else:
+        exists = await shard_worker.remote_room_exists(room_id)
+    if not exists:
         raise HTTPException(status_code=404, detail="Room not found")
     return {"exists": True}
 
+@app.get("/room/watch/{room_id}")
+async def watch_room_events(room_id: str, request: Request):
+    """
+    Server-sent events with the room's public state, at the spectator rate: a game_state snapshot, then
+    state_delta frames. Each batch's last event id names the state version; reconnects resume from Last-Event-ID.
+    """
+    since = request.headers.get("last-event-id")
+    if not room_directory.valid(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    if shard_config.is_local(room_id):
+        exists = await ensure_room(room_id)
+        batches = watch_room(room_id, since)
+    else:
+        exists = await shard_worker.remote_room_exists(room_id)
+        batches = shard_worker.watch_remote(room_id, since)
+    if not exists:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    async def events():
+        async for batch in batches:
+            yield sse_event(batch)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def watch_room(room_id: str, since: Optional[str]) -> AsyncIterator[Optional[Tuple[str, List[str]]]]:
+    """
+    Subscribes an event stream to a room owned by this worker, resuming after event id `since`. Yields
+    frame batches (None while idle) until the watcher falls too far behind or disconnects.
+    """
+    if not await ensure_room(room_id):
+        return
+    engine = game_sessions[room_id]
+    projection = room_projections[room_id]
+    stream = projection.stream
+    watcher = Watcher()
+    watcher.push(stream.event_id(stream.seq), stream.catch_up(stream.resume_point_from_event_id(since)))
+    spectator_feeds[room_id].add(watcher, lambda seq, frames: watcher.push(stream.event_id(seq), frames), stream.seq)
+    room_actors[room_id].submit(engine.add_spectator, from_client=False)
+    try:
+        async for batch in watcher.batches():
+            yield batch
+    finally:
+        feed = spectator_feeds.get(room_id)
+        if feed:
+            feed.discard(watcher)
+        if game_sessions.get(room_id) is engine:
+            room_actors[room_id].submit(engine.remove_spectator, from_client=False)
+
+@app.get("/records")
+async def list_game_records(limit: int = 100):
+    """The most recent finished games, newest first."""
+    game_ids = await asyncio.to_thread(records.list_records)
+    return {"records": game_ids[::-1][:max(0, limit)], "total": len(game_ids)}
+
+@app.get("/records/export")
+async def export_game_records():
+    """Every record as one bundle (see records.py), for offline analysis. Import it with `python records.py import`."""
+    def bundle() -> bytes:
+        out = io.BytesIO()
+        records.export_records(out)
+        return out.getvalue()
+    return Response(await asyncio.to_thread(bundle), media_type="application/octet-stream",
+                    headers={"Content-Disposition": 'attachment; filename="dongdong-records.ddrb"'})
+
+@app.get("/records/{game_id}")
+async def get_game_record(game_id: str):
+    """One game's binary record."""
+    data = await asyncio.to_thread(records.load_record, game_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return Response(data, media_type="application/octet-stream")
+
+@app.get("/records/{game_id}/replay")
+async def replay_game_record(game_id: str, round: int = 1, stack: int = 1):
+    """
+    Streams a finished game as JSON lines (game, round, bet, play, stack and game_over events),
+    starting at any round and stack without replaying what came before.
+    """
+    data = await asyncio.to_thread(records.load_record, game_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    try:
+        record = records.GameRecord(data)
+        if not 1 <= round <= record.num_rounds or not 1 <= stack <= round:
+            raise HTTPException(status_code=400, detail="No such round or stack")
+        # Decoded up front (a game is a few KB) so a damaged record fails here rather than mid-stream
+        lines = [json.dumps(event) + "\n" for event in record.replay(round, stack)]
+    except records.DAMAGED_RECORD_ERRORS:
+        raise HTTPException(status_code=422, detail="Record is damaged")
+    return StreamingResponse(iter(lines), media_type="application/x-ndjson")
+
+@app.get("/bots/stats")
+async def bot_stats():
+    """Bot throughput: decisions and Monte Carlo rollouts per second."""
+    return bot_manager.report()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: answers as soon as the server is listening."""
+    return PlainTextResponse("ok")
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 503 until the warm-up is done, then 200. Both report the startup timings."""
+    report = startup_tracker.report()
+    report["room_ids_in_use"] = len(room_directory)
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Hot-path histograms and counters for this worker, in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/debug/profile/{room_id}")
+async def start_room_profile(room_id: str, seconds: float = 10.0):
+    """Samples the stacks the event loop spends on one room (needs DONGDONG_PROFILING=1)."""
+    if not metrics.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if room_id not in game_sessions:
+        raise HTTPException(status_code=404, detail="Room not found")
+    metrics.profiler.start(room_id, seconds)
+    return metrics.profiler.report()
+
+@app.get("/debug/profile")
+async def room_profile():
+    """The hottest stacks of the current or last room profile, as folded stacks with sample counts."""
+    if not metrics.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return metrics.profiler.report()
+
+@app.get("/rooms/stats")
+async def room_stats():
+    """Rooms in memory, by state, and how many were created, hibernated, reloaded and dropped."""
+    report = room_lifecycle.report()
+    report["rooms_on_disk"] = len(list_saved_rooms(DATA_DIR)) if journal_writer else 0
+    report["room_ids"] = room_directory.report()
+    return report
+
+@app.get("/logs/stats")
+async def log_stats():
+    """Log writer health: records written, queued and dropped, open files and rotations."""
+    return log_writer.report()
+
 # --- WebSocket Endpoint (for Gameplay) ---
 
-async def handle_round_transition(room_id: str, engine: DongDongEngine):
-    """Waits for a few seconds then starts the next round."""
-    await asyncio.sleep(5) # Wait 5 seconds to let players see scores
-    if engine.game_state == GameState.ROUND_OVER: # Check if state hasn't changed
-        engine.start_new_round()
-        await broadcast_gamestate(room_id)
+def on_turn_expired(room_id: str, key: tuple):
+    """
+    A room's turn timer ran out: starts the next round after the scores have been shown, or moves for
+    the player who ran out of time. Checked again on the actor, since a move may have beaten it there.
+    """
+    def expire():
+        engine = game_sessions.get(room_id)
+        if engine is None or turn_key(engine) != key:
+            return
+        if engine.game_state == GameState.ROUND_OVER:
+            engine.start_new_round()
+            if engine.game_state == GameState.GAME_OVER and engine.history and records.ENABLED:
+                data = engine.history.encode([p.score for p in engine.players])
+                asyncio.create_task(save_game_record(room_id, engine, data))
+            return
+        player = engine.get_current_turn_player()
+        if player is None:
+            return
+        action, payload = default_auto_action(engine, player)
+        engine.log_event(f"⏰ {player.name} ran out of time.")
+        apply_action(room_id, player.name, action, payload)
+
+    actor = room_actors.get(room_id)
+    if actor:
+        actor.submit(expire, from_client=False)
+
+async def save_game_record(room_id: str, engine: DongDongEngine, data: bytes):
+    """Writes a finished game's record off the event loop."""
+    try:
+        game_id = await asyncio.to_thread(records.save_record, room_id, data)
+    except Exception as e:
+        app_logger.error(f"Could not save the record of room {room_id}: {e}", exc_info=True)
+        return
+    if engine.logger:
+        engine.logger.info(f"Game record saved as {game_id} ({len(data)} bytes).")
 
 @app.websocket("/ws/{room_id}/{player_name}")
 async def websocket_endpoint(websocket: WebSocket, room_id: str, player_name: str):
-    if room_id not in game_sessions:
+    if not room_directory.valid(room_id):
+        await websocket.close(code=4000, reason="Room not found")
+        return
+    if not shard_config.is_local(room_id):
+        # Another worker owns this room; relay the socket to it over the bus
+        await proxy_websocket(shard_worker.bus, websocket, shard_config.owner_of(room_id), room_id, player_name)
+        return
+    await run_game_session(websocket, room_id, player_name)
+
+async def run_game_session(websocket: WebSocket, room_id: str, player_name: str):
+    """Runs one client's session against a room owned by this worker (local or relayed socket)."""
+    if not await ensure_room(room_id):
         await websocket.close(code=4000, reason="Room not found")
         return
         
@@ -148,71 +637,100 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str, player_name: st
         await websocket.close(code=4001, reason="Name is already taken by an active player.")
         return
 
-    await manager.connect(websocket, room_id)
-    
-    # Handle player joining logic
-    player_to_rejoin = None
-    # Check if the player was an original player and is marked as disconnected
-    if player_name in engine.original_players:
-        player_to_rejoin = next((p for p in engine.players if p.name == player_name and p.disconnected), None)
-
-    if player_to_rejoin:
-        player_to_rejoin.disconnected = False
-        engine.log_event(f"🔌 {player_name} reconnected.")
-        engine.message = f"{player_name} reconnected."
-    elif engine.game_state == GameState.LOBBY and len(engine.players) < 4:
-        # This check is now somewhat redundant due to the check above, but it's good for robustness
-        if any(p.name == player_name for p in engine.players):
-             await websocket.close(code=4001, reason="Name already taken")
-             manager.disconnect(websocket, room_id)
-             return
-        engine.add_player(player_name)
-    else:
-        if player_name not in engine.spectators and not any(p.name == player_name for p in engine.players):
-            engine.add_spectator(player_name)
-            
-    await broadcast_gamestate(room_id)
+    projection = room_projections[room_id]
+    actor = room_actors[room_id]
+    connection = await manager.connect(websocket, room_id, player_name,
+                                       resync=lambda: projection.catch_up(player_name, None))
+    since = projection.stream.resume_point(parse_seq(websocket.query_params.get("since")),
+                                           websocket.query_params.get("epoch"))
+    actor.submit(lambda: join_room(room_id, engine, connection, since), from_client=False)
 
     try:
         while True:
             data = await websocket.receive_text()
+            metrics.MESSAGES.inc(1, "in")
+            metrics.MESSAGE_BYTES.inc(len(data), "in")
+            if not connection.limiter.take():
+                metrics.COMMANDS_REJECTED.inc(1, "rate_limited")
+                continue # Dropped before it can cost the room anything
             message = json.loads(data)
             action = message.get("action")
             payload = message.get("payload", {})
-            
-            is_host = engine.players and player_name == engine.players[0].name
-            
-            if is_host and action == "start_game":
-                engine.start_new_game()
-
-            elif action == "place_bet":
-                amount = payload.get("amount")
-                success, error = engine.place_bet(player_name, amount)
-                if not success:
-                    engine.logger.warning(f"Bet error for {player_name}: {error}")
-                    if error == "FORBIDDEN_BET": # Also log this specific case to engine log
-                        engine.log_event(f"🚫 {player_name} tried to bet {amount}, but it's not allowed.")
-
-
-            elif action == "play_tile":
-                success, error = engine.play_tile(player_name, payload.get("tile"))
-                if not success:
-                    engine.logger.warning(f"Play error for {player_name}: {error}")
-            
-            await broadcast_gamestate(room_id)
-
-            # If the last move ended the round, trigger auto-advance
-            if action == "play_tile" and engine.game_state == GameState.ROUND_OVER:
-                asyncio.create_task(handle_round_transition(room_id, engine))
-
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, room_id)
-        engine.handle_disconnect(player_name)
-        engine.logger.info(f"{player_name} disconnected from room {room_id}")
-        await broadcast_gamestate(room_id)
+
+            if action == "sync":
+                # Client detected a gap in the sequence; resend only to that client
+                send_catch_up(connection, projection.stream.resume_point(parse_seq(payload.get("since")),
+                                                                         payload.get("epoch")))
+                continue
+
+            if action == "event_history":
+                send_event_history(connection, engine, payload)
+                continue
+
+            if not submit_action(room_id, player_name, action, payload, from_client=True):
+                connection.enqueue(encode_message({"type": "error", "message": "The room is busy, try again."}))
+
+    except WebSocketDisconnect as e:
+        manager.disconnect(connection)
+        if e.code == 1012 and journal_writer:
+            return # Server is restarting; the room is restored from its journal with everyone disconnected
+        actor.submit(lambda: leave_room(room_id, engine, connection), from_client=False)
     except Exception as e:
         engine.logger.error(f"An error occurred in room {room_id}: {e}", exc_info=True)
-        await manager.broadcast(room_id, {"type": "error", "message": str(e)})
+        manager.broadcast(room_id, {"type": "error", "message": str(e)})
+    finally:
+        manager.disconnect(connection) # No-op if already removed
+        feed = spectator_feeds.get(room_id)
+        if feed:
+            feed.discard(connection)
+
+def join_room(room_id: str, engine: DongDongEngine, connection: ClientConnection, since: Optional[int]):
+    """Adds (or reconnects) the connection's player or spectator. Runs on the room's actor."""
+    player_name = connection.viewer
+    if connection.closed:
+        return # Left before we got to it
+
+    # Handle player joining logic
+    player_to_rejoin = None
+    spectating = False
+    # Check if the player was an original player and is marked as disconnected
+    if player_name in engine.original_players:
+        player_to_rejoin = next((p for p in engine.players if p.name == player_name and p.disconnected), None)
 
-# --- Static Files (Must be last) ---
-app.mount("/", StaticFiles(directory="frontend", html=True), name="static")
+    if player_to_rejoin:
+        engine.reconnect_player(player_name)
+    elif engine.game_state == GameState.LOBBY and len(engine.players) < 4:
+        # Someone else may have taken the name since this socket connected
+        if any(p.name == player_name for p in engine.players):
+            connection.close(code=4001, reason="Name already taken") # Before disconnect(), which marks it closed
+            manager.disconnect(connection)
+            return
+        engine.add_player(player_name)
+    elif not any(p.name == player_name for p in engine.players):
+        engine.add_spectator(player_name)
+        spectating = True
+    connection.joined = True
+
+    # Everyone else gets the diff; the (re)connecting client catches up from the last version it saw
+    broadcast_gamestate(room_id)
+    send_catch_up(connection, since)
+    connection.awaiting_catch_up = False
+    if spectating:
+        watch_with_socket(room_id, connection)
+
+def watch_with_socket(room_id: str, connection: ClientConnection):
+    """Moves a spectator's socket off the per-action broadcast and onto the room's spectator feed."""
+    manager.detach(connection)
+    def send(seq: int, frames: List[str]):
+        for frame in frames:
+            connection.enqueue(frame)
+    spectator_feeds[room_id].add(connection, send, room_projections[room_id].seq)
+
+def leave_room(room_id: str, engine: DongDongEngine, connection: ClientConnection):
+    """Marks the connection's player disconnected (or removes the spectator). Runs on the room's actor."""
+    if not connection.joined:
+        return # Rejected, or never got as far as joining
+    engine.handle_disconnect(connection.viewer, bot_manager.bot_seats(room_id))
+    engine.logger.info(f"{connection.viewer} disconnected from room {room_id}")
+
+startup_tracker.mark("imported")
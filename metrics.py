@@ -0,0 +1,238 @@
+"""
+Low-overhead instrumentation: counters, gauges and histograms rendered in the Prometheus text
+format, plus an opt-in sampling profiler that collects the hot stacks of a single room.
+
+Recording a value is a couple of dict lookups and a bisect; nothing is exported until /metrics is
+scraped. With several workers each process serves its own numbers.
+"""
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter as _Tally
+from typing import Callable, Dict, List, Optional, Tuple
+
+PROFILING_ENABLED = os.environ.get("DONGDONG_PROFILING", "0") == "1"
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILE_MAX_SECONDS = 60.0
+
+# Seconds: 50us up to 1s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32)
+
+# --- Metric Types ---
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in self.values.items()]
+
+class Gauge(Metric):
+    """A value read when the metrics are scraped."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {self.read()}"]
+
+class CounterFunc(Gauge):
+    """A running total kept elsewhere (e.g. a stats dict), read when the metrics are scraped."""
+    kind = "counter"
+
+class _Series:
+    """One label combination of a histogram: per-bucket counts (+Inf last), sum and count."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        self.series: Dict[Tuple[str, ...], _Series] = {}
+        if not labels:
+            self.observe = self.labels().observe # Unlabelled: skip the lookup on the hot path
+
+    def labels(self, *values: str) -> _Series:
+        """The series for one label combination. Hot paths should look it up once and keep it."""
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = _Series(self.buckets)
+        return series
+
+    def observe(self, value: float, *labels: str):
+        self.labels(*labels).observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {series.sum}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {series.count}")
+        return lines
+
+REGISTRY: List[Metric] = []
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+# --- Hot-Path Metrics ---
+
+ENGINE_ACTION_SECONDS = Histogram("dongdong_engine_action_seconds", "Time spent in one engine action.", ("action",))
+STATE_BUILD_SECONDS = Histogram("dongdong_state_build_seconds", "Time to build a room's public and private views.")
+ENCODE_SECONDS = Histogram("dongdong_encode_seconds", "Time to diff and JSON-encode a room's frames.")
+FANOUT_SECONDS = Histogram("dongdong_fanout_seconds", "Time to queue one broadcast on every socket in a room.")
+SEND_QUEUE_DEPTH = Histogram("dongdong_send_queue_depth", "Frames already waiting when a frame is queued on a socket.",
+                             buckets=DEPTH_BUCKETS)
+MESSAGES = Counter("dongdong_messages_total", "WebSocket messages.", ("direction",))
+MESSAGE_BYTES = Counter("dongdong_message_bytes_total", "WebSocket payload bytes.", ("direction",))
+ACTIONS = Counter("dongdong_actions_total", "Player and bot actions received.", ("action",))
+COMMAND_BATCH_SIZE = Histogram("dongdong_command_batch_size", "Commands a room applied between two broadcasts.",
+                               buckets=(1, 2, 4, 8, 16, 32))
+COMMANDS_REJECTED = Counter("dongdong_commands_rejected_total", "Client messages dropped before reaching a room.",
+                            ("reason",))
+
+def timed(histogram: Histogram, *labels: str):
+    """Decorator that records a function's duration in `histogram`."""
+    def decorator(function):
+        series = histogram.labels(*labels)
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                series.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# --- Sampling Profiler ---
+
+current_room: Optional[str] = None
+"""Room the event loop is working on right now; set around room work so samples can be attributed."""
+
+class room_scope:
+    """`with room_scope(room_id):` marks the enclosed work as belonging to that room."""
+    __slots__ = ("room_id", "previous")
+
+    def __init__(self, room_id: str):
+        self.room_id = room_id
+
+    def __enter__(self):
+        global current_room
+        self.previous, current_room = current_room, self.room_id
+
+    def __exit__(self, *exc_info):
+        global current_room
+        current_room = self.previous
+
+class RoomProfiler:
+    """
+    Samples the event loop thread's stack every few milliseconds, counting only the samples taken
+    while it is working on the profiled room. Results are folded stacks ("a;b;c count").
+    """
+    def __init__(self):
+        self.room_id: Optional[str] = None
+        self.stacks: "_Tally[str]" = _Tally()
+        self.samples = 0
+        self.started_at = 0.0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, room_id: str, seconds: float):
+        """Starts profiling `room_id`. Must be called from the event loop thread."""
+        self.stop()
+        self.room_id = room_id
+        self.stacks = _Tally()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self.stop_event = threading.Event()
+        loop_thread = threading.get_ident()
+        self.thread = threading.Thread(target=self._run, args=(loop_thread, min(seconds, PROFILE_MAX_SECONDS)),
+                                       name="room-profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.running:
+            self.stop_event.set()
+            self.thread.join()
+
+    def _run(self, loop_thread: int, seconds: float):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not self.stop_event.wait(PROFILE_INTERVAL):
+            if current_room != self.room_id:
+                continue
+            frame = sys._current_frames().get(loop_thread)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, top: int = 50) -> dict:
+        return {
+            "room_id": self.room_id,
+            "running": self.running,
+            "seconds": round(time.monotonic() - self.started_at, 1) if self.room_id else 0,
+            "samples": self.samples,
+            "interval_ms": PROFILE_INTERVAL * 1000,
+            "stacks": [f"{stack} {count}" for stack, count in self.stacks.most_common(top)],
+        }
+
+profiler = RoomProfiler()
@@ -0,0 +1,177 @@
+"""
+Durable rooms: an append-only journal of engine actions per room plus periodic snapshots.
+
+All disk I/O happens on a single background thread that batches whatever has queued up, so
+recording a move only costs a queue put on the event loop. On startup, each room is rebuilt from
+its latest snapshot followed by the journal entries written after it.
+"""
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from dong_dong_engine import DongDongEngine
+
+DATA_DIR = os.environ.get("DONGDONG_DATA_DIR", "Data")
+SNAPSHOT_EVERY = 200     # Journal entries between periodic snapshots
+MAX_BATCH = 512          # Queued writes handled per batch
+FSYNC = os.environ.get("DONGDONG_FSYNC", "0") == "1"
+ENABLED = os.environ.get("DONGDONG_PERSIST", "1") == "1"
+
+logger = logging.getLogger("app_logger")
+
+def _journal_path(data_dir: str, room_id: str) -> str:
+    return os.path.join(data_dir, f"{room_id}.journal")
+
+def _snapshot_path(data_dir: str, room_id: str) -> str:
+    return os.path.join(data_dir, f"{room_id}.snap")
+
+# --- Background Writer ---
+
+class JournalWriter:
+    """Single background thread that owns every journal and snapshot file."""
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self.thread.start()
+
+    def append(self, room_id: str, entry: dict):
+        self.queue.put(("append", room_id, entry))
+
+    def snapshot(self, room_id: str, snapshot: dict):
+        self.queue.put(("snapshot", room_id, snapshot))
+
+    def delete(self, room_id: str):
+        self.queue.put(("delete", room_id, None))
+
+    def flush(self):
+        """Blocks until everything queued so far is on disk."""
+        done = threading.Event()
+        self.queue.put(("flush", None, done))
+        done.wait()
+
+    def close(self):
+        """Flushes everything queued so far and stops the writer."""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch([item for item in batch if item is not None and item[0] != "flush"])
+            except Exception as e:
+                logger.error(f"Journal write failed: {e}", exc_info=True)
+            for item in batch:
+                if item is not None and item[0] == "flush":
+                    item[2].set()
+            if None in batch:
+                return
+
+    def _write_batch(self, batch: List[tuple]):
+        # Consecutive appends for a room become a single write; snapshots/deletes keep their place in line
+        pending: Dict[str, List[str]] = {}
+        for kind, room_id, data in batch:
+            if kind == "append":
+                pending.setdefault(room_id, []).append(json.dumps(data, separators=(",", ":"), ensure_ascii=False))
+                continue
+            if room_id in pending:
+                self._flush_room(room_id, pending.pop(room_id))
+            if kind == "snapshot":
+                self._write_snapshot(room_id, data)
+            elif kind == "delete":
+                for path in (_journal_path(self.data_dir, room_id), _snapshot_path(self.data_dir, room_id)):
+                    if os.path.exists(path):
+                        os.remove(path)
+        for room_id, lines in pending.items():
+            self._flush_room(room_id, lines)
+
+    def _flush_room(self, room_id: str, lines: List[str]):
+        with open(_journal_path(self.data_dir, room_id), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            if FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _write_snapshot(self, room_id: str, snapshot: dict):
+        path = _snapshot_path(self.data_dir, room_id)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"), ensure_ascii=False)
+            if FSYNC:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        # Everything in the journal so far is covered by the snapshot (writes are ordered on this thread)
+        open(_journal_path(self.data_dir, room_id), "w").close()
+
+# --- Per-Room Journal ---
+
+class RoomJournal:
+    """Records one room's engine actions and decides when to snapshot."""
+    def __init__(self, writer: JournalWriter, room_id: str, engine: DongDongEngine, next_seq: int = 1):
+        self.writer = writer
+        self.room_id = room_id
+        self.engine = engine
+        self.next_seq = next_seq
+        self.since_snapshot = 0
+
+    def attach(self):
+        self.engine.recorder = self.record
+
+    def record(self, action: str, args: list):
+        self.writer.append(self.room_id, {"n": self.next_seq, "a": action, "p": args})
+        self.next_seq += 1
+        self.since_snapshot += 1
+        # Snapshot periodically and at round boundaries, once the action has been applied
+        if self.since_snapshot >= SNAPSHOT_EVERY or action in ("start_new_game", "start_new_round"):
+            self.since_snapshot = 0
+            asyncio.get_running_loop().call_soon(self.snapshot)
+
+    def snapshot(self):
+        self.writer.snapshot(self.room_id, {"seq": self.next_seq - 1, "engine": self.engine.to_snapshot()})
+
+# --- Recovery ---
+
+def load_room(data_dir: str, room_id: str, logger: Optional[logging.Logger] = None) -> Tuple[DongDongEngine, int]:
+    """Rebuilds a room from its snapshot and journal tail. Returns the engine and the next journal seq."""
+    with open(_snapshot_path(data_dir, room_id), encoding="utf-8") as f:
+        snapshot = json.load(f)
+    engine = DongDongEngine.from_snapshot(snapshot["engine"])
+    last_seq = snapshot["seq"]
+
+    journal_path = _journal_path(data_dir, room_id)
+    if os.path.exists(journal_path):
+        with open(journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break # Torn write at the tail from a crash
+                if entry["n"] <= last_seq:
+                    continue
+                try:
+                    engine.apply_event(entry["a"], entry["p"])
+                except Exception:
+                    pass # The action failed the same way when it was first applied
+                last_seq = entry["n"]
+
+    engine.logger = logger
+    return engine, last_seq + 1
+
+def room_saved(data_dir: str, room_id: str) -> bool:
+    return os.path.exists(_snapshot_path(data_dir, room_id))
+
+def list_saved_rooms(data_dir: str = DATA_DIR) -> List[str]:
+    if not os.path.isdir(data_dir):
+        return []
+    return sorted(name[:-len(".snap")] for name in os.listdir(data_dir) if name.endswith(".snap"))
@@ -0,0 +1,75 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import bitboard
+import metrics
+from dong_dong_engine import DongDongEngine, GameState
+from state_sync import StateStream, encode_message
+
+# --- Views ---
+
+def public_view(state: dict) -> dict:
+    """Strips every hand out of a get_state_for_frontend() dict, leaving only what anyone may see."""
+    public = dict(state)
+    public["players"] = [
+        {**{k: v for k, v in p.items() if k != "hand"}, "handCount": len(p["hand"])}
+        for p in state["players"]
+    ]
+    return public
+
+def private_views(engine: DongDongEngine, state: dict) -> Dict[str, dict]:
+    """Builds the small per-player view: their own hand and, on their turn, the tiles they may play."""
+    turn_player = engine.get_current_turn_player()
+    views = {}
+    for player, player_dict in zip(engine.players, state["players"]):
+        valid_plays: List[dict] = []
+        if engine.game_state == GameState.AWAITING_PLAY and player is turn_player:
+            valid_plays = list(bitboard.tile_dicts(engine.valid_play_mask(player)))
+        views[player.name] = {"hand": player_dict["hand"], "validPlays": valid_plays}
+    return views
+
+# --- Room Projection ---
+
+class RoomProjection:
+    """
+    Splits a room's state into one shared public stream plus per-player private views.
+    Each view is encoded once per state version; the resulting text is reused for every socket.
+    """
+    def __init__(self):
+        self.stream = StateStream()
+        self.private: Dict[str, dict] = {}
+        self.private_frames: Dict[str, str] = {}
+
+    @property
+    def seq(self) -> int:
+        return self.stream.seq
+
+    def update(self, engine: DongDongEngine) -> Tuple[Optional[str], Dict[str, str]]:
+        """
+        Publishes the engine's current state.
+        Returns the public frame (None if unchanged) and the private frames that changed, keyed by player name.
+        """
+        start = time.perf_counter()
+        state = engine.get_state_for_frontend()
+        public = public_view(state)
+        views = private_views(engine, state)
+        built = time.perf_counter()
+
+        public_frame = self.stream.publish(public)
+        changed: Dict[str, str] = {}
+        for name, view in views.items():
+            if self.private.get(name) != view:
+                self.private[name] = view
+                self.private_frames[name] = encode_message({"type": "private_state", "seq": self.seq, "payload": view})
+                changed[name] = self.private_frames[name]
+
+        metrics.STATE_BUILD_SECONDS.observe(built - start)
+        metrics.ENCODE_SECONDS.observe(time.perf_counter() - built)
+        return public_frame, changed
+
+    def catch_up(self, viewer: str, since: Optional[int]) -> List[str]:
+        """Returns the frames a viewer at version `since` needs, including their private view if they have one."""
+        frames = self.stream.catch_up(since)
+        if viewer in self.private_frames:
+            frames.append(self.private_frames[viewer])
+        return frames
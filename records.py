@@ -0,0 +1,344 @@
+"""
+Game records: a compact binary file for every finished game, for replays and offline analysis.
+
+The engine fills a GameHistory as the game is played (the seed, every deal, bet and play). When the
+game reaches GAME_OVER it is encoded as below and saved as records/{game_id}.ddr. Integers are
+big-endian; tiles are ids from bitboard.py and colors are indexes into bitboard.COLOR_NAMES.
+
+    header   "DDGR" version:u8 players:u8 rounds:u8 reserved:u8 seed:u64 ended_at:u32
+    names    players x (length:u8, utf-8)
+    scores   players x i16                          final scores
+    index    rounds x u32                           offset of each round block in the file
+    round    number:u8 master:u8 first_bettor:u8 stacks:u8
+             players x i16                          scores as the round started
+             players x number x u8                  hands as dealt
+             players x u8                           bets (255 = none)
+             stacks x (leader:u8, players x u8)     tiles in play order, starting with the leader
+
+Stack blocks have a fixed size, so any round or stack is one seek away and replaying from there
+never touches the rest of the game. Bundles (.ddrb) pack many records for bulk export and import:
+"DDGB" then, per record, id length:u8, id, record length:u32, record.
+
+    python records.py export games.ddrb
+    python records.py import games.ddrb
+    python records.py show 20250101120000-1234 --round 5
+"""
+import copy
+import json
+import os
+import re
+import struct
+import time
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import bitboard
+
+RECORDS_DIR = os.environ.get("DONGDONG_RECORDS_DIR",
+                             os.path.join(os.environ.get("DONGDONG_DATA_DIR", "Data"), "records"))
+ENABLED = os.environ.get("DONGDONG_RECORDS", "1") == "1"
+
+MAGIC = b"DDGR"
+BUNDLE_MAGIC = b"DDGB"
+VERSION = 1
+NO_BET = 255
+_HEADER = struct.Struct(">4sBBBBQI")
+_ROUND_HEADER = struct.Struct(">BBBB")
+_GAME_ID = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+DAMAGED_RECORD_ERRORS = (ValueError, struct.error, IndexError) # What reading a corrupt record can raise
+
+# --- Recording ---
+
+class GameHistory:
+    """Everything that happened in the current game, kept compact so it can ride along in snapshots."""
+    def __init__(self, seed: int, names: List[str]):
+        self.seed = seed
+        self.names = list(names)
+        # Per round: [number, master, first_bettor, scores, hands, bets, stacks]
+        #   hands: [seat] tile ids, bets: [seat] bet, stacks: [[leader, [tile ids in play order]], ...]
+        self.rounds: List[list] = []
+
+    def start_round(self, number: int, master: int, first_bettor: int, scores: List[int], hands: List[List[int]]):
+        self.rounds.append([number, master, first_bettor, list(scores), hands, [NO_BET] * len(self.names), []])
+
+    def bet(self, seat: int, amount: int):
+        self.rounds[-1][5][seat] = amount
+
+    def play(self, seat: int, tid: int):
+        stacks = self.rounds[-1][6]
+        if not stacks or len(stacks[-1][1]) == len(self.names):
+            stacks.append([seat, []]) # Whoever plays first leads the stack
+        stacks[-1][1].append(tid)
+
+    def to_list(self) -> list:
+        """A copy: snapshots are serialized later on the journal thread, while the game keeps appending."""
+        return [self.seed, list(self.names), copy.deepcopy(self.rounds)]
+
+    @classmethod
+    def from_list(cls, data: Optional[list]) -> Optional["GameHistory"]:
+        if data is None:
+            return None
+        history = cls(data[0], data[1])
+        history.rounds = data[2]
+        return history
+
+    def encode(self, final_scores: List[int], ended_at: Optional[int] = None) -> bytes:
+        n = len(self.names)
+        out = bytearray(_HEADER.pack(MAGIC, VERSION, n, len(self.rounds), 0, self.seed & (2 ** 64 - 1),
+                                     int(ended_at if ended_at is not None else time.time())))
+        for name in self.names:
+            encoded = name.encode("utf-8")[:255]
+            out += bytes((len(encoded),)) + encoded
+        out += struct.pack(f">{n}h", *final_scores)
+        index_at = len(out)
+        out += bytes(4 * len(self.rounds))
+        for i, (number, master, first_bettor, scores, hands, bets, stacks) in enumerate(self.rounds):
+            struct.pack_into(">I", out, index_at + 4 * i, len(out))
+            out += _ROUND_HEADER.pack(number, master, first_bettor, len(stacks))
+            out += struct.pack(f">{n}h", *scores)
+            for hand in hands:
+                out += bytes(hand).ljust(number, b"\xff") # Short only if the deck ran out
+            out += bytes(bets)
+            for leader, tiles in stacks:
+                out += bytes((leader,)) + bytes(tiles).ljust(n, b"\xff")
+        return bytes(out)
+
+# --- Reading and Replay ---
+
+def _tile(tid: int) -> dict:
+    return {"number": bitboard.tile_number(tid), "color": bitboard.COLOR_NAMES[bitboard.tile_color(tid)]}
+
+class GameRecord:
+    """Reads an encoded game. The header is parsed and the round offsets checked up front; rounds are decoded when asked for."""
+    def __init__(self, data: bytes):
+        if len(data) < _HEADER.size:
+            raise ValueError("Truncated game record")
+        magic, version, self.num_players, self.num_rounds, _, self.seed, self.ended_at = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a game record")
+        self.data = data
+        pos = _HEADER.size
+        self.names: List[str] = []
+        for _ in range(self.num_players):
+            if pos >= len(data) or pos + 1 + data[pos] > len(data):
+                raise ValueError("Truncated game record")
+            length = data[pos]
+            self.names.append(data[pos + 1:pos + 1 + length].decode("utf-8"))
+            pos += 1 + length
+        n = self.num_players
+        if pos + 2 * n + 4 * self.num_rounds > len(data):
+            raise ValueError("Truncated game record")
+        self.final_scores = list(struct.unpack_from(f">{n}h", data, pos))
+        pos += 2 * n
+        self.index = struct.unpack_from(f">{self.num_rounds}I", data, pos)
+        rounds_at = pos + 4 * self.num_rounds
+        for offset in self.index:
+            self._check_round(offset, rounds_at)
+
+    def _check_round(self, offset: int, rounds_at: int):
+        """Rejects an index entry whose round block lies outside the record, so round() can't read past it."""
+        data, n = self.data, self.num_players
+        if not rounds_at <= offset <= len(data) - _ROUND_HEADER.size:
+            raise ValueError("Bad round offset in game record")
+        number, master, first_bettor, num_stacks = _ROUND_HEADER.unpack_from(data, offset)
+        if master >= len(bitboard.COLOR_NAMES) or first_bettor >= max(n, 1):
+            raise ValueError("Bad round header in game record")
+        if offset + _ROUND_HEADER.size + 2 * n + n * number + n + num_stacks * (1 + n) > len(data):
+            raise ValueError("Truncated game record")
+
+    def round(self, number: int) -> dict:
+        """Decodes one round (1-based), straight from its offset."""
+        if not 1 <= number <= self.num_rounds:
+            raise IndexError(f"Round {number} is not in this record")
+        data, n = self.data, self.num_players
+        pos = self.index[number - 1]
+        rnd, master, first_bettor, num_stacks = _ROUND_HEADER.unpack_from(data, pos)
+        pos += _ROUND_HEADER.size
+        scores = list(struct.unpack_from(f">{n}h", data, pos))
+        pos += 2 * n
+        hands = [[t for t in data[pos + seat * rnd:pos + (seat + 1) * rnd] if t != 255] for seat in range(n)]
+        pos += n * rnd
+        bets = list(data[pos:pos + n])
+        pos += n
+        stacks = []
+        for _ in range(num_stacks):
+            stacks.append((data[pos], [t for t in data[pos + 1:pos + 1 + n] if t != 255]))
+            pos += 1 + n
+        return {"number": rnd, "master": master, "first_bettor": first_bettor, "scores": scores,
+                "hands": hands, "bets": bets, "stacks": stacks}
+
+    def stack_winner(self, master: int, leader: int, tiles: List[int]) -> int:
+        """Seat that won a stack, using the same rule as the engine."""
+        winner = bitboard.stack_winner(tiles, master, bitboard.tile_color(tiles[0]), 0)
+        return (leader + winner) % self.num_players
+
+    def replay(self, from_round: int = 1, from_stack: int = 1) -> Iterator[dict]:
+        """
+        Yields the game as events, starting at a round and stack. The first round event carries the
+        hands, bets and stacks won at that point, so a client can start drawing from there.
+        """
+        names = self.names
+        n = self.num_players
+        yield {"type": "game", "players": names, "seed": self.seed, "rounds": self.num_rounds,
+               "endedAt": self.ended_at, "finalScores": dict(zip(names, self.final_scores))}
+        for number in range(from_round, self.num_rounds + 1):
+            rnd = self.round(number)
+            first = from_stack if number == from_round else 1
+            hands = [list(hand) for hand in rnd["hands"]]
+            won = [0] * n
+            for leader, tiles in rnd["stacks"][:first - 1]: # Fast-forward without emitting anything
+                won[self.stack_winner(rnd["master"], leader, tiles)] += 1
+                for i, tid in enumerate(tiles):
+                    hands[(leader + i) % n].remove(tid)
+            event = {"type": "round", "round": rnd["number"], "stack": first,
+                     "masterColor": bitboard.COLOR_NAMES[rnd["master"]],
+                     "scores": dict(zip(names, rnd["scores"])),
+                     "hands": {name: [_tile(t) for t in hand] for name, hand in zip(names, hands)}}
+            if first > 1:
+                event["bets"] = {name: bet for name, bet in zip(names, rnd["bets"]) if bet != NO_BET}
+                event["stacksWon"] = dict(zip(names, won))
+            yield event
+            if first == 1:
+                for i in range(n):
+                    seat = (rnd["first_bettor"] + i) % n
+                    if rnd["bets"][seat] != NO_BET:
+                        yield {"type": "bet", "player": names[seat], "amount": rnd["bets"][seat]}
+            for k, (leader, tiles) in enumerate(rnd["stacks"][first - 1:], start=first):
+                for i, tid in enumerate(tiles):
+                    yield {"type": "play", "player": names[(leader + i) % n], "tile": _tile(tid)}
+                if len(tiles) == n:
+                    yield {"type": "stack", "stack": k, "winner": names[self.stack_winner(rnd["master"], leader, tiles)]}
+        yield {"type": "game_over", "scores": dict(zip(names, self.final_scores))}
+
+# --- Storage ---
+
+def valid_game_id(game_id: str) -> bool:
+    return bool(_GAME_ID.match(game_id))
+
+def _record_path(records_dir: str, game_id: str) -> str:
+    if not valid_game_id(game_id):
+        raise ValueError(f"Invalid game id {game_id!r}")
+    return os.path.join(records_dir, f"{game_id}.ddr")
+
+def save_record(room_id: str, data: bytes, records_dir: str = RECORDS_DIR) -> str:
+    """Writes a finished game's record. Returns its game id (end time, then room ID)."""
+    ended_at = _HEADER.unpack_from(data)[6]
+    game_id = f"{time.strftime('%Y%m%d%H%M%S', time.gmtime(ended_at))}-{room_id}"
+    _write(records_dir, game_id, data)
+    return game_id
+
+def _write(records_dir: str, game_id: str, data: bytes):
+    os.makedirs(records_dir, exist_ok=True)
+    path = _record_path(records_dir, game_id)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+
+def load_record(game_id: str, records_dir: str = RECORDS_DIR) -> Optional[bytes]:
+    try:
+        with open(_record_path(records_dir, game_id), "rb") as f:
+            return f.read()
+    except (OSError, ValueError):
+        return None
+
+def list_records(records_dir: str = RECORDS_DIR) -> List[str]:
+    """Game ids, oldest first."""
+    if not os.path.isdir(records_dir):
+        return []
+    return sorted(name[:-len(".ddr")] for name in os.listdir(records_dir) if name.endswith(".ddr"))
+
+def export_records(out: BinaryIO, records_dir: str = RECORDS_DIR, game_ids: Optional[List[str]] = None) -> int:
+    """Writes records into a bundle. Returns how many were written."""
+    out.write(BUNDLE_MAGIC)
+    count = 0
+    for game_id in game_ids if game_ids is not None else list_records(records_dir):
+        data = load_record(game_id, records_dir)
+        if data is None:
+            continue
+        encoded = game_id.encode()
+        out.write(bytes((len(encoded),)) + encoded + struct.pack(">I", len(data)) + data)
+        count += 1
+    return count
+
+def iter_bundle(data: bytes) -> Iterator[Tuple[str, bytes]]:
+    """(game id, record) pairs from a bundle held in memory, for offline analysis."""
+    if data[:4] != BUNDLE_MAGIC:
+        raise ValueError("Not a record bundle")
+    pos = 4
+    while pos < len(data):
+        length = data[pos]
+        if pos + 1 + length + 4 > len(data):
+            raise ValueError("Truncated record bundle")
+        game_id = data[pos + 1:pos + 1 + length].decode("utf-8", "replace") # A mangled id fails valid_game_id()
+        pos += 1 + length
+        size, = struct.unpack_from(">I", data, pos)
+        pos += 4
+        yield game_id, data[pos:pos + size] # Short if the bundle is cut; GameRecord() rejects it
+        pos += size
+
+def import_records(data: bytes, records_dir: str = RECORDS_DIR, overwrite: bool = False) -> Tuple[int, int]:
+    """Stores every valid record in a bundle, skipping damaged ones. Returns (imported, skipped)."""
+    if data[:4] != BUNDLE_MAGIC:
+        raise ValueError("Not a record bundle")
+    existing = set() if overwrite else set(list_records(records_dir))
+    imported = skipped = 0
+    entries = iter_bundle(data)
+    while True:
+        try:
+            game_id, record = next(entries)
+        except StopIteration:
+            break
+        except ValueError: # The bundle is cut short; keep what came before the cut
+            skipped += 1
+            break
+        if game_id in existing or not valid_game_id(game_id):
+            skipped += 1
+            continue
+        try:
+            GameRecord(record) # Validates the header, names and round offsets
+        except DAMAGED_RECORD_ERRORS:
+            skipped += 1
+            continue
+        _write(records_dir, game_id, record)
+        imported += 1
+    return imported, skipped
+
+# --- Command Line ---
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Export, import and inspect Dong Dong game records.")
+    parser.add_argument("--dir", default=RECORDS_DIR, help="Records directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write every record into a bundle")
+    export.add_argument("bundle")
+    imports = commands.add_parser("import", help="Store the records from a bundle")
+    imports.add_argument("bundle")
+    imports.add_argument("--overwrite", action="store_true")
+    show = commands.add_parser("show", help="Print a game as JSON lines")
+    show.add_argument("game_id")
+    show.add_argument("--round", type=int, default=1)
+    show.add_argument("--stack", type=int, default=1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        with open(args.bundle, "wb") as f:
+            count = export_records(f, args.dir)
+        print(f"Exported {count} records in {time.perf_counter() - start:.2f}s")
+    elif args.command == "import":
+        with open(args.bundle, "rb") as f:
+            imported, skipped = import_records(f.read(), args.dir, args.overwrite)
+        print(f"Imported {imported} records ({skipped} skipped) in {time.perf_counter() - start:.2f}s")
+    else:
+        data = load_record(args.game_id, args.dir)
+        if data is None:
+            parser.error(f"No record {args.game_id}")
+        try:
+            record = GameRecord(data)
+        except ValueError as e:
+            parser.error(f"{args.game_id}: {e}")
+        for event in record.replay(args.round, args.stack):
+            print(json.dumps(event))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Room directory: hands out room codes without collisions and answers "is this room in use?" in O(1).
+
+Fresh codes come from a keyed Feistel permutation of the whole code space, so consecutive rooms get
+unrelated-looking codes and every code is issued once before any repeats. Codes of closed rooms come
+back after a cooldown, so an old link never lands in a stranger's new game right away. Allocation
+costs the same whether the directory is empty or nearly full, and returns None when it is full.
+"""
+import os
+import random
+import string
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Set, Tuple
+
+ROOM_CODE_LENGTH = int(os.environ.get("DONGDONG_ROOM_CODE_LENGTH", "4"))         # Characters per room code
+ROOM_CODE_ALPHABET = os.environ.get("DONGDONG_ROOM_CODE_ALPHABET", string.digits)  # Characters codes are made of
+RECYCLE_COOLDOWN = float(os.environ.get("DONGDONG_ROOM_ID_COOLDOWN", "600"))     # Seconds before a closed room's code is reused
+FEISTEL_ROUNDS = 4
+
+_MASK64 = (1 << 64) - 1
+
+class FeistelPermutation:
+    """A keyed bijection of range(size): a balanced Feistel network, cycle-walked back into range."""
+    def __init__(self, size: int, key: int):
+        self.size = size
+        bits = max(2, (size - 1).bit_length())
+        self.half_bits = (bits + 1) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        rng = random.Random(key)
+        self.round_keys = [rng.getrandbits(64) for _ in range(FEISTEL_ROUNDS)]
+
+    def _encrypt(self, x: int) -> int:
+        left, right = x >> self.half_bits, x & self.half_mask
+        for round_key in self.round_keys:
+            mixed = ((right ^ round_key) * 0x9E3779B97F4A7C15) & _MASK64
+            left, right = right, left ^ ((mixed ^ (mixed >> 29)) & self.half_mask)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index: int) -> int:
+        # The network permutes a power-of-4 domain under 4x the size; walking until we land back in range
+        # stays a bijection and takes under 4 steps on average
+        x = self._encrypt(index)
+        while x >= self.size:
+            x = self._encrypt(x)
+        return x
+
+class RoomDirectory:
+    """
+    Every code is in at most one of: active (a room has it, in memory or saved on disk), cooling (closed
+    less than `cooldown` seconds ago), free (closed and cooled down) or not yet issued. `accept` limits
+    the codes this directory hands out, e.g. to the ones a shard worker owns.
+    """
+    def __init__(self, length: int = ROOM_CODE_LENGTH, alphabet: str = ROOM_CODE_ALPHABET,
+                 cooldown: float = RECYCLE_COOLDOWN, accept: Callable[[str], bool] = lambda code: True,
+                 key: Optional[int] = None, clock: Callable[[], float] = time.monotonic):
+        if length < 1 or len(set(alphabet)) != len(alphabet) or len(alphabet) < 2:
+            raise ValueError("Room codes need a length of at least 1 and at least 2 distinct characters")
+        self.length = length
+        self.alphabet = alphabet
+        self.letters = frozenset(alphabet)
+        self.size = len(alphabet) ** length
+        self.cooldown = cooldown
+        self.accept = accept
+        self.clock = clock
+        self.permutation = FeistelPermutation(self.size, random.getrandbits(64) if key is None else key)
+        self.next_index = 0 # Position in the permutation of the next never-issued code
+        self.active: Set[str] = set()
+        self.cooling: Deque[Tuple[float, str]] = deque() # (cooled down at, code), oldest first
+        self.cooling_codes: Set[str] = set()
+        self.free: Deque[str] = deque()
+        self.free_codes: Set[str] = set()
+
+    def valid(self, code: str) -> bool:
+        """Whether `code` is shaped like a room code at all; anything else can be rejected without a lookup."""
+        return len(code) == self.length and self.letters.issuperset(code)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.active
+
+    def __len__(self) -> int:
+        return len(self.active)
+
+    def _code(self, value: int) -> str:
+        chars = []
+        base = len(self.alphabet)
+        for _ in range(self.length):
+            value, digit = divmod(value, base)
+            chars.append(self.alphabet[digit])
+        return "".join(reversed(chars))
+
+    def _cool_down(self):
+        now = self.clock()
+        while self.cooling and self.cooling[0][0] <= now:
+            _, code = self.cooling.popleft()
+            if code in self.cooling_codes: # Not reserved again meanwhile
+                self.cooling_codes.discard(code)
+                self.free.append(code)
+                self.free_codes.add(code)
+
+    def allocate(self) -> Optional[str]:
+        """A code no room has, now marked active; None if every code is in use or cooling down."""
+        self._cool_down()
+        while self.next_index < self.size:
+            code = self._code(self.permutation[self.next_index])
+            self.next_index += 1
+            if code in self.active or code in self.cooling_codes or code in self.free_codes or not self.accept(code):
+                continue # In use since before a restart, recycled already, or another worker's
+            self.active.add(code)
+            return code
+        while self.free:
+            code = self.free.popleft()
+            if code in self.free_codes:
+                self.free_codes.discard(code)
+                self.active.add(code)
+                return code
+        return None
+
+    def reserve(self, code: str) -> bool:
+        """Marks a code as taken, e.g. a room saved on disk before a restart. False if it already was."""
+        if code in self.active:
+            return False
+        self.cooling_codes.discard(code)
+        self.free_codes.discard(code)
+        self.active.add(code)
+        return True
+
+    def release(self, code: str):
+        """The room is gone for good; its code can be handed out again after the cooldown."""
+        if code not in self.active:
+            return
+        self.active.discard(code)
+        self.cooling.append((self.clock() + self.cooldown, code))
+        self.cooling_codes.add(code)
+
+    def report(self) -> dict:
+        self._cool_down()
+        return {
+            "code_space": self.size,
+            "active": len(self.active),
+            "cooling": len(self.cooling_codes),
+            "recycled": len(self.free_codes),
+            "never_issued": self.size - self.next_index,
+        }
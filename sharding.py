@@ -0,0 +1,465 @@
+"""
+Room sharding across worker processes.
+
+Each room ID hashes to an owning worker. Any worker can accept a request; if the room belongs to
+another worker, the request is forwarded over a pub/sub bus. Run `python sharding.py --workers N`
+to start N workers sharing one listening socket plus a Unix-socket bus broker.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+import wire
+from connections import ClientConnection
+from spectators import Watcher
+
+Handler = Callable[[dict], None]
+
+# --- Config ---
+
+WS_DEFLATE = os.environ.get("DONGDONG_WS_DEFLATE", "1") == "1" # permessage-deflate on WebSockets
+BUS_RECONNECT_SECONDS = 30.0  # How long a worker keeps trying to reach a lost broker before it shuts down
+
+logger = logging.getLogger("app_logger")
+
+@dataclass
+class ShardConfig:
+    worker_id: int = 0
+    num_workers: int = 1
+    bus_path: Optional[str] = None # Unix socket of the bus broker; required with more than one worker
+
+    @property
+    def enabled(self) -> bool:
+        return self.num_workers > 1
+
+    def owner_of(self, room_id: str) -> int:
+        return zlib.crc32(room_id.encode()) % self.num_workers
+
+    def is_local(self, room_id: str) -> bool:
+        return not self.enabled or self.owner_of(room_id) == self.worker_id
+
+    @classmethod
+    def from_env(cls) -> "ShardConfig":
+        config = cls(
+            worker_id=int(os.environ.get("DONGDONG_WORKER_ID", "0")),
+            num_workers=int(os.environ.get("DONGDONG_WORKERS", "1")),
+            bus_path=os.environ.get("DONGDONG_BUS") or None,
+        )
+        if config.enabled and not config.bus_path:
+            # Each worker would get a bus of its own, and every request for another worker's room would hang
+            raise ValueError("DONGDONG_WORKERS > 1 needs DONGDONG_BUS; start workers with `python sharding.py --workers N`")
+        return config
+
+def worker_channel(worker_id: int) -> str:
+    return f"worker:{worker_id}"
+
+# --- Pub/Sub Bus ---
+
+class Bus(ABC):
+    """
+    Minimal pub/sub interface. Messages are JSON-serializable dicts delivered in publish order.
+    Handlers are plain callables; anything slow should be scheduled as a task.
+    """
+    def __init__(self):
+        self.handlers: Dict[str, Handler] = {}
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.reply_channel: Optional[str] = None
+
+    async def start(self, reply_channel: str):
+        self.reply_channel = reply_channel
+        self.subscribe(reply_channel, self._on_reply)
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    def subscribe(self, channel: str, handler: Handler):
+        ...
+
+    @abstractmethod
+    def unsubscribe(self, channel: str):
+        ...
+
+    @abstractmethod
+    def publish(self, channel: str, message: dict):
+        ...
+
+    async def drain(self):
+        """Waits until published messages have been flushed (backpressure for large streams)."""
+
+    async def request(self, channel: str, message: dict, timeout: float = 5.0) -> dict:
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.publish(channel, {**message, "request_id": request_id, "reply_to": self.reply_channel})
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(request_id, None)
+
+    def reply(self, request: dict, result: dict):
+        self.publish(request["reply_to"], {**result, "request_id": request["request_id"]})
+
+    def _on_reply(self, message: dict):
+        future = self.pending.get(message.get("request_id"))
+        if future and not future.done():
+            future.set_result(message)
+
+class InProcessBus(Bus):
+    """Delivers messages within one event loop. Buses sharing a `registry` behave like separate workers."""
+    def __init__(self, registry: Optional[Dict[str, List[Handler]]] = None):
+        super().__init__()
+        self.registry = registry if registry is not None else {}
+
+    def subscribe(self, channel: str, handler: Handler):
+        self.unsubscribe(channel)
+        self.handlers[channel] = handler
+        self.registry.setdefault(channel, []).append(handler)
+
+    def unsubscribe(self, channel: str):
+        handler = self.handlers.pop(channel, None)
+        if handler and handler in self.registry.get(channel, []):
+            self.registry[channel].remove(handler)
+            if not self.registry[channel]:
+                del self.registry[channel]
+
+    def publish(self, channel: str, message: dict):
+        loop = asyncio.get_running_loop()
+        for handler in self.registry.get(channel, []):
+            loop.call_soon(handler, message) # Never re-enter the publisher
+
+class UnixSocketBus(Bus):
+    """Talks newline-delimited JSON to the broker started by run_broker()."""
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.reader_task: Optional[asyncio.Task] = None
+
+    async def start(self, reply_channel: str):
+        reader = await self._connect()
+        self.reader_task = asyncio.create_task(self._read_loop(reader))
+        await super().start(reply_channel)
+
+    async def _connect(self) -> asyncio.StreamReader:
+        reader, self.writer = await asyncio.open_unix_connection(self.path, limit=2 ** 22)
+        return reader
+
+    async def stop(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+        if self.writer:
+            self.writer.close()
+
+    def _send(self, frame: dict):
+        self.writer.write(json.dumps(frame, separators=(",", ":")).encode() + b"\n")
+
+    def subscribe(self, channel: str, handler: Handler):
+        self.handlers[channel] = handler
+        self._send({"op": "sub", "channel": channel})
+
+    def unsubscribe(self, channel: str):
+        if self.handlers.pop(channel, None):
+            self._send({"op": "unsub", "channel": channel})
+
+    def publish(self, channel: str, message: dict):
+        self._send({"op": "pub", "channel": channel, "message": message})
+
+    async def drain(self):
+        await self.writer.drain()
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        while True:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                line = b""
+            except ValueError as e: # A frame over the size limit; readline() has already skipped it
+                logger.error(f"Dropped an oversized bus frame: {e}")
+                continue
+            if not line:
+                reader = await self._reconnect()
+                continue
+            # One bad frame or failing handler must not stop this worker from hearing the bus
+            try:
+                frame = json.loads(line)
+                handler = self.handlers.get(frame["channel"])
+                if handler:
+                    handler(frame["message"])
+            except Exception as e:
+                logger.error(f"Bus frame failed: {e!r}", exc_info=True)
+
+    async def _reconnect(self) -> asyncio.StreamReader:
+        """The broker went away: reconnects and restores every subscription, or stops this worker."""
+        logger.warning("Lost the room bus broker; reconnecting.")
+        self.writer.close()
+        deadline = time.monotonic() + BUS_RECONNECT_SECONDS
+        delay = 0.1
+        while True:
+            try:
+                reader = await self._connect()
+            except OSError:
+                if time.monotonic() >= deadline:
+                    # Without the bus this worker can't reach most rooms; exit so the service gets restarted
+                    logger.error("Room bus broker is gone; stopping this worker.")
+                    os.kill(os.getpid(), signal.SIGTERM)
+                    await asyncio.Event().wait()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 2.0)
+                continue
+            for channel in self.handlers:
+                self._send({"op": "sub", "channel": channel})
+            logger.info("Reconnected to the room bus broker.")
+            return reader
+
+async def run_broker(path: str):
+    """Routes published messages to every connection subscribed to the channel."""
+    subscribers: Dict[str, set] = {}
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        channels = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                frame = json.loads(line)
+                if frame["op"] == "sub":
+                    subscribers.setdefault(frame["channel"], set()).add(writer)
+                    channels.add(frame["channel"])
+                elif frame["op"] == "unsub":
+                    subscribers.get(frame["channel"], set()).discard(writer)
+                    channels.discard(frame["channel"])
+                elif frame["op"] == "pub":
+                    out = json.dumps({"channel": frame["channel"], "message": frame["message"]},
+                                     separators=(",", ":")).encode() + b"\n"
+                    for subscriber in subscribers.get(frame["channel"], ()):
+                        subscriber.write(out)
+        finally:
+            for channel in channels:
+                subscribers.get(channel, set()).discard(writer)
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path, limit=2 ** 22)
+    async with server:
+        await server.serve_forever()
+
+# --- Cross-Worker WebSockets ---
+
+class RemoteSocket:
+    """Stands in for a WebSocket accepted by another worker. Frames travel over the bus to the proxy."""
+    def __init__(self, bus: Bus, conn_id: str, query_params: dict):
+        self.bus = bus
+        self.channel = f"conn:{conn_id}"
+        self.query_params = query_params
+        self.incoming: asyncio.Queue = asyncio.Queue()
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        pass # The proxy already accepted the client, and negotiated the wire format with it
+
+    async def send_text(self, text: str):
+        self.bus.publish(self.channel, {"frame": text})
+        await self.bus.drain()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.bus.publish(self.channel, {"close": code, "reason": reason})
+
+    async def receive_text(self) -> str:
+        data = await self.incoming.get()
+        if data is None:
+            raise WebSocketDisconnect()
+        return data
+
+async def proxy_websocket(bus: Bus, websocket: WebSocket, owner: int, room_id: str, player_name: str):
+    """
+    Relays a client socket accepted by this worker to the worker that owns the room.
+    The owner always sends JSON frames; the proxy's connection converts them if the client asked for binary.
+    """
+    await websocket.accept(subprotocol=wire.negotiate(websocket))
+    conn_id = uuid.uuid4().hex
+    # resync is empty: if the proxy falls behind the client sees a sequence gap and asks for a sync itself
+    connection = ClientConnection(websocket, room_id, player_name, resync=lambda: [])
+    connection.start()
+
+    def on_message(message: dict):
+        if "frame" in message:
+            connection.enqueue(message["frame"])
+        elif "close" in message:
+            connection.close(code=message["close"], reason=message.get("reason", ""))
+
+    bus.subscribe(f"conn:{conn_id}", on_message)
+    bus.publish(worker_channel(owner), {
+        "op": "ws_open", "conn_id": conn_id, "room_id": room_id,
+        "player_name": player_name, "query": dict(websocket.query_params),
+    })
+    try:
+        while True:
+            data = await websocket.receive_text()
+            bus.publish(worker_channel(owner), {"op": "ws_message", "conn_id": conn_id, "data": data})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        bus.publish(worker_channel(owner), {"op": "ws_close", "conn_id": conn_id})
+        bus.unsubscribe(f"conn:{conn_id}")
+        connection.closed = True
+        if connection.writer:
+            connection.writer.cancel()
+
+class ShardWorker:
+    """Serves the requests other workers forward to this one."""
+    def __init__(self, config: ShardConfig, bus: Bus,
+                 create_room: Callable[[], Optional[str]],
+                 room_exists: Callable[[str], Awaitable[bool]],
+                 run_session: Callable[[RemoteSocket, str, str], Awaitable[None]],
+                 watch: Callable[[str, Optional[str]], AsyncIterator[Optional[Tuple[str, List[str]]]]]):
+        self.config = config
+        self.bus = bus
+        self.create_room = create_room
+        self.room_exists = room_exists
+        self.run_session = run_session
+        self.watch = watch
+        self.remote_sockets: Dict[str, RemoteSocket] = {}
+        self.remote_watchers: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        await self.bus.start(f"reply:{self.config.worker_id}")
+        self.bus.subscribe(worker_channel(self.config.worker_id), self.handle)
+
+    def handle(self, message: dict):
+        op = message.get("op")
+        if op == "create_room":
+            self.bus.reply(message, {"room_id": self.create_room()})
+        elif op == "room_exists":
+            asyncio.create_task(self._reply_exists(message)) # May have to load the room from disk first
+        elif op == "ws_open":
+            socket = RemoteSocket(self.bus, message["conn_id"], message.get("query", {}))
+            self.remote_sockets[message["conn_id"]] = socket
+            asyncio.create_task(self._run(message["conn_id"], socket, message["room_id"], message["player_name"]))
+        elif op == "ws_message":
+            socket = self.remote_sockets.get(message["conn_id"])
+            if socket:
+                socket.incoming.put_nowait(message["data"])
+        elif op == "ws_close":
+            socket = self.remote_sockets.get(message["conn_id"])
+            if socket:
+                socket.incoming.put_nowait(None)
+        elif op == "watch_open":
+            self.remote_watchers[message["conn_id"]] = asyncio.create_task(
+                self._relay_watch(message["conn_id"], message["room_id"], message.get("since")))
+        elif op == "watch_close":
+            task = self.remote_watchers.get(message["conn_id"])
+            if task:
+                task.cancel()
+
+    async def _reply_exists(self, message: dict):
+        self.bus.reply(message, {"exists": await self.room_exists(message["room_id"])})
+
+    async def _run(self, conn_id: str, socket: RemoteSocket, room_id: str, player_name: str):
+        try:
+            await self.run_session(socket, room_id, player_name)
+        finally:
+            self.remote_sockets.pop(conn_id, None)
+            await socket.close() # Mirror the server closing a local socket when its handler returns
+
+    async def _relay_watch(self, conn_id: str, room_id: str, since: Optional[str]):
+        channel = f"conn:{conn_id}"
+        try:
+            async for batch in self.watch(room_id, since):
+                if batch is not None: # The relaying worker sends its own keepalives
+                    self.bus.publish(channel, {"id": batch[0], "frames": batch[1]})
+        finally:
+            self.remote_watchers.pop(conn_id, None)
+            self.bus.publish(channel, {"close": True})
+
+    async def watch_remote(self, room_id: str, since: Optional[str]) -> AsyncIterator[Optional[Tuple[str, List[str]]]]:
+        """Relays the spectator feed of a room owned by another worker to one event-stream subscriber."""
+        owner = worker_channel(self.config.owner_of(room_id))
+        conn_id = uuid.uuid4().hex
+        watcher = Watcher()
+
+        def on_message(message: dict):
+            if "frames" in message:
+                watcher.push(message["id"], message["frames"])
+            else:
+                watcher.close()
+
+        self.bus.subscribe(f"conn:{conn_id}", on_message)
+        self.bus.publish(owner, {"op": "watch_open", "conn_id": conn_id, "room_id": room_id, "since": since})
+        try:
+            async for batch in watcher.batches():
+                yield batch
+        finally:
+            self.bus.publish(owner, {"op": "watch_close", "conn_id": conn_id})
+            self.bus.unsubscribe(f"conn:{conn_id}")
+
+    async def create_remote_room(self, owner: int) -> Optional[str]:
+        """Asks another worker to create a room with one of its own IDs; None if it is full."""
+        reply = await self.bus.request(worker_channel(owner), {"op": "create_room"})
+        return reply["room_id"]
+
+    async def remote_room_exists(self, room_id: str) -> bool:
+        reply = await self.bus.request(worker_channel(self.config.owner_of(room_id)),
+                                       {"op": "room_exists", "room_id": room_id})
+        return reply["exists"]
+
+# --- Launcher ---
+
+def _run_broker_process(path: str):
+    asyncio.run(run_broker(path))
+
+def _run_worker_process(worker_id: int, num_workers: int, bus_path: str, sockets: list):
+    import uvicorn
+    os.environ["DONGDONG_WORKER_ID"] = str(worker_id)
+    os.environ["DONGDONG_WORKERS"] = str(num_workers)
+    os.environ["DONGDONG_BUS"] = bus_path
+    uvicorn.Server(uvicorn.Config("main:app", ws_per_message_deflate=WS_DEFLATE)).run(sockets=sockets)
+
+def main():
+    import argparse
+    import multiprocessing
+    import tempfile
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Run Dong Dong with rooms sharded across worker processes.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--bus", default=os.path.join(tempfile.gettempdir(), f"dongdong-bus-{os.getpid()}.sock"))
+    args = parser.parse_args()
+
+    sock = uvicorn.Config("main:app", host=args.host, port=args.port).bind_socket()
+    ctx = multiprocessing.get_context("spawn")
+
+    broker = ctx.Process(target=_run_broker_process, args=(args.bus,), daemon=True)
+    broker.start()
+    while not os.path.exists(args.bus):
+        time.sleep(0.05)
+
+    workers = [
+        ctx.Process(target=_run_worker_process, args=(i, args.workers, args.bus, [sock]))
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+    finally:
+        broker.terminate()
+
+if __name__ == "__main__":
+    main()
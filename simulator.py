@@ -0,0 +1,337 @@
+"""
+Headless Dong Dong simulator: plays many full 13-round games in lockstep as NumPy arrays.
+
+Used offline to tune house rules (the forbidden last bet, the scoring formula) and to regression-test
+the engine: --cross-check replays sampled games through the real DongDongEngine and reports any
+difference in legality, stack winners or scores. Requires NumPy (`pip install numpy`), which the
+server itself does not need.
+
+    python simulator.py --games 1000000 --players 4 --policy greedy --workers 8
+"""
+import argparse
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Type
+
+import numpy as np
+
+import bitboard
+
+ROUNDS = 13
+NUM_COLORS = len(bitboard.COLOR_NAMES)
+TILE_IDS = np.arange(bitboard.NUM_TILES, dtype=np.uint64)
+TILE_NUMBERS = np.arange(bitboard.NUM_TILES) % bitboard.NUMBERS_PER_COLOR + 1
+TILE_COLORS = np.arange(bitboard.NUM_TILES) // bitboard.NUMBERS_PER_COLOR
+COLOR_MASKS = np.array(bitboard.COLOR_MASKS, dtype=np.uint64)
+ONE = np.uint64(1)
+
+# --- Rules ---
+
+@dataclass
+class Rules:
+    """House rules under test. The defaults are the rules DongDongEngine implements."""
+    forbid_exact_total: bool = True # The last bettor may not make the bets add up to the round number
+    hit_bonus: int = 10             # Correct bet scores hit_bonus + bet ** hit_power
+    hit_power: int = 2
+    miss_power: int = 2             # Wrong bet scores -(|bet - won| ** miss_power)
+
+    def score(self, bets: np.ndarray, won: np.ndarray) -> np.ndarray:
+        hit = bets == won
+        return np.where(hit, self.hit_bonus + bets ** self.hit_power, -(np.abs(bets - won) ** self.miss_power))
+
+# --- Helpers ---
+
+def mask_bits(masks: np.ndarray) -> np.ndarray:
+    """(B,) uint64 masks -> (B, 52) bool matrix of the tiles they contain."""
+    return ((masks[:, None] >> TILE_IDS) & ONE).astype(bool)
+
+def pick_random(bits: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """One uniformly random tile id per row of a (B, 52) bool matrix (every row must be non-empty)."""
+    return np.argmax(np.where(bits, rng.random(bits.shape), -1.0), axis=1)
+
+# --- Policies ---
+
+@dataclass
+class BatchView:
+    """What a policy may look at. Arrays are indexed [game] or [game, seat]."""
+    round: int
+    num_players: int
+    hands: np.ndarray       # (B, n) uint64 masks
+    master: np.ndarray      # (B,) color index
+    bets: np.ndarray        # (B, n), -1 until placed
+    stacks_won: np.ndarray  # (B, n)
+    lead: np.ndarray        # (B,) color index of the current stack, -1 before the first play
+    rng: np.random.Generator
+
+class Policy(ABC):
+    """Vectorized decision maker. Each call decides for every game in the batch at once."""
+    @abstractmethod
+    def choose_bets(self, view: BatchView, seats: np.ndarray, forbidden: np.ndarray) -> np.ndarray:
+        ...
+
+    @abstractmethod
+    def choose_plays(self, view: BatchView, seats: np.ndarray, valid: np.ndarray) -> np.ndarray:
+        """`valid` is the (B,) mask of legal tiles; returns (B,) tile ids."""
+
+class RandomPolicy(Policy):
+    def choose_bets(self, view, seats, forbidden):
+        return view.rng.integers(0, view.round + 1, size=len(seats))
+
+    def choose_plays(self, view, seats, valid):
+        return pick_random(mask_bits(valid), view.rng)
+
+class GreedyPolicy(Policy):
+    """Bets on its master-color tiles plus its high (11+) tiles, and always plays its strongest legal tile."""
+    def choose_bets(self, view, seats, forbidden):
+        bits = mask_bits(view.hands[np.arange(len(seats)), seats])
+        is_master = TILE_COLORS[None, :] == view.master[:, None]
+        strong = bits & (is_master | (TILE_NUMBERS[None, :] >= 11))
+        return np.minimum(strong.sum(axis=1), view.round)
+
+    def choose_plays(self, view, seats, valid):
+        bits = mask_bits(valid)
+        strength = TILE_NUMBERS[None, :] + 20 * (TILE_COLORS[None, :] == view.master[:, None])
+        return np.argmax(np.where(bits, strength, -1), axis=1)
+
+POLICIES: Dict[str, Type[Policy]] = {"random": RandomPolicy, "greedy": GreedyPolicy}
+
+# --- Batch Simulation ---
+
+@dataclass
+class GameRecord:
+    """Everything needed to replay one simulated game through the real engine."""
+    num_players: int
+    deals: List[List[int]] = field(default_factory=list)         # [round][seat] hand mask
+    masters: List[int] = field(default_factory=list)             # [round] color index
+    bets: List[List[int]] = field(default_factory=list)          # [round][betting order] (seat, bet)
+    plays: List[List[List[int]]] = field(default_factory=list)   # [round][stack] tile ids in play order
+    scores: List[List[int]] = field(default_factory=list)        # [round][seat] cumulative score
+
+def simulate_batch(batch_size: int, num_players: int, seed, policy: Policy, rules: Rules = Rules(),
+                   record: int = 0) -> dict:
+    """
+    Plays `batch_size` full games in lockstep. `seed` is anything np.random.default_rng accepts
+    (e.g. a SeedSequence), so a batch is reproducible on its own. The first `record` games are
+    returned as GameRecords for cross-checking.
+    """
+    rng = np.random.default_rng(seed)
+    B, n = batch_size, num_players
+    games = np.arange(B)
+    scores = np.zeros((B, n), dtype=np.int64)
+    adjusted_bets = 0
+    hits = 0
+    records = [GameRecord(num_players=n) for _ in range(record)]
+
+    for rnd in range(1, ROUNDS + 1):
+        color_master = (rnd - 1) % n # Rotates one seat per round, as in the engine
+
+        # Deal: a fresh shuffled deck per game, `rnd` tiles to each seat
+        deck = rng.permuted(np.tile(np.arange(bitboard.NUM_TILES, dtype=np.uint64), (B, 1)), axis=1)
+        dealt = (ONE << deck[:, :rnd * n]).reshape(B, rnd, n)
+        hands = np.bitwise_or.reduce(dealt, axis=1)
+        master = rng.integers(0, NUM_COLORS, size=B)
+
+        view = BatchView(rnd, n, hands, master, np.full((B, n), -1), np.zeros((B, n), dtype=np.int64),
+                         np.full(B, -1), rng)
+        for i, r in enumerate(records):
+            r.deals.append([int(m) for m in hands[i]])
+            r.masters.append(int(master[i]))
+
+        # Betting, starting with the color master
+        order = [(color_master + k) % n for k in range(n)]
+        round_bets = [[] for _ in records]
+        for k, seat in enumerate(order):
+            seats = np.full(B, seat)
+            forbidden = np.full(B, -1)
+            if k == n - 1 and rules.forbid_exact_total:
+                forbidden = rnd - view.bets[:, order[:-1]].sum(axis=1)
+            bets = np.clip(policy.choose_bets(view, seats, forbidden), 0, rnd)
+            clash = bets == forbidden
+            adjusted_bets += int(clash.sum())
+            bets = np.where(clash, np.where(bets < rnd, bets + 1, bets - 1), bets)
+            view.bets[:, seat] = bets
+            for i, rb in enumerate(round_bets):
+                rb.append([seat, int(bets[i])])
+
+        # Stacks
+        leader = np.full(B, color_master)
+        round_plays = [[] for _ in records]
+        for _ in range(rnd):
+            played = np.zeros((B, n), dtype=np.int64)
+            view.lead = np.full(B, -1)
+            for k in range(n):
+                seats = (leader + k) % n
+                hand = view.hands[games, seats]
+                if k == 0:
+                    valid = hand
+                else:
+                    follow = hand & COLOR_MASKS[view.lead]
+                    valid = np.where(follow != 0, follow, hand)
+                tiles = policy.choose_plays(view, seats, valid)
+                legal = (valid >> tiles.astype(np.uint64)) & ONE
+                if not legal.all():
+                    raise ValueError(f"{type(policy).__name__} chose an illegal tile")
+                view.hands[games, seats] = hand ^ (ONE << tiles.astype(np.uint64))
+                played[:, k] = tiles
+                if k == 0:
+                    view.lead = TILE_COLORS[tiles]
+
+            colors = TILE_COLORS[played]
+            key = np.where(colors == master[:, None], 200, np.where(colors == view.lead[:, None], 100, 0))
+            winner = np.argmax(key + TILE_NUMBERS[played], axis=1)
+            leader = (leader + winner) % n
+            view.stacks_won[games, leader] += 1
+            for i, rp in enumerate(round_plays):
+                rp.append([int(t) for t in played[i]])
+
+        hits += int((view.bets == view.stacks_won).sum())
+        scores += rules.score(view.bets, view.stacks_won)
+        for i, r in enumerate(records):
+            r.bets.append(round_bets[i])
+            r.plays.append(round_plays[i])
+            r.scores.append([int(s) for s in scores[i]])
+
+    return {
+        "games": B,
+        "scores": scores,
+        "adjusted_bets": adjusted_bets,
+        "hits": hits,
+        "records": records,
+    }
+
+# --- Cross-Check Against the Engine ---
+
+def cross_check(record: GameRecord) -> List[str]:
+    """Replays a simulated game through DongDongEngine. Returns a description of every mismatch."""
+    from dong_dong_engine import COLORS_BY_INDEX, DongDongEngine, GameState, Hand, TILES
+
+    problems = []
+    engine = DongDongEngine(seed=0)
+    names = [f"p{i}" for i in range(record.num_players)]
+    for name in names:
+        engine.add_player(name)
+    engine.start_new_game()
+
+    for rnd in range(ROUNDS):
+        # Impose the simulator's deal and master color on the round the engine just started
+        for player, mask in zip(engine.players, record.deals[rnd]):
+            player.hand = Hand(mask=mask)
+        engine.master_color = COLORS_BY_INDEX[record.masters[rnd]]
+
+        for seat, bet in record.bets[rnd]:
+            ok, error = engine.place_bet(names[seat], bet)
+            if not ok:
+                problems.append(f"round {rnd + 1}: engine rejected bet {bet} from seat {seat}: {error}")
+                return problems
+
+        for stack, plays in enumerate(record.plays[rnd]):
+            for tid in plays:
+                player = engine.get_current_turn_player()
+                ok, error = engine.play_tile(player.name, TILES[tid].to_dict())
+                if not ok:
+                    problems.append(f"round {rnd + 1} stack {stack + 1}: engine rejected {TILES[tid]}: {error}")
+                    return problems
+
+        engine_scores = [p.score for p in engine.players]
+        if engine_scores != record.scores[rnd]:
+            problems.append(f"round {rnd + 1}: engine scores {engine_scores} != simulated {record.scores[rnd]}")
+        if engine.game_state != GameState.ROUND_OVER:
+            problems.append(f"round {rnd + 1}: engine in {engine.game_state.value} after the last stack")
+            return problems
+        engine.start_new_round()
+
+    if engine.game_state != GameState.GAME_OVER:
+        problems.append("engine did not reach GAME_OVER after 13 rounds")
+    return problems
+
+# --- Process-Pool Driver ---
+
+def _run_batch(args) -> dict:
+    batch_size, num_players, seed, policy_name, rules, record = args
+    result = simulate_batch(batch_size, num_players, seed, POLICIES[policy_name](), rules, record)
+    scores = result["scores"]
+    return {
+        "games": result["games"],
+        "score_sum": scores.sum(axis=0).tolist(),
+        "score_sq_sum": (scores.astype(np.float64) ** 2).sum(axis=0).tolist(),
+        "wins": np.bincount(scores.argmax(axis=1), minlength=num_players).tolist(),
+        "adjusted_bets": result["adjusted_bets"],
+        "hits": result["hits"],
+        "records": [asdict(r) for r in result["records"]],
+    }
+
+def run(num_games: int, num_players: int = 4, policy: str = "random", seed: int = 0, workers: int = 1,
+        batch_size: int = 10000, rules: Rules = Rules(), cross_check_games: int = 0) -> dict:
+    """
+    Simulates `num_games` games split into batches across a process pool. Each batch gets its own
+    child of SeedSequence(seed), so results depend only on the seed and batch size, not on `workers`.
+    """
+    num_batches = max(1, -(-num_games // batch_size))
+    seeds = np.random.SeedSequence(seed).spawn(num_batches)
+    jobs = []
+    for i, batch_seed in enumerate(seeds):
+        size = min(batch_size, num_games - i * batch_size)
+        record = min(cross_check_games, size) if i == 0 else 0
+        jobs.append((size, num_players, batch_seed, policy, rules, record))
+
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_batch, jobs))
+    else:
+        results = [_run_batch(job) for job in jobs]
+    elapsed = time.perf_counter() - start
+
+    games = sum(r["games"] for r in results)
+    score_sum = np.sum([r["score_sum"] for r in results], axis=0)
+    score_sq_sum = np.sum([r["score_sq_sum"] for r in results], axis=0)
+    mean = score_sum / games
+    summary = {
+        "games": games,
+        "players": num_players,
+        "policy": policy,
+        "seed": seed,
+        "rules": asdict(rules),
+        "seconds": round(elapsed, 3),
+        "games_per_second": round(games / elapsed, 1) if elapsed else None,
+        "mean_score_by_seat": [round(float(m), 3) for m in mean],
+        "score_stddev_by_seat": [round(float(s), 3) for s in np.sqrt(score_sq_sum / games - mean ** 2)],
+        "win_rate_by_seat": [round(w / games, 4) for w in np.sum([r["wins"] for r in results], axis=0)],
+        "forbidden_bet_adjustments_per_game": round(sum(r["adjusted_bets"] for r in results) / games, 4),
+        "bet_hit_rate": round(sum(r["hits"] for r in results) / (games * num_players * ROUNDS), 4),
+    }
+
+    if cross_check_games:
+        records = [GameRecord(**r) for r in results[0]["records"]]
+        mismatches = {i: p for i, p in enumerate(map(cross_check, records)) if p}
+        summary["cross_check"] = {"games": len(records), "mismatched_games": len(mismatches),
+                                  "first_problems": next(iter(mismatches.values()), [])}
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate Dong Dong games in vectorized batches.")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--players", type=int, default=4, choices=[2, 3, 4])
+    parser.add_argument("--policy", default="random", choices=sorted(POLICIES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--cross-check", type=int, default=0,
+                        help="Replay this many games through DongDongEngine (only meaningful with the default rules)")
+    parser.add_argument("--allow-exact-total", action="store_true", help="Drop the forbidden last bet rule")
+    parser.add_argument("--hit-bonus", type=int, default=10)
+    parser.add_argument("--hit-power", type=int, default=2)
+    parser.add_argument("--miss-power", type=int, default=2)
+    args = parser.parse_args()
+
+    rules = Rules(not args.allow_exact_total, args.hit_bonus, args.hit_power, args.miss_power)
+    summary = run(args.games, args.players, args.policy, args.seed, args.workers, args.batch_size, rules,
+                  args.cross_check)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
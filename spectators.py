@@ -0,0 +1,120 @@
+"""
+Spectator tier: everyone watching a room shares one public-only, rate-capped stream.
+
+Players get every state version as soon as it is published. Watchers (WebSocket spectators and
+server-sent-event subscribers) get the same encoded public frames, but at most SPECTATOR_RATE times a
+second: versions published in between are delivered together on the next tick, so the cost of a
+busy room no longer grows with every action times every watcher.
+"""
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from state_sync import StateStream
+
+SPECTATOR_RATE = float(os.environ.get("DONGDONG_SPECTATOR_RATE", "4"))  # Updates per second sent to watchers
+MAX_WATCHER_BACKLOG = 64    # Frames an event-stream subscriber may fall behind before it is cut off
+KEEPALIVE_SECONDS = 15.0    # Idle event streams get a comment line so proxies don't time them out
+
+Listener = Callable[[int, List[str]], None]
+"""Receives (seq, frames): the frames that bring a watcher up to version seq."""
+
+class SpectatorFeed:
+    """One room's watchers. Frames come from the room's public StateStream and are never re-encoded."""
+    def __init__(self, stream: StateStream, rate: float = SPECTATOR_RATE):
+        self.stream = stream
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.listeners: Dict[object, Tuple[int, Listener]] = {} # key -> (version the watcher has, listener)
+        self.sent_seq = stream.seq
+        self.last_sent = 0.0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def __len__(self) -> int:
+        return len(self.listeners)
+
+    def add(self, key: object, listener: Listener, seq: int):
+        """Adds a watcher that already holds version `seq` (its catch-up was sent by the caller)."""
+        self.listeners[key] = (seq, listener)
+
+    def discard(self, key: object):
+        self.listeners.pop(key, None)
+
+    def publish(self):
+        """Called after every new state version; sends now or on the next tick of the rate cap."""
+        if not self.listeners:
+            self.sent_seq = self.stream.seq
+            return
+        if self.timer is not None:
+            return # Already scheduled; that flush picks up this version too
+        wait = self.last_sent + self.interval - time.monotonic()
+        if wait <= 0:
+            self.flush()
+        else:
+            self.timer = asyncio.get_running_loop().call_later(wait, self.flush)
+
+    def flush(self):
+        self.timer = None
+        seq = self.stream.seq
+        if seq == self.sent_seq:
+            return
+        shared = self.stream.catch_up(self.sent_seq)
+        for key, (have, listener) in list(self.listeners.items()):
+            if have >= seq:
+                continue
+            # Watchers that joined since the last tick are ahead of the shared frames
+            listener(seq, shared if have == self.sent_seq else self.stream.catch_up(have))
+            self.listeners[key] = (seq, listener)
+        self.sent_seq = seq
+        self.last_sent = time.monotonic()
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.listeners.clear()
+
+class Watcher:
+    """
+    An event-stream subscriber's frame backlog. One that falls too far behind is cut off; the browser's
+    EventSource reconnects with Last-Event-ID and catches up from there.
+    """
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.backlog = 0
+        self.closed = False
+
+    def push(self, event_id: str, frames: List[str]):
+        if self.closed or not frames:
+            return
+        self.backlog += len(frames)
+        if self.backlog > MAX_WATCHER_BACKLOG:
+            self.close()
+            return
+        self.queue.put_nowait((event_id, frames))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put_nowait(None)
+
+    async def batches(self) -> AsyncIterator[Optional[Tuple[str, List[str]]]]:
+        """Yields (event id, frames) batches, and None whenever the stream has been idle for a while."""
+        while True:
+            try:
+                item = await asyncio.wait_for(self.queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if item is None:
+                return
+            self.backlog -= len(item[1])
+            yield item
+
+def sse_event(batch: Optional[Tuple[str, List[str]]]) -> str:
+    """Formats one batch as server-sent events; the last frame carries the version's event id."""
+    if batch is None:
+        return ": keepalive\n\n"
+    event_id, frames = batch
+    return "".join(f"id: {event_id}\ndata: {frame}\n\n" if i == len(frames) - 1 else f"data: {frame}\n\n"
+                   for i, frame in enumerate(frames))
@@ -0,0 +1,73 @@
+"""
+Startup timing, readiness and warm-up.
+
+A sleeping free-tier instance is woken by its first request, so everything that can wait until after
+the server is listening does: saved rooms are loaded on their first visit, the frontend is compressed
+and the game code paths are exercised by a warm-up task, and /readyz answers 503 until that is done.
+Phases are timed from process start, so the report covers interpreter start-up and imports too.
+"""
+import logging
+import os
+import time
+from typing import Dict
+
+PREWARM = os.environ.get("DONGDONG_PREWARM", "1") == "1" # Exercise the game code paths before reporting ready
+
+logger = logging.getLogger("app_logger")
+
+def process_started_at() -> float:
+    """Wall-clock time the process started, from /proc where available; otherwise when this module loaded."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+class StartupTracker:
+    """Seconds from process start to each phase: imported, started (app startup done), warmed, ready."""
+    def __init__(self):
+        self.started_at = process_started_at()
+        self.phases: Dict[str, float] = {}
+        self.ready = False
+
+    def mark(self, phase: str):
+        self.phases[phase] = round(time.time() - self.started_at, 3)
+
+    def set_ready(self):
+        self.mark("ready")
+        self.ready = True
+        logger.info("Ready in {ready}s ({timings}).".format(
+            ready=self.phases["ready"], timings=", ".join(f"{k} {v}s" for k, v in self.phases.items() if k != "ready")))
+
+    def report(self) -> dict:
+        return {"ready": self.ready, "seconds_since_start": self.phases}
+
+def prewarm():
+    """
+    Plays a throwaway game's first stack through the engine, the bots' fallbacks, the state projection,
+    both wire formats and the game record, so the first real room doesn't pay for cold code paths.
+    """
+    import wire
+    from bots import fallback_bet, fallback_play
+    from dong_dong_engine import DongDongEngine, GameState
+    from projections import RoomProjection
+
+    engine = DongDongEngine(seed=0)
+    for name in ("warm-a", "warm-b", "warm-c", "warm-d"):
+        engine.add_player(name)
+    engine.start_new_game()
+    projection = RoomProjection()
+    frames = [projection.update(engine)[0]]
+    while engine.game_state == GameState.AWAITING_BETS:
+        engine.place_bet(engine.get_current_turn_player().name, fallback_bet(engine))
+    for _ in engine.players:
+        player = engine.get_current_turn_player()
+        engine.play_tile(player.name, fallback_play(engine, player))
+        frames.append(projection.update(engine)[0])
+    for frame in frames:
+        if frame is not None:
+            wire.to_binary(frame)
+    engine.history.encode([p.score for p in engine.players])
@@ -0,0 +1,121 @@
+import json
+import os
+from collections import deque
+from typing import Any, Deque, List, Optional, Tuple
+
+# --- Structural Diff ---
+#
+# A diff is a list of ops applied in order to the previous state:
+#   ["set",  path, value]   replace (or add) the value at path
+#   ["del",  path]          remove a dict key
+#   ["trim", path, n]       drop the first n items of the list at path
+#   ["push", path, items]   append items to the list at path
+# A path is a list of dict keys / list indexes. The frontend mirrors this in applyStateOps().
+
+def _diff_list(old: list, new: list, path: list, ops: list):
+    # Look for a shift: old[k:] is a non-empty prefix of new (covers append-only and capped logs like eventLog)
+    for k in range(len(old) if old else 1):
+        kept = len(old) - k
+        if kept > len(new):
+            continue
+        if kept and old[k] != new[0]:
+            continue
+        if old[k:] == new[:kept]:
+            if k == 0 and kept == len(new):
+                return  # identical
+            if k:
+                ops.append(["trim", path, k])
+            if kept < len(new):
+                ops.append(["push", path, new[kept:]])
+            return
+
+    if len(old) == len(new):
+        for i, (o, n) in enumerate(zip(old, new)):
+            _diff_value(o, n, path + [i], ops)
+    else:
+        ops.append(["set", path, new])
+
+def _diff_value(old: Any, new: Any, path: list, ops: list):
+    if type(old) is not type(new):
+        ops.append(["set", path, new])
+    elif isinstance(new, dict):
+        for key in old:
+            if key not in new:
+                ops.append(["del", path + [key]])
+        for key, value in new.items():
+            if key not in old:
+                ops.append(["set", path + [key], value])
+            else:
+                _diff_value(old[key], value, path + [key], ops)
+    elif isinstance(new, list):
+        _diff_list(old, new, path, ops)
+    elif old != new:
+        ops.append(["set", path, new])
+
+def diff_state(old: dict, new: dict) -> List[list]:
+    """Returns the list of ops that turns `old` into `new`."""
+    ops: List[list] = []
+    _diff_value(old, new, [], ops)
+    return ops
+
+# --- Versioned Stream ---
+
+def encode_message(message: dict) -> str:
+    """Encodes a message for the wire. Frames are encoded once and the text is reused for every socket."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class StateStream:
+    """Tracks successive versions of a room's state and the encoded diffs between them."""
+    def __init__(self, history: int = 64):
+        # Tells this stream apart from an earlier one for the same room (a restored room starts over at seq 1)
+        self.epoch: str = os.urandom(4).hex()
+        self.seq: int = 0
+        self.state: Optional[dict] = None
+        # (seq, frame) pairs; each frame turns version seq-1 into version seq
+        self.deltas: Deque[Tuple[int, str]] = deque(maxlen=history)
+        self._snapshot: Optional[Tuple[int, str]] = None
+
+    def publish(self, state: dict) -> Optional[str]:
+        """Records a new version. Returns the encoded frame to broadcast, or None if nothing changed."""
+        if self.state is None:
+            self.seq += 1
+            self.state = state
+            return self.snapshot_frame()
+
+        ops = diff_state(self.state, state)
+        if not ops:
+            return None
+        self.seq += 1
+        self.state = state
+        frame = encode_message({"type": "state_delta", "seq": self.seq, "ops": ops})
+        self.deltas.append((self.seq, frame))
+        return frame
+
+    def snapshot_frame(self) -> str:
+        """Returns the full state as an encoded frame, cached until the next version."""
+        if self._snapshot is None or self._snapshot[0] != self.seq:
+            self._snapshot = (self.seq, encode_message({"type": "game_state", "seq": self.seq, "epoch": self.epoch,
+                                                        "payload": self.state}))
+        return self._snapshot[1]
+
+    def resume_point(self, since: Optional[int], epoch: Optional[str]) -> Optional[int]:
+        """A client's `since`, if it saw that version on this stream; None (send a snapshot) if on an earlier one."""
+        return since if epoch == self.epoch else None
+
+    def event_id(self, seq: int) -> str:
+        """Names version `seq` for event-stream ids, which carry the epoch: "<epoch>.<seq>"."""
+        return f"{self.epoch}.{seq}"
+
+    def resume_point_from_event_id(self, event_id: Optional[str]) -> Optional[int]:
+        epoch, _, seq = (event_id or "").rpartition(".")
+        return self.resume_point(int(seq) if seq.isdigit() else None, epoch)
+
+    def catch_up(self, since: Optional[int]) -> List[str]:
+        """Returns the frames a client at version `since` needs to reach the current version."""
+        if self.state is None:
+            return []
+        if since == self.seq:
+            return []
+        if since is not None and self.deltas and self.deltas[0][0] <= since + 1 and since < self.seq:
+            return [frame for seq, frame in self.deltas if seq > since]
+        return [self.snapshot_frame()]
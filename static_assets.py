@@ -0,0 +1,157 @@
+"""
+Serves the frontend from memory, ahead of every other middleware.
+
+Each file is read once, fingerprinted by its content hash and compressed with gzip (and brotli, when
+installed) in a thread, either by a warm-up task after startup or on the first asset request; other
+requests never wait for it. index.html is rewritten to load `app.<hash>.js` and `style.<hash>.css`, so those
+can be cached forever; index.html itself is revalidated with its ETag on every visit. Asset requests
+are answered here and never reach the request logging middleware or the routes.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+FINGERPRINTED = ("app.js", "style.css")  # Files index.html loads; served under content-hashed names
+MIN_COMPRESS_BYTES = 512                 # Smaller files aren't worth a compressed variant
+IMMUTABLE = b"public, max-age=31536000, immutable"
+REVALIDATE = b"no-cache"
+
+class Asset:
+    """One file's bytes in every encoding, each with its own strong ETag."""
+    def __init__(self, body: bytes, content_type: str, cache_control: bytes):
+        self.content_type = content_type.encode()
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        self.fingerprint = digest[:10]
+        self.variants: Dict[str, Tuple[bytes, bytes]] = {"identity": (body, f'"{digest}"'.encode())}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            import gzip
+            try:
+                import brotli
+            except ImportError: # Optional: without it only gzip variants are served
+                brotli = None
+            if brotli is not None:
+                self._add_variant("br", brotli.compress(body, quality=11), digest)
+            self._add_variant("gzip", gzip.compress(body, compresslevel=9, mtime=0), digest)
+
+    def _add_variant(self, encoding: str, body: bytes, digest: str):
+        if len(body) < len(self.variants["identity"][0]):
+            self.variants[encoding] = (body, f'"{digest}-{encoding}"'.encode())
+
+    def choose(self, accept_encoding: str) -> str:
+        """The best encoding the client accepts: brotli, then gzip, then none."""
+        accepted = set()
+        for part in accept_encoding.split(","):
+            token, _, params = part.partition(";")
+            params = params.strip().replace(" ", "")
+            try:
+                quality = float(params[2:]) if params.startswith("q=") else 1.0
+            except ValueError:
+                quality = 1.0
+            if quality > 0:
+                accepted.add(token.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+class AssetStore:
+    """Every servable path and its asset, built once on first use (or by calling load() ahead of time)."""
+    def __init__(self, directory: str = "frontend"):
+        self.directory = directory
+        self.assets: Optional[Dict[str, Asset]] = None
+        self.lock = threading.Lock()
+        # Listed up front (no reads) so other requests can be told apart before anything is built
+        names = [name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name))] \
+            if os.path.isdir(directory) else []
+        self.paths: Set[str] = {"/" + name for name in names} | ({"/"} if "index.html" in names else set())
+
+    def may_serve(self, path: str) -> bool:
+        """Whether `path` names a frontend file or a fingerprinted copy of one. Never builds anything."""
+        if path in self.paths:
+            return True
+        stem, ext = os.path.splitext(path)
+        base, _, fingerprint = stem.rpartition(".")
+        name = base[1:] + ext
+        return len(fingerprint) == 10 and name in FINGERPRINTED and "/" + name in self.paths
+
+    async def get(self, path: str) -> Optional[Asset]:
+        """The asset at `path`. If warm-up hasn't built them yet, the build runs in a thread, off the event loop."""
+        return (self.assets if self.assets is not None else await asyncio.to_thread(self.load)).get(path)
+
+    def load(self) -> Dict[str, Asset]:
+        with self.lock: # A warm-up thread and a first request may race here
+            if self.assets is None:
+                self.assets = self._build()
+            return self.assets
+
+    def _build(self) -> Dict[str, Asset]:
+        files: Dict[str, bytes] = {}
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    files[name] = f.read()
+        assets: Dict[str, Asset] = {}
+        for name, body in files.items():
+            assets["/" + name] = Asset(body, self._content_type(name), REVALIDATE)
+        if "index.html" in files:
+            index = files["index.html"]
+            for name in FINGERPRINTED:
+                if name not in files:
+                    continue
+                stem, ext = os.path.splitext(name)
+                hashed = f"{stem}.{assets['/' + name].fingerprint}{ext}"
+                assets["/" + hashed] = Asset(files[name], self._content_type(name), IMMUTABLE)
+                index = index.replace(f'"{name}"'.encode(), f'"{hashed}"'.encode())
+            assets["/"] = assets["/index.html"] = Asset(index, self._content_type("index.html"), REVALIDATE)
+        return assets
+
+    @staticmethod
+    def _content_type(name: str) -> str:
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type.endswith("javascript"):
+            content_type += "; charset=utf-8"
+        return content_type
+
+class StaticAssets:
+    """ASGI middleware answering GET/HEAD for the frontend's files; everything else passes through."""
+    def __init__(self, app, store: AssetStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        asset = None
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD") and self.store.may_serve(scope["path"]):
+            asset = await self.store.get(scope["path"])
+        if asset is None:
+            await self.app(scope, receive, send)
+            return
+        headers = self._headers(scope)
+        encoding = asset.choose(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        body, etag = asset.variants[encoding]
+        response_headers: List[Tuple[bytes, bytes]] = [
+            (b"etag", etag), (b"cache-control", asset.cache_control), (b"vary", b"accept-encoding")]
+        if self._not_modified(headers.get(b"if-none-match"), etag):
+            await send({"type": "http.response.start", "status": 304, "headers": response_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        response_headers += [(b"content-type", asset.content_type), (b"content-length", str(len(body)).encode())]
+        if encoding != "identity":
+            response_headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+    @staticmethod
+    def _headers(scope) -> Dict[bytes, bytes]:
+        return {key.lower(): value for key, value in scope.get("headers", [])}
+
+    @staticmethod
+    def _not_modified(if_none_match: Optional[bytes], etag: bytes) -> bool:
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(b",")]
+        return b"*" in tags or any(tag.removeprefix(b"W/") == etag for tag in tags)
@@ -0,0 +1,66 @@
+"""
+A room restored from its snapshot and journal must rebuild the same game record as the live room,
+even when the journal thread serializes a snapshot long after it was taken.
+
+    python -m pytest tests
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import bitboard # noqa: E402
+from dong_dong_engine import DongDongEngine, GameState, TILES # noqa: E402
+from persistence import JournalWriter, RoomJournal, load_room # noqa: E402
+
+class StalledWriter(JournalWriter):
+    """Writes nothing until released, like a journal thread that has fallen behind the event loop."""
+    def __init__(self, data_dir: str):
+        self.release = threading.Event()
+        super().__init__(data_dir)
+
+    def _run(self):
+        self.release.wait()
+        super()._run()
+
+async def play(engine: DongDongEngine, rnd: random.Random, stop_after: int):
+    """Plays random legal moves, letting queued snapshots run after each one, until `stop_after` moves."""
+    for _ in range(stop_after):
+        if engine.game_state == GameState.GAME_OVER:
+            return
+        player = engine.get_current_turn_player()
+        if engine.game_state == GameState.AWAITING_BETS:
+            while not engine.place_bet(player.name, rnd.randint(0, engine.current_round))[0]:
+                pass
+        elif engine.game_state == GameState.AWAITING_PLAY:
+            tid = rnd.choice(list(bitboard.iter_ids(engine.valid_play_mask(player))))
+            engine.play_tile(player.name, TILES[tid].to_dict())
+        elif engine.game_state == GameState.ROUND_OVER:
+            engine.start_new_round()
+        await asyncio.sleep(0) # Snapshots are taken with call_soon, once the action has been applied
+
+def test_restored_record_matches_live_game(tmp_path):
+    async def trial(seed: int):
+        rnd = random.Random(seed)
+        writer = StalledWriter(str(tmp_path / str(seed)))
+        engine = DongDongEngine(seed=seed)
+        journal = RoomJournal(writer, "1234", engine)
+        journal.snapshot()
+        journal.attach()
+        for name in ("a", "b", "c", "d"):
+            engine.add_player(name)
+        engine.start_new_game()
+        await play(engine, rnd, rnd.randint(20, 400))
+
+        writer.release.set()
+        writer.close()
+        restored, _ = load_room(writer.data_dir, "1234")
+        scores = [p.score for p in engine.players]
+        assert restored.history.to_list() == engine.history.to_list()
+        assert restored.history.encode(scores, ended_at=0) == engine.history.encode(scores, ended_at=0)
+
+    for seed in range(30):
+        asyncio.run(trial(seed))
@@ -0,0 +1,111 @@
+"""
+Game records must read back exactly what was played, and a damaged record or bundle must be
+rejected with ValueError (or skipped on import) rather than crash the reader.
+
+    python -m pytest tests
+"""
+import io
+import os
+import random
+import struct
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import bitboard # noqa: E402
+import records # noqa: E402
+from dong_dong_engine import DongDongEngine, GameState, TILES # noqa: E402
+
+def played_game(seed: int) -> DongDongEngine:
+    """A four-player game played to the end with random legal moves."""
+    rnd = random.Random(seed)
+    engine = DongDongEngine(seed=seed)
+    for name in ("ana", "bo", "cy", "dé"):
+        engine.add_player(name)
+    engine.start_new_game()
+    while engine.game_state != GameState.GAME_OVER:
+        player = engine.get_current_turn_player()
+        if engine.game_state == GameState.AWAITING_BETS:
+            while not engine.place_bet(player.name, rnd.randint(0, engine.current_round))[0]:
+                pass
+        elif engine.game_state == GameState.AWAITING_PLAY:
+            tid = rnd.choice(list(bitboard.iter_ids(engine.valid_play_mask(player))))
+            engine.play_tile(player.name, TILES[tid].to_dict())
+        elif engine.game_state == GameState.ROUND_OVER:
+            engine.start_new_round()
+    return engine
+
+def encoded_game(seed: int) -> bytes:
+    engine = played_game(seed)
+    return engine.history.encode([p.score for p in engine.players], ended_at=1700000000)
+
+def test_record_round_trip():
+    for seed in range(5):
+        engine = played_game(seed)
+        scores = [p.score for p in engine.players]
+        record = records.GameRecord(engine.history.encode(scores, ended_at=1700000000))
+        assert record.names == engine.history.names
+        assert record.final_scores == scores
+        assert record.num_rounds == len(engine.history.rounds)
+        assert record.ended_at == 1700000000
+        for number, rnd in enumerate(engine.history.rounds, start=1):
+            decoded = record.round(number)
+            assert [decoded[k] for k in ("number", "master", "first_bettor", "scores", "hands", "bets")] == rnd[:6]
+            assert decoded["stacks"] == [(leader, tiles) for leader, tiles in rnd[6]]
+        events = list(record.replay())
+        plays = sum(len(tiles) for rnd in engine.history.rounds for _, tiles in rnd[6])
+        assert sum(event["type"] == "play" for event in events) == plays
+        assert events[-1] == {"type": "game_over", "scores": dict(zip(record.names, scores))}
+        # Starting at the last round's second stack replays the same tail
+        tail = [event for event in record.replay(record.num_rounds, 2) if event["type"] == "play"]
+        assert len(tail) == sum(len(tiles) for _, tiles in engine.history.rounds[-1][6][1:])
+        assert tail == [event for event in events if event["type"] == "play"][-len(tail):]
+
+def test_corrupt_records_raise_value_error():
+    data = encoded_game(0)
+    with pytest.raises(ValueError):
+        records.GameRecord(data[:30]) # Header plus a few bytes of names
+    for cut in range(len(data)):
+        with pytest.raises(ValueError):
+            records.GameRecord(data[:cut])
+
+    header_size = struct.calcsize(">4sBBBBQI")
+    long_name = bytearray(data)
+    long_name[header_size] = 255 # First name runs past the end
+    with pytest.raises(ValueError):
+        records.GameRecord(bytes(long_name))
+
+    record = records.GameRecord(data)
+    index_at = record.index[0] - 4 * record.num_rounds # The first round follows the index
+    for offset in (0, len(data), len(data) - 2, 2 ** 32 - 1):
+        bad = bytearray(data)
+        struct.pack_into(">I", bad, index_at, offset)
+        with pytest.raises(ValueError):
+            records.GameRecord(bytes(bad))
+
+    bad_master = bytearray(data)
+    bad_master[record.index[0] + 1] = 200
+    with pytest.raises(ValueError):
+        records.GameRecord(bytes(bad_master))
+
+def test_import_skips_damaged_records(tmp_path):
+    good = encoded_game(1)
+    bundle = io.BytesIO()
+    bundle.write(records.BUNDLE_MAGIC)
+    for game_id, data in (("good-1", good), ("short-1", good[:30]), ("bad-id!", good), ("good-2", good)):
+        encoded = game_id.encode()
+        bundle.write(bytes((len(encoded),)) + encoded + struct.pack(">I", len(data)) + data)
+    data = bundle.getvalue()
+
+    assert records.import_records(data, str(tmp_path / "a")) == (2, 2)
+    assert records.list_records(str(tmp_path / "a")) == ["good-1", "good-2"]
+
+    # Cut inside the last entry's header, then inside its record
+    truncated_at = data.rindex(b"good-2") - 1
+    assert records.import_records(data[:truncated_at + 3], str(tmp_path / "b")) == (1, 3)
+    assert records.import_records(data[:-10], str(tmp_path / "c")) == (1, 3)
+
+    with pytest.raises(ValueError):
+        records.import_records(b"nope", str(tmp_path / "d"))
@@ -0,0 +1,146 @@
+"""
+The timer wheel must fire every timer on its exact tick, however far ahead it was scheduled and
+however the clock jumps, and turn timers must keep their deadline until the turn changes.
+
+    python -m pytest tests
+"""
+import os
+import random
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import timers # noqa: E402
+from dong_dong_engine import DongDongEngine, GameState # noqa: E402
+from timers import WHEEL_BITS, TimerWheel, TurnTimers, turn_key # noqa: E402
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def make_wheel():
+    clock = FakeClock()
+    return clock, TimerWheel(tick=1.0, clock=clock)
+
+def test_timers_fire_on_their_tick():
+    clock, wheel = make_wheel()
+    fired = []
+    expected = {}
+    rnd = random.Random(0)
+    delays = [0.2, 1, 2, 63, 64, 65, 127, 4095, 4096, 4097, 64 ** 3 - 1, 64 ** 3, 64 ** 3 + 5]
+    delays += [rnd.randint(1, 64 ** 3 + 100) for _ in range(200)]
+    for i, delay in enumerate(delays):
+        clock.now += rnd.randint(0, 100)
+        wheel.advance()
+        expected[i] = wheel.current + max(1, -int(-delay // 1))
+        wheel.schedule(delay, lambda i=i: fired.append((i, wheel.current)))
+    assert len(wheel) + len(fired) == len(delays)
+    while len(wheel):
+        clock.now += rnd.choice((1, 7, 300, 5000))
+        wheel.advance()
+        assert all(tick <= clock.now for _, tick in fired)
+    assert dict(fired) == expected
+    assert [tick for _, tick in fired] == sorted(tick for _, tick in fired)
+
+def test_timer_beyond_top_level(monkeypatch):
+    monkeypatch.setattr(timers, "LEVELS", 2) # Same code path, but a horizon of 4096 ticks instead of 64**4
+    clock, wheel = make_wheel()
+    horizon = 1 << (WHEEL_BITS * timers.LEVELS)
+    fired = []
+    wheel.schedule(horizon + 70, lambda: fired.append(wheel.current))
+    wheel.schedule(3, lambda: fired.append(wheel.current))
+    wheel.advance(3)
+    assert fired == [3]
+    wheel.advance(horizon + 69)
+    assert fired == [3]
+    wheel.advance(horizon + 70)
+    assert fired == [3, horizon + 70]
+    wheel.schedule(5 * horizon + 1, lambda: fired.append(wheel.current)) # Parked and re-placed several times
+    wheel.advance(6 * horizon + 70)
+    assert fired == [3, horizon + 70]
+    wheel.advance(6 * horizon + 71)
+    assert fired == [3, horizon + 70, 6 * horizon + 71]
+    assert len(wheel) == 0
+
+def test_cancel_and_reschedule():
+    clock, wheel = make_wheel()
+    fired = []
+    a = wheel.schedule(10, lambda: fired.append("a"))
+    b = wheel.schedule(100, lambda: fired.append("b"))
+    c = wheel.schedule(5000, lambda: fired.append("c"))
+    assert len(wheel) == 3
+    a.cancel()
+    a.cancel() # Cancelling twice only counts once
+    assert not a.active and len(wheel) == 2
+    clock.now = 50
+    wheel.advance()
+    b = wheel.reschedule(b, 100) # Now due at 150
+    assert len(wheel) == 2
+    clock.now = 149
+    wheel.advance()
+    assert fired == []
+    clock.now = 150
+    wheel.advance()
+    assert fired == ["b"] and not b.active and len(wheel) == 1
+    wheel.advance(4000) # Cascaded into a lower level, then cancelled there
+    c.cancel()
+    wheel.advance(6000)
+    assert fired == ["b"] and len(wheel) == 0
+
+def test_len_and_failing_callbacks():
+    clock, wheel = make_wheel()
+    fired = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    wheel.schedule(5, fail)
+    wheel.schedule(5, lambda: fired.append(wheel.current))
+    wheel.schedule(6, lambda: fired.append(wheel.current))
+    assert len(wheel) == 3
+    wheel.advance(5)
+    assert fired == [5] and len(wheel) == 1
+    wheel.advance(10)
+    assert fired == [5, 6] and len(wheel) == 0
+    wheel.advance(1000) # Nothing pending: jumps straight there
+    assert wheel.current == 1000
+    wheel.schedule(1, lambda: fired.append(wheel.current))
+    wheel.advance(1001)
+    assert fired == [5, 6, 1001]
+
+def test_turn_timers_keep_deadline_until_turn_changes():
+    clock, wheel = make_wheel()
+    expired = []
+    turn_timers = TurnTimers(wheel, lambda room_id, key: expired.append((room_id, key)))
+    engine = DongDongEngine(seed=1)
+    for name in ("a", "b", "c", "d"):
+        engine.add_player(name)
+    engine.start_new_game()
+    assert engine.game_state == GameState.AWAITING_BETS
+
+    turn_timers.update("1234", engine)
+    first = turn_timers.timers["1234"][1]
+    clock.now = timers.BET_TIMEOUT - 10
+    wheel.advance()
+    turn_timers.update("1234", engine) # Same turn: the deadline stays
+    assert turn_timers.timers["1234"][1] is first and len(wheel) == 1
+
+    player = engine.get_current_turn_player()
+    assert engine.place_bet(player.name, 0)[0] or engine.place_bet(player.name, 1)[0]
+    turn_timers.update("1234", engine) # Next bettor: a fresh deadline
+    second = turn_timers.timers["1234"][1]
+    assert second is not first and not first.active and len(wheel) == 1
+    clock.now = timers.BET_TIMEOUT
+    wheel.advance()
+    assert expired == []
+    clock.now = 2 * timers.BET_TIMEOUT - 10
+    wheel.advance()
+    assert expired == [("1234", turn_key(engine))]
+    assert turn_timers.stats["timeouts"] == 1 and "1234" not in turn_timers.timers
+
+    turn_timers.update("1234", engine)
+    turn_timers.forget("1234")
+    assert len(wheel) == 0
@@ -0,0 +1,156 @@
+"""
+Every binary frame must decode to exactly the JSON frame it was made from. The frames are checked
+with a reference decoder written from the MessagePack spec (not wire.py's own), which expands the
+extension types back into the JSON values they stand for.
+
+    python -m pytest tests
+"""
+import json
+import os
+import random
+import struct
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+import bitboard # noqa: E402
+import wire # noqa: E402
+from dong_dong_engine import DongDongEngine, GameState, TILES # noqa: E402
+from projections import RoomProjection # noqa: E402
+from state_sync import encode_message # noqa: E402
+
+class Reader:
+    """MessagePack reader for the types the server emits, plus the ext types listed in wire.py."""
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def take(self, n: int) -> bytes:
+        chunk = self.data[self.pos:self.pos + n]
+        assert len(chunk) == n, "Frame ends early"
+        self.pos += n
+        return chunk
+
+    def number(self, fmt: str):
+        return struct.unpack(fmt, self.take(struct.calcsize(fmt)))[0]
+
+    def ext(self, kind: int, payload: bytes):
+        tiles = [{"number": bitboard.tile_number(t), "color": bitboard.COLOR_NAMES[bitboard.tile_color(t)]}
+                 for t in payload]
+        if kind == wire.EXT_TILE:
+            assert len(payload) == 1
+            return tiles[0]
+        if kind == wire.EXT_TILES:
+            return tiles
+        if kind == wire.EXT_GAME_STATE:
+            return [state.value for state in GameState][payload[0]]
+        if kind == wire.EXT_COLOR:
+            return bitboard.COLOR_NAMES[payload[0]]
+        raise AssertionError(f"Unknown ext type {kind}")
+
+    def read(self):
+        b = self.number(">B")
+        if b <= 0x7f:
+            return b
+        if b >= 0xe0:
+            return b - 0x100
+        if b <= 0x8f:
+            return self.map(b & 0x0f)
+        if b <= 0x9f:
+            return self.array(b & 0x0f)
+        if b <= 0xbf:
+            return self.take(b & 0x1f).decode("utf-8")
+        fixed = {0xc0: None, 0xc2: False, 0xc3: True}
+        if b in fixed:
+            return fixed[b]
+        numbers = {0xca: ">f", 0xcb: ">d", 0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+                   0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q"}
+        if b in numbers:
+            return self.number(numbers[b])
+        if b in (0xd9, 0xda, 0xdb):
+            return self.take(self.number({0xd9: ">B", 0xda: ">H", 0xdb: ">I"}[b])).decode("utf-8")
+        if b in (0xdc, 0xdd):
+            return self.array(self.number(">H" if b == 0xdc else ">I"))
+        if b in (0xde, 0xdf):
+            return self.map(self.number(">H" if b == 0xde else ">I"))
+        if b in (0xd4, 0xd5, 0xd6, 0xd7, 0xd8):
+            kind = self.number(">b")
+            return self.ext(kind, self.take(1 << (b - 0xd4)))
+        if b in (0xc7, 0xc8, 0xc9):
+            size = self.number({0xc7: ">B", 0xc8: ">H", 0xc9: ">I"}[b])
+            kind = self.number(">b")
+            return self.ext(kind, self.take(size))
+        raise AssertionError(f"Unexpected byte 0x{b:02x}")
+
+    def array(self, n: int) -> list:
+        return [self.read() for _ in range(n)]
+
+    def map(self, n: int) -> dict:
+        result = {}
+        for _ in range(n):
+            key = self.read()
+            result[key] = self.read()
+        return result
+
+def decode(data: bytes):
+    reader = Reader(data)
+    value = reader.read()
+    assert reader.pos == len(data), "Trailing bytes after the frame"
+    return value
+
+def game_frames(seed: int) -> list:
+    """Every public and private frame of a four-player game played with random legal moves."""
+    rnd = random.Random(seed)
+    engine = DongDongEngine(seed=seed)
+    projection = RoomProjection()
+    frames = []
+
+    def publish():
+        public, private = projection.update(engine)
+        frames.extend(([public] if public else []) + list(private.values()))
+
+    for name in ("ana", "bo", "cy", "dé"):
+        engine.add_player(name)
+        publish()
+    engine.start_new_game()
+    publish()
+    while engine.game_state != GameState.GAME_OVER:
+        player = engine.get_current_turn_player()
+        if engine.game_state == GameState.AWAITING_BETS:
+            while not engine.place_bet(player.name, rnd.randint(0, engine.current_round))[0]:
+                pass
+        elif engine.game_state == GameState.AWAITING_PLAY:
+            tid = rnd.choice(list(bitboard.iter_ids(engine.valid_play_mask(player))))
+            engine.play_tile(player.name, TILES[tid].to_dict())
+        elif engine.game_state == GameState.ROUND_OVER:
+            engine.start_new_round()
+        publish()
+    frames.extend(projection.catch_up("ana", None)) # Full snapshot frames, not just deltas
+    return frames
+
+def test_game_frames_round_trip():
+    for seed in range(3):
+        frames = game_frames(seed)
+        assert any(json.loads(frame)["type"] == "state_delta" for frame in frames)
+        for frame in frames:
+            binary = wire.to_binary(frame)
+            assert decode(binary) == json.loads(frame), frame
+            assert wire.unpack_message(binary) == json.loads(frame)
+
+def test_value_edge_cases_round_trip():
+    tile = TILES[7].to_dict()
+    messages = [
+        {"type": "edge", "ints": [0, 127, 128, 255, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 63,
+                                  -1, -32, -33, -2 ** 31, -2 ** 31 - 1, -2 ** 63]},
+        {"type": "edge", "floats": [0.5, -1.25, 1e300], "flags": [True, False, None]},
+        {"type": "edge", "strings": ["", "x" * 31, "x" * 32, "y" * 255, "y" * 256, "z" * 70000, "dé 東"]},
+        {"type": "edge", "list": list(range(16)), "big": list(range(70000)), "map": {str(i): i for i in range(16)}},
+        {"type": "edge", "tile": tile, "tiles": [tile] * 52, "mixed": [tile, 1], "empty": []},
+        {"type": "edge", "gameState": "NOT_A_STATE", "masterColor": "mauve", "secondaryColor": None},
+        {"type": "state_delta", "seq": 3, "ops": [["set", ["gameState"], GameState.AWAITING_PLAY.value],
+                                                 ["set", ["masterColor"], bitboard.COLOR_NAMES[0]],
+                                                 ["del", ["players", 2]], ["set", [], {"hand": [tile]}]]},
+    ]
+    for message in messages:
+        frame = encode_message(message)
+        assert decode(wire.to_binary(frame)) == json.loads(frame)
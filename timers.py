@@ -0,0 +1,184 @@
+"""
+One hierarchical timer wheel drives every room's timers: turn timeouts and the pause between rounds.
+
+Scheduling, cancelling and rescheduling are O(1), so a timer can be re-armed on every move. Time is
+read from a clock that defaults to time.monotonic; tests can pass a virtual clock and call advance()
+themselves instead of starting the background task.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from bots import fallback_bet, fallback_play
+from dong_dong_engine import DongDongEngine, GameState, Player
+
+TICK = 0.1          # Seconds per tick of the lowest wheel
+WHEEL_BITS = 6      # 64 slots per level...
+LEVELS = 4          # ...and 4 levels: timers up to 64**4 ticks (about 19 days) ahead
+
+BET_TIMEOUT = float(os.environ.get("DONGDONG_BET_TIMEOUT", "60"))    # Seconds to bet (0 = wait forever)
+PLAY_TIMEOUT = float(os.environ.get("DONGDONG_PLAY_TIMEOUT", "60"))  # Seconds to play a tile (0 = wait forever)
+ROUND_OVER_DELAY = 5.0                                               # Seconds to show the scores between rounds
+
+logger = logging.getLogger("app_logger")
+
+_WHEEL_SIZE = 1 << WHEEL_BITS
+_WHEEL_MASK = _WHEEL_SIZE - 1
+
+class Timer:
+    __slots__ = ("wheel", "expires", "callback", "slot")
+
+    def __init__(self, wheel: "TimerWheel", expires: int, callback: Callable[[], None]):
+        self.wheel = wheel
+        self.expires = expires   # Tick at which it fires
+        self.callback = callback
+        self.slot: Optional[Set["Timer"]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.slot is not None
+
+    def cancel(self):
+        if self.slot is not None:
+            self.slot.discard(self)
+            self.slot = None
+            self.wheel.count -= 1
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel. A timer lives in the lowest level whose higher digits (in base 64) of
+    its expiry tick match the current tick's; when the current tick reaches its slot there, it moves
+    down a level, until the lowest level fires it on its exact tick.
+    """
+    def __init__(self, tick: float = TICK, clock: Callable[[], float] = time.monotonic):
+        self.tick = tick
+        self.clock = clock
+        self.origin = clock()
+        self.current = 0 # Ticks processed so far
+        self.levels: List[List[Set[Timer]]] = [[set() for _ in range(_WHEEL_SIZE)] for _ in range(LEVELS)]
+        self.count = 0   # Pending timers
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def schedule(self, delay: float, callback: Callable[[], None]) -> Timer:
+        """Runs `callback` after `delay` seconds (rounded up to whole ticks)."""
+        now = self._tick_at(self.clock())
+        timer = Timer(self, max(now, self.current) + max(1, -int(-delay // self.tick)), callback)
+        self._place(timer)
+        self.count += 1
+        return timer
+
+    def reschedule(self, timer: Timer, delay: float) -> Timer:
+        timer.cancel()
+        return self.schedule(delay, timer.callback)
+
+    def _tick_at(self, now: float) -> int:
+        return int((now - self.origin) / self.tick)
+
+    def _place(self, timer: Timer):
+        expires = max(timer.expires, self.current) # Equal only while cascading: it fires on this very tick
+        level = 0
+        while level < LEVELS - 1 and expires >> (WHEEL_BITS * (level + 1)) != self.current >> (WHEEL_BITS * (level + 1)):
+            level += 1
+        index = (expires >> (WHEEL_BITS * level)) & _WHEEL_MASK
+        if (expires >> (WHEEL_BITS * level)) - (self.current >> (WHEEL_BITS * level)) >= _WHEEL_SIZE:
+            # Beyond the top wheel: park it in the slot the top wheel reaches last, and re-place it from there
+            index = ((self.current >> (WHEEL_BITS * level)) - 1) & _WHEEL_MASK
+        timer.slot = self.levels[level][index]
+        timer.slot.add(timer)
+
+    def advance(self, now: Optional[float] = None):
+        """Fires every timer due by `now` (default: the clock), in tick order."""
+        target = self._tick_at(self.clock() if now is None else now)
+        if not self.count:
+            self.current = max(self.current, target)
+            return
+        while self.current < target and self.count:
+            self.current += 1
+            # Cascade from the highest level whose slot boundary we just crossed, down to level 1
+            level = 0
+            while level < LEVELS - 1 and not self.current & ((1 << (WHEEL_BITS * (level + 1))) - 1):
+                level += 1
+            for cascade in range(level, 0, -1):
+                slot = self.levels[cascade][(self.current >> (WHEEL_BITS * cascade)) & _WHEEL_MASK]
+                timers = list(slot)
+                slot.clear()
+                for timer in timers:
+                    self._place(timer)
+            due = self.levels[0][self.current & _WHEEL_MASK]
+            fired = list(due)
+            due.clear()
+            for timer in fired:
+                timer.slot = None
+                self.count -= 1
+                try:
+                    timer.callback()
+                except Exception as e:
+                    logger.error(f"Timer callback failed: {e}", exc_info=True)
+        self.current = max(self.current, target)
+
+    def __len__(self) -> int:
+        return self.count
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.advance()
+
+# --- Turn Timers ---
+
+def default_auto_action(engine: DongDongEngine, player: Player) -> Tuple[str, dict]:
+    """What a player who ran out of time does: the minimum legal bet, or their lowest valid tile."""
+    if engine.game_state == GameState.AWAITING_BETS:
+        return "place_bet", {"amount": fallback_bet(engine)}
+    return "play_tile", {"tile": fallback_play(engine, player)}
+
+def turn_key(engine: DongDongEngine) -> tuple:
+    """Changes whenever someone moves, so a timer armed for one turn never fires on the next."""
+    return (engine.game_state, engine.current_round, engine.turn_player_index, engine.bets_made,
+            len(engine.current_stack_plays), engine.round_played_mask)
+
+class TurnTimers:
+    """
+    Keeps one timer per room, re-armed whenever the turn changes: a timeout while someone is betting or
+    playing, or the pause before the next round. Expired timers hand the room back to main.py through
+    `on_expired(room_id, key)`, which re-checks the key on the room's actor before acting.
+    """
+    def __init__(self, wheel: TimerWheel, on_expired: Callable[[str, tuple], None]):
+        self.wheel = wheel
+        self.on_expired = on_expired
+        self.timers: Dict[str, Tuple[tuple, Timer]] = {}
+        self.stats = {"timeouts": 0}
+
+    def update(self, room_id: str, engine: DongDongEngine):
+        """Called after every state change in the room."""
+        key = turn_key(engine)
+        current = self.timers.get(room_id)
+        if current and current[0] == key and current[1].active:
+            return # Same turn; keep the deadline
+        if current:
+            current[1].cancel()
+            del self.timers[room_id]
+        delay = {GameState.AWAITING_BETS: BET_TIMEOUT, GameState.AWAITING_PLAY: PLAY_TIMEOUT,
+                 GameState.ROUND_OVER: ROUND_OVER_DELAY}.get(engine.game_state, 0)
+        if delay > 0:
+            self.timers[room_id] = (key, self.wheel.schedule(delay, lambda: self._expired(room_id, key)))
+
+    def _expired(self, room_id: str, key: tuple):
+        self.timers.pop(room_id, None)
+        if key[0] != GameState.ROUND_OVER:
+            self.stats["timeouts"] += 1
+        self.on_expired(room_id, key)
+
+    def forget(self, room_id: str):
+        current = self.timers.pop(room_id, None)
+        if current:
+            current[1].cancel()
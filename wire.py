@@ -0,0 +1,207 @@
+"""
+Optional compact binary wire format, negotiated per socket with the WebSocket subprotocol.
+
+Clients that offer "dongdong.msgpack" receive every frame as MessagePack instead of JSON text, with a
+few extension types for what dominates our frames:
+
+    ext 1  one tile          1 byte: tile id (see bitboard.py)
+    ext 2  list of tiles     1 byte per tile
+    ext 3  gameState value   1 byte: index into GAME_STATES
+    ext 4  color value       1 byte: index into bitboard.COLOR_NAMES (masterColor, secondaryColor)
+
+Frames are still built and cached as JSON text; a binary copy is made once per frame and shared by
+every binary socket. Messages from the client stay JSON text. The decoder lives in frontend/app.js.
+"""
+import json
+import struct
+from functools import lru_cache
+from typing import Optional
+
+import bitboard
+from dong_dong_engine import GameState
+
+MSGPACK = "dongdong.msgpack"
+JSON = "dongdong.json"
+SUPPORTED = (MSGPACK, JSON)
+
+GAME_STATES = [state.value for state in GameState]
+_GAME_STATE_INDEX = {name: i for i, name in enumerate(GAME_STATES)}
+_COLOR_INDEX = {name: i for i, name in enumerate(bitboard.COLOR_NAMES)}
+_COLOR_KEYS = ("masterColor", "secondaryColor")
+
+EXT_TILE, EXT_TILES, EXT_GAME_STATE, EXT_COLOR = 1, 2, 3, 4
+
+def negotiate(websocket) -> Optional[str]:
+    """The first subprotocol the client offered that we speak, or None (plain JSON)."""
+    offered = getattr(websocket, "scope", {}).get("subprotocols") or []
+    return next((protocol for protocol in offered if protocol in SUPPORTED), None)
+
+# --- Encoding ---
+
+def _is_tile(value) -> bool:
+    return type(value) is dict and len(value) == 2 and "number" in value and "color" in value
+
+def _tile_id(tile: dict) -> int:
+    return bitboard.tile_id(tile["number"], _COLOR_INDEX[tile["color"]])
+
+def _pack_length(out: bytearray, n: int, fix: int, fix_max: int, codes: tuple):
+    if n < fix_max:
+        out.append(fix | n)
+    elif n < 0x10000:
+        out += struct.pack(">BH", codes[0], n)
+    else:
+        out += struct.pack(">BI", codes[1], n)
+
+def _pack(out: bytearray, value, key=None):
+    if value is None:
+        out.append(0xc0)
+    elif value is True:
+        out.append(0xc3)
+    elif value is False:
+        out.append(0xc2)
+    elif type(value) is int:
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -32 <= value < 0:
+            out.append(value & 0xff)
+        elif 0 <= value < 0x10000:
+            out += struct.pack(">BH", 0xcd, value)
+        elif -0x80000000 <= value < 0x100000000:
+            out += struct.pack(">Bi", 0xd2, value) if value < 0 else struct.pack(">BI", 0xce, value)
+        else:
+            out += struct.pack(">Bq", 0xd3, value) if value < 0 else struct.pack(">BQ", 0xcf, value)
+    elif type(value) is float:
+        out += struct.pack(">Bd", 0xcb, value)
+    elif type(value) is str:
+        if key == "gameState" and value in _GAME_STATE_INDEX:
+            out += bytes((0xd4, EXT_GAME_STATE, _GAME_STATE_INDEX[value]))
+            return
+        if key in _COLOR_KEYS and value in _COLOR_INDEX:
+            out += bytes((0xd4, EXT_COLOR, _COLOR_INDEX[value]))
+            return
+        data = value.encode("utf-8")
+        n = len(data)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out += struct.pack(">BB", 0xd9, n)
+        elif n < 0x10000:
+            out += struct.pack(">BH", 0xda, n)
+        else:
+            out += struct.pack(">BI", 0xdb, n)
+        out += data
+    elif type(value) is list:
+        if value and all(_is_tile(item) for item in value):
+            out += struct.pack(">BBB", 0xc7, len(value), EXT_TILES) # len(value) <= 52
+            out += bytes(_tile_id(item) for item in value)
+            return
+        _pack_length(out, len(value), 0x90, 16, (0xdc, 0xdd))
+        for item in value:
+            _pack(out, item, key) # List items inherit the key, e.g. ops under "ops"
+    elif type(value) is dict:
+        if _is_tile(value):
+            out += bytes((0xd4, EXT_TILE, _tile_id(value)))
+            return
+        _pack_length(out, len(value), 0x80, 16, (0xde, 0xdf))
+        for k, v in value.items():
+            _pack(out, k)
+            _pack(out, v, k)
+    else:
+        raise TypeError(f"Cannot encode {type(value).__name__}")
+
+def _pack_ops(out: bytearray, ops: list):
+    """Delta ops are [op, path, value]: the value is keyed by the last path element."""
+    _pack_length(out, len(ops), 0x90, 16, (0xdc, 0xdd))
+    for op in ops:
+        _pack_length(out, len(op), 0x90, 16, (0xdc, 0xdd))
+        _pack(out, op[0])
+        _pack(out, op[1])
+        if len(op) > 2:
+            path = op[1]
+            _pack(out, op[2], path[-1] if path else None)
+
+def pack_message(message: dict) -> bytes:
+    out = bytearray()
+    _pack_length(out, len(message), 0x80, 16, (0xde, 0xdf))
+    for k, v in message.items():
+        _pack(out, k)
+        if k == "ops" and message.get("type") == "state_delta":
+            _pack_ops(out, v)
+        else:
+            _pack(out, v, k)
+    return bytes(out)
+
+@lru_cache(maxsize=4096)
+def to_binary(frame: str) -> bytes:
+    """Binary copy of an encoded JSON frame. Cached, so each frame is converted once for all sockets."""
+    return pack_message(json.loads(frame))
+
+# --- Decoding (for tools and tests; browsers use the decoder in app.js) ---
+
+def _tile_dict(tid: int) -> dict:
+    return {"number": bitboard.tile_number(tid), "color": bitboard.COLOR_NAMES[bitboard.tile_color(tid)]}
+
+def unpack_message(data: bytes):
+    value, _ = _unpack(memoryview(data), 0)
+    return value
+
+def _unpack(data: memoryview, i: int):
+    b = data[i]
+    i += 1
+    if b < 0x80:
+        return b, i
+    if b >= 0xe0:
+        return b - 0x100, i
+    if 0x80 <= b <= 0x8f:
+        return _unpack_map(data, i, b & 0x0f)
+    if 0x90 <= b <= 0x9f:
+        return _unpack_array(data, i, b & 0x0f)
+    if 0xa0 <= b <= 0xbf:
+        n = b & 0x1f
+        return str(data[i:i + n], "utf-8"), i + n
+    if b == 0xc0:
+        return None, i
+    if b in (0xc2, 0xc3):
+        return b == 0xc3, i
+    formats = {0xcb: ">d", 0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q", 0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q"}
+    if b in formats:
+        size = struct.calcsize(formats[b])
+        return struct.unpack_from(formats[b], data, i)[0], i + size
+    if b in (0xd9, 0xda, 0xdb):
+        size = {0xd9: 1, 0xda: 2, 0xdb: 4}[b]
+        n = int.from_bytes(data[i:i + size], "big")
+        i += size
+        return str(data[i:i + n], "utf-8"), i + n
+    if b in (0xdc, 0xdd):
+        size = 2 if b == 0xdc else 4
+        return _unpack_array(data, i + size, int.from_bytes(data[i:i + size], "big"))
+    if b in (0xde, 0xdf):
+        size = 2 if b == 0xde else 4
+        return _unpack_map(data, i + size, int.from_bytes(data[i:i + size], "big"))
+    if b == 0xd4:
+        ext, byte = data[i], data[i + 1]
+        if ext == EXT_TILE:
+            return _tile_dict(byte), i + 2
+        if ext == EXT_GAME_STATE:
+            return GAME_STATES[byte], i + 2
+        if ext == EXT_COLOR:
+            return bitboard.COLOR_NAMES[byte], i + 2
+    if b == 0xc7:
+        n, ext = data[i], data[i + 1]
+        if ext == EXT_TILES:
+            return [_tile_dict(t) for t in data[i + 2:i + 2 + n]], i + 2 + n
+    raise ValueError(f"Unsupported MessagePack byte 0x{b:02x}")
+
+def _unpack_array(data: memoryview, i: int, n: int):
+    items = []
+    for _ in range(n):
+        item, i = _unpack(data, i)
+        items.append(item)
+    return items, i
+
+def _unpack_map(data: memoryview, i: int, n: int):
+    result = {}
+    for _ in range(n):
+        key, i = _unpack(data, i)
+        result[key], i = _unpack(data, i)
+    return result, i